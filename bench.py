@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""A/B benchmark of the Osmocom programs installed in two prefixes, e.g. by
+two make dirs generated with different *.opts files (see the 'bench' target
+of the Makefile generated by gen_makefile.py).
+
+"bench.py run -a PREFIX_A -b PREFIX_B WORKLOAD" runs the workload shell
+command alternately with the programs of both prefixes in PATH and
+LD_LIBRARY_PATH (and $BENCH_PREFIX, $BENCH_VARIANT=a|b, $BENCH_RUN set). It
+measures the wall clock time of each run. The workload may print additional
+metrics as lines "bench: NAME=VALUE" (e.g. "bench: pps=812345").
+
+After warmup runs, A and B run in turns, swapping the order in every round so
+slow drifts (CPU temperature, other load) affect both the same way. The report
+compares the medians of both, with a 95% bootstrap confidence interval of the
+difference. A difference is only reported as significant if this interval
+does not include zero. Each result is appended to the history file, show it
+with "bench.py history"."""
+
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+metric_re = re.compile(r"^bench: ([\w.-]+)=([-+0-9.eE]+)\s*$", re.MULTILINE)
+BOOTSTRAP_SAMPLES = 2000
+
+
+def error(msg):
+    print(f"ERROR: {msg}")
+    sys.exit(1)
+
+
+def run_workload(args, variant, prefix, n):
+    """Run the workload once, return {metric: value}."""
+    env = dict(os.environ)
+    env["PATH"] = f"{prefix}/bin:{prefix}/sbin:{env.get('PATH', '')}"
+    env["LD_LIBRARY_PATH"] = f"{prefix}/lib:{env.get('LD_LIBRARY_PATH', '')}"
+    env["BENCH_PREFIX"] = prefix
+    env["BENCH_VARIANT"] = variant
+    env["BENCH_RUN"] = str(n)
+
+    t_start = time.monotonic()
+    try:
+        proc = subprocess.run(
+            ["sh", "-c", args.workload],
+            check=False,
+            env=env,
+            stdout=subprocess.PIPE,
+            encoding="UTF-8",
+            errors="replace",
+            timeout=args.timeout,
+        )
+    except subprocess.TimeoutExpired as e:
+        # e.stdout is bytes, even with encoding= above
+        if e.stdout:
+            print(e.stdout.decode("UTF-8", errors="replace"))
+        error(f"workload timed out after {args.timeout}s ({variant}: {prefix})")
+    t_end = time.monotonic()
+    if proc.returncode:
+        print(proc.stdout)
+        error(f"workload failed with exit code {proc.returncode} ({variant}: {prefix})")
+
+    ret = {"time_s": t_end - t_start}
+    for name, value in metric_re.findall(proc.stdout):
+        ret[name] = float(value)
+    return ret
+
+
+def bootstrap_ci(a, b, seed=0):
+    """95% confidence interval of the relative difference of the medians of
+    b and a, in percent."""
+    rnd = random.Random(seed)
+    deltas = []
+    for _ in range(BOOTSTRAP_SAMPLES):
+        med_a = statistics.median(rnd.choices(a, k=len(a)))
+        med_b = statistics.median(rnd.choices(b, k=len(b)))
+        if med_a:
+            deltas.append((med_b - med_a) / abs(med_a) * 100)
+    if not deltas:
+        return None, None
+    deltas.sort()
+    return deltas[int(len(deltas) * 0.025)], deltas[int(len(deltas) * 0.975) - 1]
+
+
+def compare(a, b):
+    """Return the statistics of one metric, with the values of all runs."""
+    med_a = statistics.median(a)
+    med_b = statistics.median(b)
+    ci_low, ci_high = bootstrap_ci(a, b)
+    return {
+        "a": a,
+        "b": b,
+        "median_a": med_a,
+        "median_b": med_b,
+        "stdev_a": statistics.stdev(a) if len(a) > 1 else 0,
+        "stdev_b": statistics.stdev(b) if len(b) > 1 else 0,
+        "delta_pct": (med_b - med_a) / abs(med_a) * 100 if med_a else None,
+        "ci_pct": [ci_low, ci_high],
+        "significant": ci_low is not None and (ci_low > 0 or ci_high < 0),
+    }
+
+
+def fmt_pct(value):
+    return "n/a" if value is None else f"{value:+.2f}%"
+
+
+def print_metrics(metrics):
+    width = max(len(name) for name in metrics)
+    print(f"  {'metric':<{width}} {'median A':>12} {'median B':>12} {'B vs A':>9}  95% CI")
+    for name, m in metrics.items():
+        low, high = m["ci_pct"]
+        ci = f"[{fmt_pct(low)}, {fmt_pct(high)}]"
+        verdict = "significant" if m["significant"] else "no significant difference"
+        print(
+            f"  {name:<{width}} {m['median_a']:>12.6g} {m['median_b']:>12.6g}"
+            f" {fmt_pct(m['delta_pct']):>9}  {ci} {verdict}"
+        )
+
+
+def run(args):
+    if not args.prefix_a or not args.prefix_b:
+        error("pass two install prefixes")
+    prefixes = {"a": os.path.abspath(args.prefix_a), "b": os.path.abspath(args.prefix_b)}
+    for variant, prefix in prefixes.items():
+        if not os.path.isdir(prefix):
+            error(f"{variant}: install prefix does not exist: {prefix}")
+
+    for n in range(args.warmup):
+        for variant, prefix in prefixes.items():
+            print(f"warmup {n + 1}/{args.warmup} {variant}: {prefix}")
+            run_workload(args, variant, prefix, -1)
+
+    results = {"a": [], "b": []}
+    for n in range(args.runs):
+        order = ("a", "b") if n % 2 == 0 else ("b", "a")
+        for variant in order:
+            result = run_workload(args, variant, prefixes[variant], n)
+            results[variant].append(result)
+            print(f"run {n + 1}/{args.runs} {variant}: {result['time_s']:.3f}s")
+
+    metrics = {}
+    for name in results["a"][0]:
+        a = [r[name] for r in results["a"] if name in r]
+        b = [r[name] for r in results["b"] if name in r]
+        if len(a) != args.runs or len(b) != args.runs:
+            print(f"WARNING: metric {name} is missing in some runs, skipping it")
+            continue
+        metrics[name] = compare(a, b)
+
+    print()
+    print(f"A: {prefixes['a']}")
+    print(f"B: {prefixes['b']}")
+    print(f"{args.runs} runs each: {args.workload}")
+    print_metrics(metrics)
+
+    entry = {
+        "t": round(time.time()),
+        "label": args.label,
+        "workload": args.workload,
+        "a": prefixes["a"],
+        "b": prefixes["b"],
+        "runs": args.runs,
+        "metrics": metrics,
+    }
+    with open(args.history, "a") as f:
+        f.write(json.dumps(entry, sort_keys=True) + "\n")
+    print(f"Appended to {args.history}")
+
+
+def history(args):
+    try:
+        with open(args.history) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        error(f"no benchmark history: {args.history}")
+    for entry in entries[-args.last :]:
+        t = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["t"]))
+        label = f" {entry['label']}" if entry["label"] else ""
+        print(f"== {t}{label}: {entry['runs']} runs of {entry['workload']}")
+        print(f"   A: {entry['a']}")
+        print(f"   B: {entry['b']}")
+        print_metrics(entry["metrics"])
+        print()
+
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument(
+    "-H", "--history", default="bench-history.jsonl", help="results history file (default: %(default)s)"
+)
+sub = parser.add_subparsers(dest="action", required=True)
+p_run = sub.add_parser("run", help="run the workload against two install prefixes and compare")
+p_run.add_argument("-a", "--prefix-a", required=True, help="install prefix A (baseline)")
+p_run.add_argument("-b", "--prefix-b", required=True, help="install prefix B")
+p_run.add_argument("-n", "--runs", type=int, default=10, help="runs of each variant (default: %(default)s)")
+p_run.add_argument("-w", "--warmup", type=int, default=1, help="warmup runs, not measured (default: %(default)s)")
+p_run.add_argument("-t", "--timeout", type=float, help="seconds after which a run fails")
+p_run.add_argument("-l", "--label", default="", help="description stored in the history, e.g. 'io_uring'")
+p_run.add_argument("workload", help="shell command to run")
+p_history = sub.add_parser("history", help="show previous results")
+p_history.add_argument("-n", "--last", type=int, default=10, help="number of results (default: %(default)s)")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.action == "run":
+        if args.runs < 2:
+            error("--runs must be at least 2")
+        run(args)
+    else:
+        history(args)
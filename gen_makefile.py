@@ -35,9 +35,42 @@ You can skip the 'sudo ldconfig' by issuing the --no-ldconfig option.
 
 You can run 'ldconfig' without sudo by issuing the --ldconfig-without-sudo option.
 
+For faster linking and installing of debug builds, pass --split-dwarf: the
+debug info stays in .dwo files in the build dir, and the binaries get a
+.gdb_index (with lld or gold). --install-dwp also installs the debug info as
+.dwp files next to the binaries, --compress-debug compresses it.
+
+For optimized builds of CPU bound projects, pass them to --pgo (e.g.
+--pgo osmo-mgw,osmo-upf). They get built instrumented first and installed,
+then the training workload (--pgo-train, a command run in the make dir)
+should run them in a typical way and stop them with SIGTERM / SIGINT. Then
+they get built again with the collected profile and link time optimization.
+Profiles are kept in the make dir per project and git revision (pgo/), so
+configuring the same revision again does not need another training run.
+Projects that depend on the --pgo projects are built after the optimized
+build. This needs GCC >= 10.
+
 By default, it is assumed that your user has write permission to /usr/local. If you
 need sudo to install there, you may issue the --sudo-make-install option.
 
+With --install-manifest, autotools and meson projects get installed into a
+staging dir first, and only files that differ from the installed ones are
+copied from there. The other installed files keep their mtime. A manifest of
+the installed files is written to PREFIX/share/osmo-dev/manifests/, which
+osmo-uninstall.py and the '<project>-uninstall' targets use.
+
+With --install-changed-only (implies --install-manifest), dependent projects
+only run 'make' in their existing build tree when installed files changed
+(instead of configuring and building from scratch after each install), and only
+recompile what includes a changed header. They are configured again if a
+pkg-config file changed.
+
+To build other branches of some projects on top of an existing make dir, pass
+them with --branch (e.g. --branch osmo-msc=neels/foo) and the existing make dir
+with --base-make-dir. These projects get checked out in git worktrees of the
+existing clones, and only they and the projects depending on them are built in
+the new make dir. Use a different --install-prefix than the base build.
+
 EXAMPLE:
 
   ./gen_makefile.py default.opts iu.opts -I -m build
@@ -148,6 +181,31 @@ parser.add_argument('-c', '--no-make-check', dest='make_check',
 parser.add_argument('-g', '--build-debug', dest='build_debug', default=False, action='store_true',
     help='''set 'CFLAGS=-g' when calling src/configure''')
 
+parser.add_argument('--split-dwarf', action='store_true',
+                    help="like --build-debug, but keep the debug info in .dwo files in the build dir (-gsplit-dwarf)"
+                         " and link with a .gdb_index, for faster linking and installing")
+
+parser.add_argument('--compress-debug', action='store_true',
+                    help="like --build-debug, but compress the debug sections (-gz)")
+
+parser.add_argument('--install-dwp', action='store_true',
+                    help="with --split-dwarf, also install the debug info as .dwp file next to each program and"
+                         " library, so it can be debugged after removing the build dir")
+
+parser.add_argument('--install-manifest', action='store_true',
+                    help="install via a staging dir, only replace installed files that changed and write a manifest"
+                         " of the installed files for osmo-uninstall.py")
+
+parser.add_argument('--install-changed-only', action='store_true',
+                    help="like --install-manifest, but also only build dependent projects again if installed files"
+                         " changed")
+
+parser.add_argument('--pgo', metavar='PROJECTS',
+                    help="comma separated list of projects to build with profile-guided optimization")
+
+parser.add_argument('--pgo-train', metavar='CMD', default='./pgo-train.sh',
+                    help="training workload for --pgo, run in the make dir (default: ./pgo-train.sh)")
+
 parser.add_argument('-i', '--install-prefix', default='/usr/local',
                     help='''install there instead of /usr/local''')
 
@@ -157,7 +215,23 @@ parser.add_argument('-A', '--autoreconf-in-src-copy', action='store_true',
 parser.add_argument('--targets',
                     help="comma separated list of high-level targets to build instead of all targets")
 
+parser.add_argument('--branch', metavar='PROJ=BRANCH', action='append',
+                    help="build PROJ from BRANCH in a git worktree of its clone, and the projects depending on it;"
+                         " use --base-make-dir for all other projects (can be given multiple times)")
+
+parser.add_argument('--base-make-dir', metavar='DIR',
+                    help="make dir of the base build that --branch builds on top of")
+
+parser.add_argument('--base-prefix', default='/usr/local',
+                    help="install prefix of the base build for --branch (default: /usr/local)")
+
 args = parser.parse_args()
+if args.install_dwp:
+  args.split_dwarf = True
+if args.install_dwp or args.install_changed_only:
+  args.install_manifest = True
+if args.split_dwarf or args.compress_debug:
+  args.build_debug = True
 
 class listdict(dict):
   'a dict of lists { "a": [1, 2, 3],  "b": [1, 2] }'
@@ -262,7 +336,30 @@ def filter_projects_deps_targets():
 
   return ret
 
+def gen_makefile_clone_worktree(proj, src, src_proj):
+  clone = os.path.join(src, proj)
+  branch = shlex.quote(overlay_branches[proj])
+  return f'''
+.make.{proj}.clone:
+  @echo "\\n\\n\\n===== $@\\n"
+  @if ! [ -d {clone}/.git ]; then \\
+    echo "ERROR: not a git clone: {clone} (run 'make .make.{proj}.clone' in the base make dir)"; \\
+    exit 1; \\
+  fi
+  @if ! [ -e {src_proj}/.git ]; then \\
+    set -x; \\
+    mkdir -p {os.path.dirname(src_proj)}; \\
+    git -C {clone} worktree add {src_proj} {branch}; \\
+    git -C {src_proj} submodule update --init --recursive; \\
+  fi
+  sync
+  touch $@
+  '''
+
 def gen_makefile_clone(proj, src, src_proj, update_src_copy_cmd):
+  if proj in overlay_branches:
+    return gen_makefile_clone_worktree(proj, src, src_proj)
+
   if proj == "osmocom-bb_layer23":
     return f'''
 .make.{proj}.clone: .make.osmocom-bb.clone
@@ -393,13 +490,13 @@ def gen_makefile_configure(proj, deps_installed, build_proj,
   else:
     assert False, f"unknown buildsystem: {buildsystem}"
 
-def gen_makefile_build(proj, build_proj, src_proj, update_src_copy_cmd):
+def gen_makefile_build(proj, deps_installed_files, build_proj, src_proj, update_src_copy_cmd):
   buildsystem = projects_buildsystems.get(proj, "autotools")
   check = "check" if args.make_check else ""
 
   if buildsystem == "autotools":
     return f'''
-.make.{proj}.build: .make.{proj}.configure $({proj}_files)
+.make.{proj}.build: .make.{proj}.configure {deps_installed_files} $({proj}_files)
   @echo "\\n\\n\\n===== $@\\n"
   {update_src_copy_cmd}
   $(MAKE) -C {build_proj} -j {args.jobs} {check}
@@ -412,7 +509,7 @@ def gen_makefile_build(proj, build_proj, src_proj, update_src_copy_cmd):
     # if check:
     #   test_line = f"meson test -C {build_proj} -v"
     return f'''
-.make.{proj}.build: .make.{proj}.configure $({proj}_files)
+.make.{proj}.build: .make.{proj}.configure {deps_installed_files} $({proj}_files)
   @echo "\\n\\n\\n===== $@\\n"
   meson compile -C {build_proj} -j {args.jobs}
   {test_line}
@@ -446,28 +543,82 @@ def gen_makefile_build(proj, build_proj, src_proj, update_src_copy_cmd):
   else:
     assert False, f"unknown buildsystem: {buildsystem}"
 
-def gen_makefile_install(proj, build_proj, src_proj):
+def is_install_staged(proj):
+  if not args.install_manifest:
+    return False
+
+  # Erlang and python projects have their own ways of installing
+  buildsystem = projects_buildsystems.get(proj, "autotools")
+  return buildsystem in ["autotools", "meson"]
+
+def gen_manifest_path(proj):
+  return shlex.quote(f"{args.install_prefix}/share/osmo-dev/manifests/{proj}.sha256")
+
+def gen_install_cmd(proj, build_proj, make_dir):
+  sudo_make_install = "sudo " if args.sudo_make_install else ""
+  buildsystem = projects_buildsystems.get(proj, "autotools")
+  if buildsystem == "meson":
+    install_cmd = f"ninja -C {build_proj} install"
+  else:
+    install_cmd = f"$(MAKE) -C {build_proj} install"
+
+  if not is_install_staged(proj):
+    return f"{sudo_make_install}{install_cmd}"
+
+  src_dir_script = os.path.relpath(os.path.join(topdir, "src"), make_dir)
+  script = os.path.join(src_dir_script, "_install_changed.sh")
+  sudo = "SUDO=sudo " if args.sudo_make_install else ""
+  stage = f"{build_proj}/.install_stage"
+  install_dwp = ""
+  if args.install_dwp:
+    script_dwp = os.path.relpath(os.path.join(topdir, "src", "_split_dwarf.sh"), make_dir)
+    install_dwp = f"sh -e {script_dwp} dwp {stage}\n  "
+  return f'''-chmod -R u+w {stage}
+  rm -rf {stage}
+  DESTDIR="$$PWD/{stage}" {install_cmd}
+  {install_dwp}{sudo}sh -e {script} {stage} .make.{proj} {gen_manifest_path(proj)}'''
+
+def gen_makefile_install_stamps(proj):
+  if not is_install_staged(proj):
+    return ""
+
+  # Touched by _install_changed.sh if installed files changed. Make only
+  # rebuilds dependent projects if the mtime of these changed.
+  return f'''
+.make.{proj}.install_files .make.{proj}.install_pc: .make.{proj}.install
+  @test -e $@ || touch $@
+    '''
+
+def gen_deps_installed(deps):
+  '''Return the prerequisites of the configure and build targets of a
+  project, that make it wait for its dependencies to be installed.'''
+  if not args.install_changed_only:
+    return ' '.join(['.make.%s.install' % d for d in deps]), ''
+
+  configure = []
+  build = []
+  for d in deps:
+    if is_install_staged(d) and not is_from_base(d):
+      configure += [f".make.{d}.install_pc"]
+      build += [f".make.{d}.install_files"]
+    else:
+      configure += [f".make.{d}.install"]
+  return ' '.join(configure), ' '.join(build)
+
+def gen_makefile_install(proj, build_proj, src_proj, make_dir):
   no_ldconfig = '#' if args.no_ldconfig else ''
   sudo_ldconfig = '' if args.ldconfig_without_sudo else 'sudo '
   sudo_make_install = "sudo " if args.sudo_make_install else ""
   buildsystem = projects_buildsystems.get(proj, "autotools")
-  if buildsystem == "autotools":
+  if buildsystem in ["autotools", "meson"]:
     return f'''
 .make.{proj}.install: .make.{proj}.build
   @echo "\\n\\n\\n===== $@\\n"
-  {sudo_make_install}$(MAKE) -C {build_proj} install
-  {no_ldconfig}{sudo_ldconfig}ldconfig
-  sync
-  touch $@
-    '''
-  elif buildsystem == "meson":
-    return f'''
-.make.{proj}.install: .make.{proj}.build
-  @echo "\\n\\n\\n===== $@\\n"
-  {sudo_make_install}ninja -C {build_proj} install
+  {gen_install_cmd(proj, build_proj, make_dir)}
   {no_ldconfig}{sudo_ldconfig}ldconfig
   sync
   touch $@
+{gen_makefile_install_stamps(proj)}
     '''
   elif buildsystem == "erlang":
     # Use the "install" target if it exists, otherwise fall back to installing
@@ -502,14 +653,147 @@ def gen_makefile_install(proj, build_proj, src_proj):
   else:
     assert False, f"unknown buildsystem: {buildsystem}"
 
-def gen_makefile_reinstall(proj, deps_reinstall, build_proj):
-  sudo_make_install = "sudo " if args.sudo_make_install else ""
+def gen_makefile_reinstall(proj, deps_reinstall, build_proj, make_dir):
   return f'''
 .PHONY: {proj}-reinstall
 {proj}-reinstall: {deps_reinstall}
-  {sudo_make_install}$(MAKE) -C {build_proj} install
+  {gen_install_cmd(proj, build_proj, make_dir)}
+  '''
+
+def gen_makefile_uninstall(proj, make_dir):
+  if not is_install_staged(proj):
+    return ""
+
+  sudo_make_install = "sudo " if args.sudo_make_install else ""
+  uninstall = os.path.relpath(os.path.join(topdir, "osmo-uninstall.py"), make_dir)
+  return f'''
+.PHONY: {proj}-uninstall
+{proj}-uninstall:
+  @echo "\\n\\n\\n===== $@\\n"
+  {sudo_make_install}{uninstall} --prefix {shlex.quote(args.install_prefix)} {proj}
+  rm -f .make.{proj}.install
   '''
 
+def gen_debug_flags():
+  ret = '-g' if args.build_debug else ''
+  if args.split_dwarf:
+    ret += ' -gsplit-dwarf'
+  if args.compress_debug:
+    ret += ' -gz'
+  return ret
+
+def gen_debug_ldflags(make_dir):
+  '''Return (shell commands to run before configure, LDFLAGS variable).'''
+  if not args.split_dwarf and not args.compress_debug:
+    return '', ''
+
+  gz = '-gz ' if args.compress_debug else ''
+  if not args.split_dwarf:
+    return '', f'LDFLAGS="{gz.strip()}" '
+
+  script = os.path.relpath(os.path.join(topdir, "src", "_split_dwarf.sh"), make_dir)
+  return (f'debug_ldflags="$$(sh -e $(CURDIR)/{script} ldflags)" && ',
+          f'LDFLAGS="{gz}$$debug_ldflags" ')
+
+def gen_cflags(proj, src_proj, make_dir):
+  debug = gen_debug_flags()
+  ldflags_cmd, ldflags = gen_debug_ldflags(make_dir)
+  if proj not in pgo_projects:
+    if not ldflags:
+      return f'CFLAGS={debug} ' if debug else ''
+    return f'{ldflags_cmd}CFLAGS="{debug}" CXXFLAGS="{debug}" {ldflags}'
+
+  # Runs in the build dir
+  script = os.path.relpath(os.path.join(topdir, "src", "_pgo.sh"), make_dir)
+  debug = f'{debug} ' if debug else ''
+  return (f'{ldflags_cmd}pgo_flags="$$(sh -e $(CURDIR)/{script} flags $(CURDIR)/pgo {proj} {src_proj})" && '
+          f'CFLAGS="{debug}$$pgo_flags" CXXFLAGS="{debug}$$pgo_flags" {ldflags}'
+          'AR=gcc-ar NM=gcc-nm RANLIB=gcc-ranlib ')
+
+def gen_pkg_config_path():
+  if not overlay_branches:
+    return ''
+
+  # Prefer the libraries built in this make dir over the ones of the base build
+  return (f'PKG_CONFIG_PATH={shlex.quote(args.install_prefix)}/lib/pkgconfig'
+          f':{shlex.quote(args.base_prefix)}/lib/pkgconfig ')
+
+def is_from_base(proj):
+  return bool(overlay_branches) and proj not in overlay_projects
+
+def gen_make_base(proj):
+  base = os.path.relpath(base_make_dir, make_dir)
+  # Only touch the marker if the base build installed the project again, so
+  # dependent projects don't get rebuilt on each make run
+  return f'''
+### {proj} (from the base make dir) ###
+
+{base}/.make.{proj}.install: base-install ;
+
+.make.{proj}.install: {base}/.make.{proj}.install
+  @[ -e $@ ] && ! [ $< -nt $@ ] || touch $@
+
+.PHONY: {proj}
+{proj}: .make.{proj}.install
+'''
+
+def gen_makefile_overlay():
+  if not overlay_branches:
+    return ''
+
+  base = os.path.relpath(base_make_dir, make_dir)
+  base_installed = ' '.join([f".make.{p}.install" for p in projects_deps if is_from_base(p)])
+  branches = ', '.join([f"{p}={b}" for p, b in overlay_branches.items()])
+  ret = f'''
+# --branch {branches}: these projects are built from git worktrees in
+# {worktrees_dir}, together with the projects depending
+# on them. All other projects are reused from the base make dir {base}.
+.PHONY: worktrees-remove
+worktrees-remove:
+'''
+  for proj in overlay_branches:
+    src_proj = gen_src_proj(proj)
+    ret += f"  -git -C {os.path.join(src_dir, proj)} worktree remove {src_proj}\n"
+    ret += f"  rm -f .make.{proj}.clone\n"
+
+  if base_installed:
+    ret += f'''
+.PHONY: base-install
+base-install:
+  $(MAKE) -C {base} {base_installed}
+'''
+  return ret
+
+def gen_makefile_pgo_deps(proj, deps):
+  # Wait for the optimized build of --pgo projects. Not for projects that
+  # --pgo projects depend on, they get built before the training.
+  if proj in pgo_projects or proj in pgo_projects_deps:
+    return ""
+  if not [d for d in deps if d in pgo_projects]:
+    return ""
+  return f".make.{proj}.configure: | .make.pgo_train\n"
+
+def gen_makefile_pgo():
+  if not pgo_projects:
+    return ""
+
+  script = os.path.relpath(os.path.join(topdir, "src", "_pgo.sh"), make_dir)
+  installed = ' '.join([f".make.{p}.install" for p in pgo_projects])
+  build_dirs = ' '.join([f"{p}={os.path.relpath(os.path.join(build_dir, p), make_dir)}" for p in pgo_projects])
+  return f'''
+# --pgo: run the training workload if any of the projects was built
+# instrumented, then build them again optimized
+.make.pgo_train: {installed}
+  @echo "\\n\\n\\n===== $@\\n"
+  sh -e {script} train {shlex.quote(args.pgo_train)} {build_dirs}
+  $(MAKE) {installed}
+  touch $@
+
+.PHONY: pgo-clean
+pgo-clean:
+  -rm -rf pgo .make.pgo_train
+'''
+
 def gen_makefile_clean(proj, build_proj):
   return f'''
 .PHONY: {proj}-clean
@@ -551,8 +835,14 @@ def gen_src_proj_copy(src_proj, make_dir, proj):
     return src_proj
   return os.path.join(make_dir, "src_copy", proj)
 
+def gen_src_proj(proj):
+  # osmocom-bb_layer23 -> osmocom-bb
+  if proj in overlay_branches or proj.split("_")[0] in overlay_branches:
+    return os.path.join(worktrees_dir, proj)
+  return os.path.join(src_dir, proj)
+
 def gen_make(proj, deps, configure_opts, make_dir, src_dir, build_dir):
-  src_proj = os.path.join(src_dir, proj)
+  src_proj = gen_src_proj(proj)
   src_proj_copy = gen_src_proj_copy(src_proj, make_dir, proj)
 
   build_proj = os.path.join(build_dir, proj)
@@ -564,9 +854,9 @@ def gen_make(proj, deps, configure_opts, make_dir, src_dir, build_dir):
   else:
     configure_opts_str = ''
 
-  deps_installed = ' '.join(['.make.%s.install' % d for d in deps])
+  deps_installed, deps_installed_files = gen_deps_installed(deps)
   deps_reinstall = ' '.join(['%s-reinstall' %d for d in deps])
-  cflags = 'CFLAGS=-g ' if args.build_debug else ''
+  cflags = gen_cflags(proj, src_proj, make_dir) + gen_pkg_config_path()
   update_src_copy_cmd = gen_update_src_copy_cmd(proj, src_dir, make_dir)
 
   return f'''
@@ -608,28 +898,95 @@ def gen_make(proj, deps, configure_opts, make_dir, src_dir, build_dir):
                         update_src_copy_cmd)}
 
 {gen_makefile_build(proj,
+                    deps_installed_files,
                     build_proj,
                     src_proj_copy,
                     update_src_copy_cmd)}
 
 {gen_makefile_install(proj,
                       build_proj,
-                      src_proj)}
+                      src_proj,
+                      make_dir)}
 
 {gen_makefile_reinstall(proj,
                         deps_reinstall,
-                        build_proj)}
+                        build_proj,
+                        make_dir)}
+
+{gen_makefile_uninstall(proj, make_dir)}
 
 {gen_makefile_clean(proj, build_proj)}
 
+{gen_makefile_pgo_deps(proj, deps)}
 .PHONY: {proj}
-{proj}: .make.{proj}.install
+{proj}: .make.{proj}.install{" .make.pgo_train" if proj in pgo_projects else ""}
 '''
 
 projects_deps = read_projects_deps(all_deps_file)
 projects_deps = filter_projects_deps_targets()
 projects_urls = read_projects_dict(all_urls_file)
 projects_buildsystems = read_projects_dict(all_buildsystems_file)
+
+pgo_projects = args.pgo.split(",") if args.pgo else []
+for proj in pgo_projects:
+  if proj not in projects_deps:
+    print(f"ERROR: --pgo: can't find project {proj} in projects_deps!")
+    sys.exit(1)
+  if projects_buildsystems.get(proj, "autotools") != "autotools":
+    print(f"ERROR: --pgo: only autotools projects are supported: {proj}")
+    sys.exit(1)
+
+# All projects that the --pgo projects depend on
+pgo_projects_deps = set()
+queue = [d for p in pgo_projects for d in projects_deps[p]]
+while queue:
+  dep = queue.pop()
+  if dep not in pgo_projects_deps:
+    pgo_projects_deps.add(dep)
+    queue += projects_deps.get(dep, [])
+
+# --branch: projects to build from worktrees, and all projects depending on them
+overlay_branches = {}
+for arg in args.branch or []:
+  proj, _, branch = arg.partition("=")
+  if not branch:
+    print(f"ERROR: --branch: expected PROJ=BRANCH: {arg}")
+    sys.exit(1)
+  if proj not in projects_deps:
+    print(f"ERROR: --branch: can't find project {proj} in projects_deps!")
+    sys.exit(1)
+  proj_main = proj.split("_")[0]
+  if proj_main != proj and proj_main in projects_deps:
+    print(f"ERROR: --branch: {proj} is a subdir of {proj_main}, use --branch {proj_main}={branch}")
+    sys.exit(1)
+  overlay_branches[proj] = branch
+
+overlay_projects = set(overlay_branches)
+changed = True
+while changed:
+  changed = False
+  for proj, deps in projects_deps.items():
+    if proj in overlay_projects:
+      continue
+    if proj.split("_")[0] in overlay_branches or [d for d in deps if d in overlay_projects]:
+      overlay_projects.add(proj)
+      changed = True
+
+if overlay_branches:
+  if not args.base_make_dir or not os.path.isdir(args.base_make_dir):
+    print("ERROR: --branch: pass the make dir of the base build with --base-make-dir")
+    sys.exit(1)
+  if os.path.abspath(args.install_prefix) == os.path.abspath(args.base_prefix):
+    print("ERROR: --branch: pass a different --install-prefix than the one of the base build (--base-prefix)")
+    sys.exit(1)
+  if args.autoreconf_in_src_copy:
+    print("ERROR: --branch can't be used with --autoreconf-in-src-copy")
+    sys.exit(1)
+  for proj in pgo_projects:
+    if proj not in overlay_projects:
+      print(f"ERROR: --pgo: {proj} is reused from the base make dir, not built with --branch")
+      sys.exit(1)
+
 configure_opts = listdict()
 configure_opts_files = sorted(args.configure_opts_files or [])
 for configure_opts_file in configure_opts_files:
@@ -646,6 +1003,8 @@ if not make_dir:
 
 make_dir = os.path.abspath(make_dir)
 src_dir = os.path.abspath(args.src_dir)
+base_make_dir = os.path.abspath(args.base_make_dir) if args.base_make_dir else None
+worktrees_dir = os.path.join(src_dir, "worktrees", os.path.basename(make_dir))
 
 if not os.path.isdir(make_dir):
   os.makedirs(make_dir)
@@ -683,6 +1042,28 @@ all_debug:
   {gen_venv_activate()} && pip install -r {venv_req_file}
   touch $@
 
+# A/B benchmark of the programs installed by this Makefile (A) against the
+# ones in another install prefix (B), see {os.path.relpath(os.path.join(topdir, "bench.py"), make_dir)} --help. E.g.:
+# make bench BENCH_B=/opt/osmocom-uring BENCH_WORKLOAD=./bench-workload.sh
+BENCH_B =
+BENCH_WORKLOAD = ./bench-workload.sh
+BENCH_RUNS = 10
+BENCH_LABEL =
+.PHONY: bench
+bench:
+  {os.path.relpath(os.path.join(topdir, "bench.py"), make_dir)} \\
+    --history bench-history.jsonl \\
+    run \\
+    -a {shlex.quote(args.install_prefix)} \\
+    -b "$(BENCH_B)" \\
+    -n "$(BENCH_RUNS)" \\
+    -l "$(BENCH_LABEL)" \\
+    "$(BENCH_WORKLOAD)"
+
+.PHONY: bench-history
+bench-history:
+  {os.path.relpath(os.path.join(topdir, "bench.py"), make_dir)} --history bench-history.jsonl history
+
 # regenerate this Makefile, in case the deps or opts changed
 .PHONY: regen
 regen:
@@ -694,6 +1075,7 @@ regen:
     --build-dir {os.path.relpath(build_dir, make_dir)} \\
     --jobs {args.jobs} \\
     --url "{args.url}" \\
+    --install-prefix {shlex.quote(args.install_prefix)} \\
 '''
 
 if args.push_url:
@@ -708,10 +1090,28 @@ if not args.make_check:
   content += "    --no-make-check \\\n"
 if args.build_debug:
   content += "    --build-debug \\\n"
+if args.split_dwarf:
+  content += "    --split-dwarf \\\n"
+if args.compress_debug:
+  content += "    --compress-debug \\\n"
+if args.install_dwp:
+  content += "    --install-dwp \\\n"
 if args.autoreconf_in_src_copy:
   content += "    --autoreconf-in-src-copy \\\n"
+if args.install_manifest:
+  content += "    --install-manifest \\\n"
+if args.install_changed_only:
+  content += "    --install-changed-only \\\n"
+if args.pgo:
+  content += f"    --pgo={shlex.quote(args.pgo)} \\\n"
+  content += f"    --pgo-train={shlex.quote(args.pgo_train)} \\\n"
 if args.targets:
   content += f"    --targets={shlex.quote(args.targets)} \\\n"
+for proj, branch in overlay_branches.items():
+  content += f"    --branch={shlex.quote(proj + '=' + branch)} \\\n"
+if overlay_branches:
+  content += f"    --base-make-dir {os.path.relpath(base_make_dir, make_dir)} \\\n"
+  content += f"    --base-prefix {shlex.quote(args.base_prefix)} \\\n"
 content += "    $(NULL)\n"
 
 if args.autoreconf_in_src_copy:
@@ -723,18 +1123,34 @@ TIME_START := $(shell date +%s%N)
 
 """
 
+# projects built in this make dir (not reused from --base-make-dir)
+built_projects = [p for p in projects_deps if not is_from_base(p)]
+
 # convenience target: clone all repositories first
-content += 'clone: \\\n\t' + ' \\\n\t'.join([ '.make.%s.clone' % p for p, d in projects_deps.items() ]) + '\n\n'
+content += 'clone: \\\n\t' + ' \\\n\t'.join([ '.make.%s.clone' % p for p in built_projects ]) + '\n\n'
 
 # convenience target: clean all
-content += 'clean: \\\n\t' + ' \\\n\t'.join([ '%s-clean' % p for p, d in projects_deps.items() ]) + '\n\n'
+content += 'clean: \\\n\t' + ' \\\n\t'.join([ '%s-clean' % p for p in built_projects ]) + '\n\n'
+
+# convenience target: uninstall all, with the manifests of the install targets
+if args.install_manifest:
+  content += 'uninstall: \\\n\t' + ' \\\n\t'.join([ '%s-uninstall' % p for p in built_projects if is_install_staged(p) ]) + '\n\n'
 
 # now the actual useful build rules
 content += 'all: clone all-install\n\n'
 
 content += 'all-install: \\\n\t' + ' \\\n\t'.join([ '.make.%s.install' % p for p, d in projects_deps.items() ]) + '\n\n'
 
+if pgo_projects:
+  content += 'all-install: .make.pgo_train\n'
+  content += gen_makefile_pgo()
+
+content += gen_makefile_overlay()
+
 for proj, deps in projects_deps.items():
+  if is_from_base(proj):
+    content += gen_make_base(proj)
+    continue
   all_config_opts = []
   all_config_opts.extend(configure_opts.get('ALL') or [])
   all_config_opts.extend(configure_opts.get(proj) or [])
@@ -4,14 +4,18 @@ Write the result to the current directory.'''
 
 import os, sys, re, shutil
 import argparse
-
-def file_newer(path_a, than_path_b):
-  return os.path.getmtime(path_a) > os.path.getmtime(than_path_b)
+import atexit
+import collections
+import hashlib
+import ipaddress
+import json
+import multiprocessing
 
 DEFAULT_ORIG_CONFIG = os.path.normpath(os.path.realpath(__file__) + "/../config_2g3g")
 LAST_LOCAL_CONFIG_FILE = '.last_config'
 LAST_ORIG_CONFIG_FILE = '.last_config_orig'
 LAST_TMPL_DIR = '.last_templates'
+LAST_DEPS_FILE = '.last_deps'
 
 parser = argparse.ArgumentParser(description=__doc__,
                                  formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -19,7 +23,11 @@ parser.add_argument('sources', metavar='SRC', nargs='*',
                     help='Pass both a template directory and a config file.')
 parser.add_argument('-s', '--check-stale', dest='check_stale', action='store_true',
                     help='only verify age of generated files vs. config and templates.'
-                    ' Exit nonzero when any source file is newer. Do not write anything.')
+                    ' Exit nonzero when any generated file would change. Do not write anything.')
+parser.add_argument('-f', '--force', action='store_true',
+                    help='render all templates, even if their recorded inputs did not change')
+parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                    help='render this many templates in parallel (default: number of CPUs)')
 parser.add_argument('-o', '--original-config',
                     help='get missing variables from this file, default is config_2g3g'
                     ' or the file used previously to fill an existing template dir')
@@ -85,7 +93,7 @@ with open(LAST_TMPL_DIR, 'w') as last_file:
 local_config = {"NET_DIR": net_dir}
 
 for config_file in [orig_config_file, local_config_file]:
-  current_config_identifiers = ["NET_DIR"]
+  current_config_identifiers = {"NET_DIR"}
   line_nr = 0
   for line in open(config_file):
     line_nr += 1
@@ -110,135 +118,487 @@ for config_file in [orig_config_file, local_config_file]:
     if name in current_config_identifiers:
       print("Error: duplicate identifier in %r line %d: %r" % (config_file, line_nr, line))
     local_config[name] = val
-    current_config_identifiers += [name]
-
-# replace variable names with above values recursively
-replace_re = re.compile('\$\{([A-Z_][A-Za-z0-9_]*)\}')
-command_re = re.compile('\$\{([a-z][A-Za-z0-9_]*)\(([^)]*)\)\}')
+    current_config_identifiers.add(name)
 
 idx = 0
 
-def check_stale(src_path, target_path):
-  if file_newer(src_path, target_path):
-    print()
-    print('Stale: %r is newer than %r' % (src_path, target_path))
-    exit(1)
-
-def replace_vars(tmpl, tmpl_dir, tmpl_src, local_config, strict=True):
-    used_vars = set()
-    for m in replace_re.finditer(tmpl):
-      name = m.group(1)
-      if not name in local_config:
-        if strict:
-          print('Error: undefined var %r in %r' % (name, tmpl_src))
-          exit(1)
-        else:
-          continue
-      used_vars.add(name)
-
-    for var in used_vars:
-      tmpl = tmpl.replace('${%s}' % var, local_config.get(var))
-
-    return tmpl
-
-def insert_includes(tmpl, tmpl_dir, tmpl_src, local_config, arg):
-    include_path = os.path.join(tmpl_dir, arg)
-    if not os.path.isfile(include_path):
-      print('Error: included file does not exist: %r in %r' % (include_path, tmpl_src))
-      exit(1)
+# Each generated file gets a record of exactly which inputs went into it: the
+# template and included files (with content hashes), every variable that was
+# referenced (with a hash of its value) and the items each ${foreach()} block
+# iterated. A file only needs to be rendered again when one of those changed.
+# The records are kept in LAST_DEPS_FILE in the net dir.
+file_hashes = {}
+
+def hash_str(val):
+  return hashlib.sha256(val.encode()).hexdigest()
+
+def hash_var(config, name):
+  # variables that are not set explicitly (e.g. filled in from a FOOn_BAR
+  # default) are recorded as empty hash
+  if name not in config:
+    return ''
+  return hash_str(config[name])
+
+def hash_file(path):
+  h = file_hashes.get(path)
+  if h is None:
     try:
-      incl = open(include_path).read()
-    except:
-      print('Cannot read %r for %r' % (include_path, tmpl_src))
-      raise
-    if args.check_stale:
-      check_stale(include_path, dst)
-
-    # recurse, to follow the paths that the included bits come from
-    incl = handle_commands(incl, os.path.dirname(include_path), include_path, local_config)
-
-    return tmpl.replace('${include(%s)}' % arg, incl)
-
-def insert_foreach(tmpl, tmpl_dir, tmpl_src, match, local_config, arg):
-
-    # figure out section to handle
-    start_span = match.span()
-
-    if tmpl[start_span[1]] == '\n':
-      start_span = (start_span[0], start_span[1] + 1)
-
-    end_str = '${foreach_end}\n'
-
-    end_at = tmpl.find(end_str, start_span[1])
-    if end_at < 0:
-      end_str = end_str[:-1]
-      end_at = tmpl.find(end_str, start_span[1])
-
-    if end_at < 0:
-      raise Exception('%r: ${for_each()} expects %r in %r' % (tmpl_src, end_str, tmpl[start_span[1]:]))
-
-    end_span = (end_at, end_at + len(end_str))
-
-    before_block = tmpl[:start_span[0]]
-    foreach_block = tmpl[start_span[1]:end_span[0]]
-    after_block = tmpl[end_span[1]:]
-
-    # figure out what items matching the foreach(FOO<number>) there are
-    item_re = re.compile('(^%s([0-9]+))_.*' % arg)
-    items = set()
-    for item in local_config.keys():
-      item_m = item_re.match(item)
-      if not item_m:
+      with open(path, 'rb') as f:
+        h = hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+      h = ''
+    file_hashes[path] = h
+  return h
+
+class Deps:
+  'Collect the inputs used while rendering one template.'
+
+  def __init__(self, tmpl_src):
+    self.tmpl_src = tmpl_src
+    # the script itself is an input, a changed fill_config.py may render differently
+    self.files = [os.path.realpath(__file__), tmpl_src]
+    self.vars = set()
+    self.foreach = {}
+
+  def add_file(self, path):
+    if path not in self.files:
+      self.files.append(path)
+
+  def record(self, local_config, result):
+    return {
+      'template': self.tmpl_src,
+      'files': { path: hash_file(path) for path in self.files },
+      'vars': { name: hash_var(local_config, name) for name in sorted(self.vars) },
+      'foreach': self.foreach,
+      'output': hash_str(result),
+    }
+
+def deps_changed(record, tmpl_src, local_config):
+  '''Return a description of the first input in record that differs from the
+  current state, or None when the generated file is up to date.'''
+  if not record:
+    return 'no dependency record'
+  if record.get('template') != tmpl_src:
+    return 'template changed from %r' % record.get('template')
+  for path, h in record['files'].items():
+    if hash_file(path) != h:
+      return '%r changed' % path
+  for name, h in record['vars'].items():
+    if hash_var(local_config, name) != h:
+      return 'variable %r changed' % name
+  for arg, items in record['foreach'].items():
+    if foreach_items(arg) != items:
+      return 'items of ${foreach(%s)} changed' % arg
+  return None
+
+def output_changed(record, dst):
+  'Return True when dst is missing or was modified after it was generated.'
+  if not os.path.isfile(dst):
+    return True
+  return hash_file(os.path.realpath(dst)) != record['output']
+
+deps_records = {}
+if os.path.isfile(LAST_DEPS_FILE):
+  try:
+    with open(LAST_DEPS_FILE) as deps_file:
+      deps_records = json.load(deps_file)
+  except ValueError:
+    print('Ignoring invalid %r' % LAST_DEPS_FILE)
+
+def write_deps_records():
+  with open(LAST_DEPS_FILE, 'w') as deps_file:
+    json.dump(deps_records, deps_file, indent=1, sort_keys=True)
+
+# also keep the records of files rendered so far when a later template fails
+if not args.check_stale:
+  atexit.register(write_deps_records)
+
+numbered_re = re.compile('([0-9]+)_')
+
+def index_families(config):
+  '''Index the numbered config families once, e.g. BTS0_ARFCN and BTS1_ARFCN
+  are of family 'BTS' with items (0, 'BTS0') and (1, 'BTS1'). FOO_COUNT=n
+  adds the items FOO0 .. FOO<n-1>, whose variables come from the FOOn_BAR
+  defaults unless set explicitly. Only families with such FOOn_* defaults get
+  items from FOO_COUNT, so e.g. a large PCAP_FILE_COUNT doesn't create any.
+  Return a dict of {family: [[nr, item], ...]} sorted by nr, and a dict of
+  {key: [(family, 'nr', item), ...]} listing the families each key is part
+  of.'''
+  families = {}
+  key_items = {}
+  for key in config.keys():
+    for family, nr, item in numbered_splits(key):
+      families.setdefault(family, set()).add((int(nr), item))
+      key_items.setdefault(key, []).append((family, nr, item))
+
+    if key.endswith('_COUNT') and config[key].isdigit():
+      family = key[:-len('_COUNT')]
+      if not [k for k in config.keys() if k.startswith(family + 'n_')]:
         continue
-      items.add((int(item_m.group(2)), item_m.group(1)))
+      for nr in range(int(config[key])):
+        families.setdefault(family, set()).add((nr, '%s%d' % (family, nr)))
+
+  families = { family: [[nr, item] for nr, item in sorted(items)]
+               for family, items in families.items() }
+  return families, key_items
+
+def numbered_splits(key):
+  '''Yield (family, 'nr', item) for each way key can be part of a numbered
+  family: FOO12_BAR is item 12 of FOO, but also item 2 of FOO1.'''
+  for m in numbered_re.finditer(key):
+    digits_start, i = m.span(1)
+    for split in range(max(digits_start, 1), i):
+      yield key[:split], key[split:i], key[:i]
+
+config_families, config_key_items = index_families(local_config)
+config_family_items = set((family, item) for family, items in config_families.items() for nr, item in items)
+
+def family_default(name):
+  '''For an undefined FOO23_BAR where FOO23 is an item of family FOO, return
+  ('FOOn_BAR', (family, 'nr', item)) if such a default is configured.'''
+  for family, nr, item in numbered_splits(name):
+    default = family + 'n' + name[len(item):]
+    if default in local_config and (family, item) in config_family_items:
+      return default, (family, nr, item)
+  return None
+
+def foreach_items(arg):
+  'Return sorted [[nr, "FOOnr"], ...] for all config keys like FOOnr_*.'
+  return config_families.get(arg, [])
+
+# Templates are split into tokens once and compiled to a tree of nodes, which
+# is then rendered in a single pass. Variable values are compiled the same way,
+# which expands variables referenced in values recursively.
+token_re = re.compile(r'\$\{(?:([A-Z_][A-Za-z0-9_]*)|([a-z][A-Za-z0-9_]*)(?:\(([^)]*)\))?)\}')
+
+class TemplateError(Exception):
+  pass
+
+class Var:
+  def __init__(self, name, src):
+    self.name = name
+    self.src = src
+
+  def render(self, r, out):
+    r.render_var(self.name, self.src, out)
+
+class Include:
+  def __init__(self, arg, src):
+    self.arg = arg
+    self.src = src
+
+  def render(self, r, out):
+    tmpl_dir = os.path.dirname(self.src) if self.src else r.tmpl_dir
+    include_path = os.path.join(tmpl_dir, self.arg)
+    if not os.path.isfile(include_path):
+      raise TemplateError('included file does not exist: %r in %r' % (include_path, r.where(self.src)))
+    r.deps.add_file(include_path)
+    r.render_file(include_path, out)
 
-    items = sorted(list(items))
+class Foreach:
+  def __init__(self, arg, src):
+    self.arg = arg
+    self.src = src
+    self.body = []
 
-    expanded = [before_block]
+  def render(self, r, out):
+    # figure out what items matching the foreach(FOO<number>) there are
+    items = foreach_items(self.arg)
+    r.deps.foreach[self.arg] = items
+    was = r.items.get(self.arg)
     for nr, item in items:
-      expanded_block = foreach_block
-
-      while True:
-        expanded_block_was = expanded_block
-
-        expanded_block = expanded_block.replace('${%sn_' % arg, '${%s_' % item)
-        expanded_block = expanded_block.replace('${%sn}' % arg, str(nr))
-        expanded_block = replace_vars(expanded_block, tmpl_dir, tmpl_src, local_config)
-
-        if expanded_block_was == expanded_block:
-          break
-
-      expanded.append(expanded_block)
-
-    expanded.extend(after_block)
-    return ''.join(expanded)
-
-def handle_commands(tmpl, tmpl_dir, tmpl_src, local_config):
-    while True:
-      # make sure to re-run the regex after each expansion to get proper string
-      # offsets each time
-      m = command_re.search(tmpl)
-      if not m:
-        break;
-      cmd = m.group(1)
-      arg = m.group(2)
-      expanded = False
-      if cmd == 'include':
-        tmpl = insert_includes(tmpl, tmpl_dir, tmpl_src, local_config, arg)
-        expanded = True
-      elif cmd == 'foreach':
-        tmpl = insert_foreach(tmpl, tmpl_dir, tmpl_src, m, local_config, arg)
-        expanded = True
-      elif cmd == 'strftime':
-        pass
+      r.items[self.arg] = (str(nr), item)
+      r.render_nodes(self.body, out)
+    r.restore_items({self.arg: was})
+
+def func_add(*vals):
+  return str(sum(int(val) for val in vals))
+
+def func_mul(*vals):
+  ret = 1
+  for val in vals:
+    ret *= int(val)
+  return str(ret)
+
+def func_ip_add(ip, *vals):
+  return str(ipaddress.ip_address(ip) + sum(int(val) for val in vals))
+
+# ${add(PORT_BASE, BTSn)} etc.: each argument is either a variable name or a
+# literal value.
+template_funcs = {
+  'add': func_add,
+  'mul': func_mul,
+  'ip_add': func_ip_add,
+}
+var_name_re = re.compile('[A-Z_][A-Za-z0-9_]*')
+
+class Call:
+  def __init__(self, cmd, arg, src):
+    self.cmd = cmd
+    self.args = [a.strip() for a in arg.split(',')]
+    self.src = src
+
+  def render(self, r, out):
+    vals = []
+    for arg in self.args:
+      if var_name_re.fullmatch(arg):
+        val = []
+        r.render_var(arg, self.src, val)
+        arg = ''.join(val).strip()
+      vals.append(arg)
+    try:
+      out.append(template_funcs[self.cmd](*vals))
+    except (ValueError, TypeError) as e:
+      raise TemplateError('${%s(%s)} in %r: %s' % (self.cmd, ', '.join(vals), r.where(self.src), e))
+
+def compile_tmpl(tmpl, src):
+  '''Split a template into a list of text strings and nodes. The contents of a
+  ${foreach(FOO)} ... ${foreach_end} block become the body of a Foreach node.
+  src is the file the template was read from, or None for a variable value.'''
+  nodes = []
+  stack = []
+  pos = 0
+  while True:
+    m = token_re.search(tmpl, pos)
+    if not m:
+      break
+    if m.start() > pos:
+      nodes.append(tmpl[pos:m.start()])
+    pos = m.end()
+
+    var, cmd, arg = m.groups()
+    if var:
+      nodes.append(Var(var, src))
+    elif arg is None:
+      if cmd != 'foreach_end':
+        # not for us, e.g. ${caller_id_number} in freeswitch configs
+        nodes.append(m.group(0))
+        continue
+      if not stack:
+        raise TemplateError('${foreach_end} without ${foreach()} in %r' % (src or tmpl))
+      foreach = stack.pop()
+      foreach.body = nodes
+      nodes = foreach.parent_nodes
+      del foreach.parent_nodes
+      nodes.append(foreach)
+      if tmpl.startswith('\n', pos):
+        pos += 1
+    elif cmd == 'include':
+      nodes.append(Include(arg, src))
+    elif cmd == 'foreach':
+      foreach = Foreach(arg, src)
+      foreach.parent_nodes = nodes
+      stack.append(foreach)
+      nodes = []
+      if tmpl.startswith('\n', pos):
+        pos += 1
+    elif cmd in template_funcs:
+      nodes.append(Call(cmd, arg, src))
+    elif cmd == 'strftime':
+      nodes.append(m.group(0))
+    else:
+      print('Error: unknown command: %r in %r' % (cmd, src or tmpl))
+      nodes.append(m.group(0))
+
+  if stack:
+    raise TemplateError('${foreach(%s)} expects ${foreach_end} in %r' % (stack[-1].arg, src or tmpl))
+
+  if pos < len(tmpl):
+    nodes.append(tmpl[pos:])
+  return nodes
+
+compiled_files = {}
+compiled_values = {}
+
+def compile_file(path, for_src):
+  nodes = compiled_files.get(path)
+  if nodes is None:
+    try:
+      tmpl = open(path).read()
+    except OSError as e:
+      raise TemplateError('cannot read %r for %r: %s' % (path, for_src, e))
+    nodes = compile_tmpl(tmpl, path)
+    compiled_files[path] = nodes
+  return nodes
+
+def compile_value(val):
+  nodes = compiled_values.get(val)
+  if nodes is None:
+    nodes = compile_tmpl(val, None) if '${' in val else [val]
+    compiled_values[val] = nodes
+  return nodes
+
+class Renderer:
+  'Render one template file with local_config, collecting the inputs used in deps.'
+
+  def __init__(self, tmpl_src, local_config, deps, items):
+    self.tmpl_src = tmpl_src
+    self.tmpl_dir = os.path.dirname(tmpl_src)
+    self.local_config = local_config
+    self.deps = deps
+    # current item of each ${foreach(FOO)}, and of the family a template like
+    # osmo-bts-${BTSn}.cfg is rendered for: {'FOO': ('nr', 'FOOnr')}
+    self.items = dict(items)
+    self.file_stack = []
+    self.var_stack = []
+
+  def where(self, src):
+    if src:
+      return src
+    return 'value of %r' % self.var_stack[-1]
+
+  def render(self):
+    out = []
+    self.render_file(self.tmpl_src, out)
+    return ''.join(out)
+
+  def render_file(self, path, out):
+    if path in self.file_stack:
+      raise TemplateError('recursive include of %r in %r' % (path, self.file_stack[-1]))
+    nodes = compile_file(path, self.file_stack[-1] if self.file_stack else self.tmpl_src)
+    self.file_stack.append(path)
+    self.render_nodes(nodes, out)
+    self.file_stack.pop()
+
+  def render_nodes(self, nodes, out):
+    for node in nodes:
+      if isinstance(node, str):
+        out.append(node)
       else:
-        print('Error: unknown command: %r in %r' % (cmd, tmpl_src))
-        break
+        node.render(self, out)
 
-      if not expanded:
+  def restore_items(self, was_items):
+    for arg, was in was_items.items():
+      if was is None:
+        self.items.pop(arg, None)
+      else:
+        self.items[arg] = was
+
+  def render_var(self, name, src, out):
+    # in a ${foreach(FOO)} block, ${FOOn} is the item number and ${FOOn_BAR}
+    # refers to ${FOO<number>_BAR}
+    for arg, (nr, item) in self.items.items():
+      if name == arg + 'n':
+        out.append(nr)
+        return
+      if name.startswith(arg + 'n_'):
+        name = item + name[len(arg) + 1:]
         break
 
-    return tmpl
+    # If there are ${FOOn} in the value of a variable called FOO23_SOMETHING,
+    # then replace that n by 23. This happens automatically in ${foreach} blocks,
+    # but doing this also allows expanding the n outside of ${foreach}.
+    key_items = config_key_items.get(name, ())
+    self.deps.vars.add(name)
+
+    if name not in self.local_config:
+      # FOO23_BAR is not set, but a FOOn_BAR default may be
+      default = family_default(name)
+      if not default:
+        raise TemplateError('undefined var %r in %r' % (name, self.where(src)))
+      name, item = default
+      key_items = (item,)
+      self.deps.vars.add(name)
+
+    if name in self.var_stack:
+      raise TemplateError('recursive variable %r: %s' % (name, ' -> '.join(self.var_stack + [name])))
+
+    was_items = {}
+    for family, nr, item in key_items:
+      was_items.setdefault(family, self.items.get(family))
+      self.items[family] = (nr, item)
+
+    self.var_stack.append(name)
+    self.render_nodes(compile_value(self.local_config[name]), out)
+    self.var_stack.pop()
+    self.restore_items(was_items)
+
+def write_atomic(dst, content, mode_src):
+  '''Write to a temporary file next to dst and rename it to dst, so that
+  programs reading dst never see a partially written file.'''
+  tmp = os.path.join(os.path.dirname(dst), '.%s.tmp%d' % (os.path.basename(dst), os.getpid()))
+  with open(tmp, 'w') as tmp_file:
+    tmp_file.write(content)
+  shutil.copymode(mode_src, tmp)
+  os.replace(tmp, dst)
+
+def sync_file(src, dst):
+  if os.path.islink(src):
+    target = os.readlink(src)
+    if os.path.islink(dst) and os.readlink(dst) == target:
+      return
+    if os.path.lexists(dst):
+      os.remove(dst)
+    os.symlink(target, dst)
+    return
+
+  st = os.stat(src)
+  if os.path.isfile(dst) and not os.path.islink(dst):
+    dst_st = os.stat(dst)
+    if dst_st.st_size == st.st_size and dst_st.st_mtime_ns == st.st_mtime_ns:
+      return
+  tmp = os.path.join(os.path.dirname(dst), '.%s.tmp%d' % (os.path.basename(dst), os.getpid()))
+  shutil.copy2(src, tmp)
+  os.replace(tmp, dst)
+
+def sync_dir(src, dst, synced_before):
+  '''Update dst to be a copy of the template subdirectory src: only copy
+  files that differ in size or mtime, and remove files that were copied on a
+  previous run but are gone from src. Other files in dst, e.g. created at
+  runtime by the program using the dir, are kept. Return the list of synced
+  paths, relative to dst.'''
+  if os.path.lexists(dst) and not os.path.isdir(dst):
+    os.remove(dst)
+
+  synced = []
+  for dirpath, dirnames, filenames in os.walk(src):
+    rel_dir = os.path.relpath(dirpath, src)
+    os.makedirs(os.path.join(dst, rel_dir), exist_ok=True)
+
+    # like copytree(symlinks=True), copy symlinks to dirs as symlinks
+    names = [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))] + filenames
+    for name in names:
+      rel = os.path.normpath(os.path.join(rel_dir, name))
+      sync_file(os.path.join(dirpath, name), os.path.join(dst, rel))
+      synced.append(rel)
+
+  for rel in set(synced_before) - set(synced):
+    path = os.path.join(dst, rel)
+    if os.path.lexists(path) and not os.path.isdir(path):
+      os.remove(path)
+
+  return sorted(synced)
+
+def render_job(job):
+  '''Render one template and write the result, called in worker processes.
+  Return (dst, deps record, error message).'''
+  tmpl_src, dst, tmpl_vars, items = job
+  config = collections.ChainMap(tmpl_vars, local_config)
+  deps = Deps(tmpl_src)
+  try:
+    result = Renderer(tmpl_src, config, deps, items).render()
+  except TemplateError as e:
+    return dst, None, str(e)
+  write_atomic(dst, result, tmpl_src)
+  return dst, deps.record(config, result), None
+
+# A template named like osmo-bts-${BTSn}.cfg is rendered once for each item
+# of the BTS family, to osmo-bts-0.cfg, osmo-bts-1.cfg, ...
+tmpl_name_family_re = re.compile(r'\$\{([A-Z_][A-Za-z0-9_]*)n\}')
+
+def template_outputs(tmpl_name):
+  'Return [(dst, {family: (nr, item)}), ...] for a template file name.'
+  m = tmpl_name_family_re.search(tmpl_name)
+  if not m:
+    return [(tmpl_name, {})]
+  family = m.group(1)
+  return [(tmpl_name.replace(m.group(0), str(nr)), {family: (str(nr), item)})
+          for nr, item in foreach_items(family)]
+
+jobs = []
+# outputs of templates like osmo-bts-${BTSn}.cfg: {dst: template}
+family_outputs = {}
+family_templates = set()
 
 for tmpl_name in sorted(os.listdir(tmpl_dir)):
 
@@ -255,54 +615,76 @@ for tmpl_name in sorted(os.listdir(tmpl_dir)):
 
   # subdirectories: must not contain config files, just copy them
   if os.path.isdir(tmpl_src):
-    if os.path.exists(dst) and os.path.isdir(dst):
-      shutil.rmtree(dst)
-    shutil.copytree(tmpl_src, dst, symlinks=True)
+    if args.check_stale:
+      continue
+    synced_before = (deps_records.get(dst) or {}).get('synced', [])
+    deps_records[dst] = {'synced': sync_dir(tmpl_src, dst, synced_before)}
     continue
 
-  if args.check_stale:
-    check_stale(local_config_file, dst)
-    check_stale(orig_config_file, dst)
-    check_stale(tmpl_src, dst)
-
-  local_config['_fname'] = tmpl_name
-  local_config['_name'] = os.path.splitext(tmpl_name)[0]
-  local_config['_idx0'] = str(idx)
-  idx += 1
-  local_config['_idx1'] = str(idx)
-
-  # If there are ${FOOn} in the value of a variable called FOO23_SOMETHING,
-  # then replace that n by 23. This happens automatically in ${foreach} blocks,
-  # but doing this also allows expanding the n outside of ${foreach}.
-  for key, val in local_config.items():
-    foo_n_re = re.compile('\$\{([A-Za-z0-9_]*)n[_}]')
-    for m in foo_n_re.finditer(val):
-      name = m.group(1)
-      item_re = re.compile('^%s([0-9]+)_.*' % name)
-      item_m = item_re.match(key)
-      if not item_m:
-        continue
-      nr_in_key = item_m.group(1)
-      val = val.replace('${%sn}' % name, nr_in_key)
-      val = val.replace('${%sn_' % name, '${%s%s_' % (name, nr_in_key))
-    local_config[key] = val
+  outputs = template_outputs(tmpl_name)
+  if tmpl_name_family_re.search(tmpl_name):
+    family_templates.add(tmpl_src)
+    for dst, items in outputs:
+      family_outputs[dst] = tmpl_src
+
+  for dst, items in outputs:
+    tmpl_vars = {
+      '_fname': dst,
+      '_name': os.path.splitext(dst)[0],
+      '_idx0': str(idx),
+      '_idx1': str(idx + 1),
+    }
+    idx += 1
+    config = collections.ChainMap(tmpl_vars, local_config)
+
+    record = deps_records.get(dst)
+    changed = deps_changed(record, tmpl_src, config)
+    if args.check_stale:
+      if not changed and not os.path.isfile(dst):
+        changed = 'does not exist'
+      if changed:
+        print()
+        print('Stale: %r: %s' % (dst, changed))
+        exit(1)
+      continue
 
-  try:
-    result = open(tmpl_src).read()
-  except:
-    print('Error in %r' % tmpl_src)
-    raise
+    if not changed and not args.force and not output_changed(record, dst):
+      continue
 
-  while True:
-    result_was = result
-    result = handle_commands(result, tmpl_dir, tmpl_src, local_config)
-    result = replace_vars(result, tmpl_dir, tmpl_src, local_config)
-    if result_was == result:
-      break
+    jobs.append((tmpl_src, dst, tmpl_vars, items))
 
-  if not args.check_stale:
-    with open(dst, 'w') as dst_file:
-      dst_file.write(result)
-    shutil.copymode(tmpl_src, dst)
+# files generated for items that are not configured anymore, e.g. after
+# lowering BTS_COUNT
+for dst, record in list(deps_records.items()):
+  if record.get('template') not in family_templates or family_outputs.get(dst) == record.get('template'):
+    continue
+  if args.check_stale:
+    print()
+    print('Stale: %r: item is not configured anymore' % dst)
+    exit(1)
+  print('removing %r' % dst)
+  if os.path.isfile(dst):
+    os.remove(dst)
+  del deps_records[dst]
+
+# The workers are forked, so they share the config and all that was compiled
+# so far with this process.
+if args.jobs > 1 and len(jobs) > 1:
+  pool = multiprocessing.get_context('fork').Pool(min(args.jobs, len(jobs)))
+  results = pool.imap(render_job, jobs)
+else:
+  pool = None
+  results = map(render_job, jobs)
+
+try:
+  for dst, record, error in results:
+    if error:
+      print('Error: %s' % error)
+      exit(1)
+    print('rendering %r' % dst)
+    deps_records[dst] = record
+finally:
+  if pool:
+    pool.terminate()
 
 # vim: ts=2 sw=2 expandtab
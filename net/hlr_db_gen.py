@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Add a large range of subscribers to an osmo-hlr database, e.g. for load
+tests (HLR_SUBSCR_NUM in the net config, see README).
+
+Subscriber n of the range (0 <= n < COUNT) gets the database id ID+n, the IMSI
+IMSI+n, the MSISDN MSISDN+n and the Ki KI+n, counting in decimal for IMSI and
+MSISDN (keeping their length) and in hex for the Ki. All subscribers are
+written in one transaction, and the indexes of the subscriber tables are only
+rebuilt once at the end, so a million subscribers take seconds, not the hours
+that creating them one by one via the VTY of osmo-hlr takes.
+
+If the database does not exist, it is created with osmo-hlr-db-tool first.
+Subscribers that exist with the same ids are replaced, unless the range is
+provisioned already exactly like this: then nothing is done, so that running
+it again before each start of osmo-hlr is cheap and keeps the state of the
+subscribers (last location update, SQN, ...)."""
+
+import argparse
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+# enum osmo_auth_algo (libosmocore)
+ALGO_2G = {"comp128v1": 1, "comp128v2": 2, "comp128v3": 3}
+ALGO_MILENAGE = 5
+
+TABLES = ("subscriber", "auc_2g", "auc_3g")
+
+
+def error(msg):
+    print(f"ERROR: {msg}")
+    sys.exit(1)
+
+
+def number_range(name, first, count, digits):
+    """Return a function giving the n-th value of the range that starts at
+    first, as string of the same length."""
+    base = 16 if digits == "hex" else 10
+    try:
+        start = int(first, base)
+    except ValueError:
+        error(f"{name}: not a {'hex' if base == 16 else 'decimal'} number: {first!r}")
+    width = len(first)
+    last = start + count - 1
+    if last >= base**width:
+        error(f"{name}: range {first} + {count} does not fit in {width} digits")
+    if base == 16:
+        return lambda n: f"{start + n:0{width}x}"
+    return lambda n: f"{start + n:0{width}d}"
+
+
+def create_db(path, db_tool):
+    print(f"Creating {path} with {db_tool}")
+    try:
+        subprocess.run([db_tool, "-l", path, "create"], check=True, stdout=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError) as e:
+        error(f"cannot create {path}: {e}")
+
+
+def provisioned(db, args, imsi, msisdn, ki, k):
+    """Check if the range is in the database already, by its first and last
+    subscriber and the number of subscribers in between."""
+    last_id = args.id + args.count - 1
+    count = db.execute("SELECT count(*) FROM subscriber WHERE id BETWEEN ? AND ?", (args.id, last_id)).fetchone()[0]
+    if count != args.count:
+        return False
+    for n in (0, args.count - 1):
+        row = db.execute(
+            "SELECT imsi, msisdn, ki, k FROM subscriber"
+            " LEFT JOIN auc_2g ON auc_2g.subscriber_id = id LEFT JOIN auc_3g ON auc_3g.subscriber_id = id"
+            " WHERE id = ?",
+            (args.id + n,),
+        ).fetchone()
+        if row != (imsi(n), msisdn(n) if msisdn else None, ki(n) if ki else None, k(n) if k else None):
+            return False
+    return True
+
+
+def subscriber_rows(args, imsi, msisdn):
+    for n in range(args.count):
+        yield args.id + n, imsi(n), msisdn(n) if msisdn else None
+
+
+def gen(args):
+    imsi = number_range("IMSI", args.imsi, args.count, "dec")
+    if len(args.imsi) > 15:
+        error(f"IMSI: more than 15 digits: {args.imsi}")
+    msisdn = number_range("MSISDN", args.msisdn, args.count, "dec") if args.msisdn else None
+    ki = number_range("Ki", args.ki.replace(" ", ""), args.count, "hex") if args.ki else None
+    k = number_range("K", args.k.replace(" ", ""), args.count, "hex") if args.k else None
+    opc = args.opc.replace(" ", "") if args.opc else None
+    if k and not opc:
+        error("--k requires --opc")
+
+    if not os.path.exists(args.db):
+        create_db(args.db, args.db_tool)
+
+    db = sqlite3.connect(args.db, isolation_level=None)
+    if provisioned(db, args, imsi, msisdn, ki, k):
+        print(f"{args.db}: {args.count} subscribers from IMSI {imsi(0)} are provisioned already")
+        return
+
+    t_start = time.monotonic()
+    # nothing to recover from if this fails half way: just run it again
+    db.execute("PRAGMA synchronous = OFF")
+    db.execute("PRAGMA journal_mode = MEMORY")
+    db.execute("BEGIN")
+    try:
+        # drop the explicit indexes and create them again after all inserts,
+        # building an index once is much faster than updating it per row
+        indexes = db.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN (?, ?, ?)",
+            TABLES,
+        ).fetchall()
+        for name, _ in indexes:
+            db.execute(f"DROP INDEX {name}")
+
+        last_id = args.id + args.count - 1
+        for table, column in (("auc_2g", "subscriber_id"), ("auc_3g", "subscriber_id"), ("subscriber", "id")):
+            cur = db.execute(f"DELETE FROM {table} WHERE {column} BETWEEN ? AND ?", (args.id, last_id))
+            if table == "subscriber" and cur.rowcount:
+                print(f"Replacing {cur.rowcount} subscribers with ids {args.id}..{last_id}")
+
+        db.executemany(
+            "INSERT INTO subscriber (id, imsi, msisdn) VALUES (?, ?, ?)", subscriber_rows(args, imsi, msisdn)
+        )
+        if ki:
+            algo = ALGO_2G[args.algo_2g]
+            db.executemany(
+                "INSERT INTO auc_2g (subscriber_id, algo_id_2g, ki) VALUES (?, ?, ?)",
+                ((args.id + n, algo, ki(n)) for n in range(args.count)),
+            )
+        if k:
+            db.executemany(
+                "INSERT INTO auc_3g (subscriber_id, algo_id_3g, k, opc) VALUES (?, ?, ?, ?)",
+                ((args.id + n, ALGO_MILENAGE, k(n), opc) for n in range(args.count)),
+            )
+
+        for _, sql in indexes:
+            db.execute(sql)
+        db.execute("COMMIT")
+    except sqlite3.Error as e:
+        db.execute("ROLLBACK")
+        error(f"{args.db}: {e} (is the IMSI or MSISDN range used by other subscribers already?)")
+    finally:
+        db.close()
+
+    print(
+        f"{args.db}: added {args.count} subscribers, IMSI {imsi(0)}..{imsi(args.count - 1)},"
+        f" in {time.monotonic() - t_start:.1f}s"
+    )
+
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("-d", "--db", default="hlr.db", help="osmo-hlr database (default: %(default)s)")
+parser.add_argument("-n", "--count", type=int, required=True, help="number of subscribers")
+parser.add_argument("--id", type=int, default=100000, help="database id of the first subscriber (default: %(default)s)")
+parser.add_argument("--imsi", required=True, help="IMSI of the first subscriber")
+parser.add_argument("--msisdn", help="MSISDN of the first subscriber (default: none)")
+parser.add_argument("--ki", help="2G Ki of the first subscriber, 32 hex digits (default: no 2G auth)")
+parser.add_argument("--algo-2g", choices=ALGO_2G.keys(), default="comp128v1", help="default: %(default)s")
+parser.add_argument("--k", help="3G (milenage) K of the first subscriber, 32 hex digits (default: no 3G auth)")
+parser.add_argument("--opc", help="3G (milenage) OPc of all subscribers, 32 hex digits")
+parser.add_argument("--db-tool", default="osmo-hlr-db-tool", help="for creating a new database (default: %(default)s)")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.count < 1:
+        error("--count must be at least 1")
+    gen(args)
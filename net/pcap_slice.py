@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Merge the packet capture files of a network run (e.g. the ring buffer files
+in current_log/pcap/, see README) into one pcap file, keeping only the packets
+within a time window.
+
+Capture files are read in one pass, without loading them into memory. Files
+whose first packet is after the end of the window, or that were last written
+before its start, are not read at all, so cutting a few minutes out of a
+capture of many hours is quick. A file is only opened while its packets are
+merged, so a ring buffer of many files does not run into the open files limit.
+
+Times for --from and --to can be given as:
+  "2025-01-31 12:34[:56]"  local time
+  "12:34[:56]"             on the day of the first packet
+  "+5m", "+1h30m", "+90"   after the first packet (s, m, h; default: s)
+  "-10m"                   before the end of the capture (--from=-10m)"""
+
+import argparse
+import datetime
+import heapq
+import os
+import re
+import struct
+import sys
+
+MAGIC_USEC = 0xA1B2C3D4
+MAGIC_NSEC = 0xA1B23C4D
+
+duration_re = re.compile(r"^([0-9]+[hms]?)+$")
+duration_part_re = re.compile(r"([0-9]+)([hms]?)")
+
+
+def error(msg):
+    print(f"ERROR: {msg}")
+    sys.exit(1)
+
+
+class PcapFile:
+    """One classic pcap file (as written by tcpdump), read packet by packet.
+    Only the header and the first packet are read when creating it, the file
+    is opened again by packets()."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(24)
+            self.parse_header(header)
+            packet = self.read(f)
+        self.first = packet[0] if packet else None
+        self.mtime = os.stat(path).st_mtime_ns
+
+    def parse_header(self, header):
+        if len(header) < 24:
+            raise ValueError("too short for a pcap file")
+        for endian in ("<", ">"):
+            (magic,) = struct.unpack(endian + "I", header[:4])
+            if magic in (MAGIC_USEC, MAGIC_NSEC):
+                break
+        else:
+            raise ValueError("not a pcap file (pcapng is not supported, use mergecap and editcap)")
+        self.record = struct.Struct(endian + "IIII")
+        self.ns_per_frac = 1 if magic == MAGIC_NSEC else 1000
+        _, _, _, _, self.snaplen, self.linktype = struct.unpack(endian + "HHiIII", header[4:])
+
+    def read(self, f):
+        """Return (timestamp in ns, orig_len, data) of the next packet."""
+        header = f.read(self.record.size)
+        if len(header) < self.record.size:
+            return None
+        sec, frac, incl_len, orig_len = self.record.unpack(header)
+        data = f.read(incl_len)
+        if len(data) < incl_len:
+            # the last packet of a file that is still being written
+            return None
+        return sec * 1_000_000_000 + frac * self.ns_per_frac, orig_len, data
+
+    def packets(self):
+        with open(self.path, "rb") as f:
+            f.seek(24)
+            packet = self.read(f)
+            while packet:
+                yield packet
+                packet = self.read(f)
+
+
+def parse_time(value, first, end):
+    """Return the time in ns that value stands for (see --help), first and
+    end are the first packet and the end of the capture in ns."""
+    if value[0] in "+-" and duration_re.match(value[1:]):
+        seconds = 0
+        for amount, unit in duration_part_re.findall(value[1:]):
+            seconds += int(amount) * {"h": 3600, "m": 60}.get(unit, 1)
+        if value[0] == "+":
+            return first + seconds * 1_000_000_000
+        return end - seconds * 1_000_000_000
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%H:%M:%S", "%H:%M"):
+        try:
+            t = datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if not fmt.startswith("%Y"):
+            day = datetime.datetime.fromtimestamp(first / 1_000_000_000).date()
+            t = datetime.datetime.combine(day, t.time())
+        return int(t.timestamp()) * 1_000_000_000
+    error(f"invalid time: {value!r}")
+
+
+def scan_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(os.listdir(path))
+            files += scan_files(os.path.join(path, name) for name in names)
+            continue
+        try:
+            pcap = PcapFile(path)
+        except (OSError, ValueError) as e:
+            error(f"{path}: {e}")
+        if pcap.first is not None:
+            files.append(pcap)
+    return files
+
+
+def merge_packets(files):
+    """Merge the packets of all files by time, like heapq.merge(). Open each
+    file only once the merged packets reach its first packet, so only files
+    that overlap in time (e.g. of different interfaces) are open at once."""
+    files = sorted(files, key=lambda f: f.first)
+    # (timestamp, index in files, packet, packets() of the file)
+    heap = []
+    i = 0
+    while heap or i < len(files):
+        while i < len(files) and (not heap or files[i].first <= heap[0][0]):
+            packets = files[i].packets()
+            packet = next(packets, None)
+            if packet:
+                heapq.heappush(heap, (packet[0], i, packet, packets))
+            i += 1
+        if not heap:
+            continue
+        _, index, packet, packets = heapq.heappop(heap)
+        yield packet
+        packet = next(packets, None)
+        if packet:
+            heapq.heappush(heap, (packet[0], index, packet, packets))
+
+
+def write_pcap(path, packets, snaplen, linktype):
+    count = 0
+    with open(path, "wb") as f:
+        f.write(struct.pack("<IHHiIII", MAGIC_USEC, 2, 4, 0, 0, snaplen, linktype))
+        for ts, orig_len, data in packets:
+            sec, usec = divmod(ts // 1000, 1_000_000)
+            f.write(struct.pack("<IIII", sec, usec, len(data), orig_len))
+            f.write(data)
+            count += 1
+    return count
+
+
+def main(args):
+    files = scan_files(args.files)
+    if not files:
+        error("no packets in the capture files")
+    linktypes = {f.linktype for f in files}
+    if len(linktypes) > 1:
+        error(f"the files have different link types {sorted(linktypes)}, use mergecap instead")
+
+    first = min(f.first for f in files)
+    end = max(f.mtime for f in files)
+    start = parse_time(args.start, first, end) if args.start else 0
+    stop = parse_time(args.stop, first, end) if args.stop else None
+
+    selected = []
+    for f in files:
+        # mtime: the last packet of the file was written before it
+        if f.mtime < start or (stop is not None and f.first >= stop):
+            if args.verbose:
+                print(f"skipping {f.path}")
+            continue
+        if args.verbose:
+            print(f"reading {f.path}")
+        selected.append(f)
+
+    packets = merge_packets(selected)
+    window = (p for p in packets if p[0] >= start and (stop is None or p[0] < stop))
+    count = write_pcap(args.output, window, max(f.snaplen for f in files), linktypes.pop())
+    print(f"{args.output}: {count} packets from {len(selected)} of {len(files)} files")
+
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("files", metavar="FILE_OR_DIR", nargs="+", help="pcap files, or directories with pcap files")
+parser.add_argument("-o", "--output", required=True, help="pcap file to write")
+parser.add_argument("-f", "--from", dest="start", metavar="TIME", help="first packet to keep (default: all)")
+parser.add_argument("-t", "--to", dest="stop", metavar="TIME", help="keep packets before this time (default: all)")
+parser.add_argument("-v", "--verbose", action="store_true", help="show which files are read")
+
+if __name__ == "__main__":
+    main(parser.parse_args())
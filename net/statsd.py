@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""Collect the StatsD metrics that the Osmocom programs of a network send
+(see common_statsd and STATSD_COLLECTOR in config_2g3g), and report on them.
+
+"statsd.py run -o FILE" receives metrics and appends one JSON line per
+interval to FILE: the time, the counter deltas and the gauges that changed in
+that interval, by metric name. Names start with the network element, e.g.
+"osmo-msc.msc.0.call.mo_setup" (stats reporter prefix, the config file name).
+
+"statsd.py report FILE" summarizes such a file: per network element, the
+total and rate of each counter (average, median, 95th percentile and peak
+over the intervals) and the range of each gauge, followed by all counters
+that look like failures (paging expired, assignment failed, ...) and did
+count up during the run."""
+
+import argparse
+import json
+import math
+import re
+import signal
+import socket
+import sys
+import threading
+import time
+
+# counters listed again at the end of the report, if they counted up
+failure_re = re.compile(r"fail|err|reject|timeout|expired|drop|lost|abort|invalid", re.IGNORECASE)
+
+
+class Collector:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.changed = set()
+        self.timers = {}
+        self.stats = {"packets": 0, "invalid": 0}
+        self.t_last = time.time()
+
+    def handle(self, data):
+        """Handle one datagram, with one or more "name:value|type[|@rate]"."""
+        with self.lock:
+            self.stats["packets"] += 1
+            for line in data.decode("utf-8", "replace").splitlines():
+                try:
+                    name, rest = line.rsplit(":", 1)
+                    fields = rest.split("|")
+                    value = float(fields[0])
+                    kind = fields[1]
+                except (ValueError, IndexError):
+                    self.stats["invalid"] += 1
+                    continue
+                if kind == "c":
+                    rate = float(fields[2][1:]) if len(fields) > 2 and fields[2].startswith("@") else 1
+                    self.counters[name] = self.counters.get(name, 0) + value / rate
+                elif kind == "g":
+                    # "+N" and "-N" change the gauge, according to statsd
+                    if fields[0][0] in "+-":
+                        value += self.gauges.get(name, 0)
+                    if self.gauges.get(name) != value:
+                        self.changed.add(name)
+                    self.gauges[name] = value
+                elif kind in ("ms", "h"):
+                    self.timers.setdefault(name, []).append(value)
+                else:
+                    self.stats["invalid"] += 1
+
+    def flush(self, f):
+        """Write the metrics of the interval since the last flush."""
+        with self.lock:
+            now = time.time()
+            entry = {"t": round(now, 3), "dt": round(now - self.t_last, 3)}
+            if self.counters:
+                entry["c"] = {name: compact(value) for name, value in self.counters.items()}
+            if self.changed:
+                entry["g"] = {name: compact(self.gauges[name]) for name in self.changed}
+            if self.timers:
+                entry["ms"] = {name: [compact(v) for v in values] for name, values in self.timers.items()}
+            self.counters = {}
+            self.changed = set()
+            self.timers = {}
+            self.t_last = now
+        f.write(json.dumps(entry, separators=(",", ":"), sort_keys=True) + "\n")
+        f.flush()
+
+
+def compact(value):
+    return int(value) if value == int(value) else value
+
+
+def run(args):
+    ip, port = args.listen.rsplit(":", 1)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((ip, int(port)))
+    collector = Collector()
+
+    def receive():
+        while True:
+            collector.handle(sock.recv(65536))
+
+    threading.Thread(target=receive, daemon=True).start()
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *a: stopping.set())
+    signal.signal(signal.SIGINT, lambda *a: stopping.set())
+    print(f"[statsd] listening on {ip}:{port}, writing to {args.output}", flush=True)
+    with open(args.output, "a") as f:
+        while not stopping.wait(args.interval):
+            collector.flush(f)
+        collector.flush(f)
+    stats = collector.stats
+    print(f"[statsd] stopped, received {stats['packets']} packets ({stats['invalid']} invalid lines)")
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of the sorted list values."""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def load(path):
+    intervals = []
+    with open(path) as f:
+        for line in f:
+            try:
+                intervals.append(json.loads(line))
+            except ValueError:
+                # last line of a file that is still being written
+                continue
+    return intervals
+
+
+def summarize(intervals):
+    """Return {element: {"counters": {name: {...}}, "gauges": {...}, "timers": {...}}}."""
+    duration = sum(i["dt"] for i in intervals)
+    totals = {}
+    rates = {}
+    gauges = {}
+    timers = {}
+    for n, interval in enumerate(intervals):
+        for name, delta in interval.get("c", {}).items():
+            totals[name] = totals.get(name, 0) + delta
+            # intervals without the counter: rate 0
+            rates.setdefault(name, [0] * len(intervals))[n] = delta / interval["dt"] if interval["dt"] else 0
+        for name, value in interval.get("g", {}).items():
+            gauges.setdefault(name, []).append(value)
+        for name, values in interval.get("ms", {}).items():
+            timers.setdefault(name, []).extend(values)
+
+    ret = {}
+
+    def element(name):
+        elem, _, metric = name.partition(".")
+        return ret.setdefault(elem, {"counters": {}, "gauges": {}, "timers": {}}), metric
+
+    for name, total in totals.items():
+        e, metric = element(name)
+        r = sorted(rates[name])
+        e["counters"][metric] = {
+            "total": compact(total),
+            "rate": total / duration if duration else 0,
+            "p50": percentile(r, 50),
+            "p95": percentile(r, 95),
+            "max": r[-1],
+        }
+    for name, values in gauges.items():
+        e, metric = element(name)
+        s = sorted(values)
+        e["gauges"][metric] = {
+            "last": values[-1],
+            "min": s[0],
+            "avg": sum(s) / len(s),
+            "p95": percentile(s, 95),
+            "max": s[-1],
+        }
+    for name, values in timers.items():
+        e, metric = element(name)
+        s = sorted(values)
+        e["timers"][metric] = {
+            "count": len(s),
+            "p50": percentile(s, 50),
+            "p95": percentile(s, 95),
+            "p99": percentile(s, 99),
+            "max": s[-1],
+        }
+    return ret
+
+
+def fmt(value):
+    if isinstance(value, int) or value == int(value):
+        return str(int(value))
+    return f"{value:.2f}"
+
+
+def table(title, columns, rows):
+    width = max([len(title)] + [len(name) for name, _ in rows])
+    lines = [f"  {title:<{width}} " + " ".join(f"{c:>9}" for c in columns)]
+    for name, values in rows:
+        lines.append(f"  {name:<{width}} " + " ".join(f"{fmt(values[c]):>9}" for c in columns))
+    return lines
+
+
+def report(args):
+    intervals = load(args.file)
+    if not intervals:
+        print(f"No metrics in {args.file}")
+        sys.exit(1)
+    summary = summarize(intervals)
+    if args.json:
+        print(json.dumps(summary, indent=1, sort_keys=True))
+        return
+
+    t_start = intervals[0]["t"] - intervals[0]["dt"]
+    t_end = intervals[-1]["t"]
+    start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t_start))
+    end = time.strftime("%H:%M:%S", time.localtime(t_end))
+    lines = [f"Metrics from {start} to {end} ({t_end - t_start:.0f}s, {len(intervals)} intervals)"]
+    failures = []
+    for elem in sorted(summary):
+        e = summary[elem]
+        lines += ["", f"== {elem}"]
+        counters = sorted((name, c) for name, c in e["counters"].items() if c["total"] or args.all)
+        if counters:
+            lines += table("counter (rates per second)", ("total", "rate", "p50", "p95", "max"), counters)
+        if e["gauges"]:
+            lines += table("gauge", ("last", "min", "avg", "p95", "max"), sorted(e["gauges"].items()))
+        if e["timers"]:
+            lines += table("timer (ms)", ("count", "p50", "p95", "p99", "max"), sorted(e["timers"].items()))
+        failures += [(f"{elem}.{name}", c) for name, c in counters if c["total"] and failure_re.search(name)]
+    lines += ["", "== failures"]
+    lines += table("counter (rate per second)", ("total", "rate"), failures) if failures else ["  none"]
+    print("\n".join(lines))
+
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+sub = parser.add_subparsers(dest="action", required=True)
+p_run = sub.add_parser("run", help="receive metrics until SIGTERM/SIGINT")
+p_run.add_argument("-l", "--listen", default="127.0.0.1:9125", help="IP:PORT to listen on (default: %(default)s)")
+p_run.add_argument("-o", "--output", default="current_log/statsd.jsonl", help="default: %(default)s")
+p_run.add_argument(
+    "-i", "--interval", type=float, default=5, help="seconds per line in the output (default: %(default)s)"
+)
+p_report = sub.add_parser("report", help="summarize metrics written by 'run'")
+p_report.add_argument("file", nargs="?", default="current_log/statsd.jsonl", help="default: %(default)s")
+p_report.add_argument("-a", "--all", action="store_true", help="also list counters that did not count")
+p_report.add_argument("--json", action="store_true", help="write the summary as JSON")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.action == "run":
+        run(args)
+    else:
+        report(args)
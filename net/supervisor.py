@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""Run the programs of a network headless, as an alternative to one terminal
+window per program (TERMINAL="supervisor" in the net config, see README).
+
+"supervisor.py run LIST" starts each program of LIST, one "TITLE<tab>COMMAND"
+per line, restarts programs that exit (waiting longer after each quick
+failure) and writes the output of each program to LOG_DIR/TITLE.log, rotated
+by size. SIGTERM or SIGINT stops all programs.
+
+"supervisor.py status" shows the state of each program, and whether its VTY
+accepts connections."""
+
+import argparse
+import json
+import os
+import re
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+# VTY ports of Osmocom programs (osmo_ports.h), by program name
+VTY_PORTS = {
+    "osmo-stp": 4239,
+    "osmo-pcu": 4240,
+    "osmo-bts": 4241,
+    "osmo-bsc": 4242,
+    "osmo-mgw": 4243,
+    "osmo-sgsn": 4245,
+    "osmo-gbproxy": 4246,
+    "mobile": 4247,
+    "osmo-msc": 4254,
+    "osmo-sip-connector": 4256,
+    "osmo-hlr": 4258,
+    "osmo-ggsn": 4260,
+    "osmo-hnbgw": 4261,
+}
+
+line_vty_bind_re = re.compile(r"^line vty\n(?:[ \t]+.*\n)*?[ \t]+bind[ \t]+(\S+)(?:[ \t]+([0-9]+))?", re.MULTILINE)
+
+
+def vty_addr(cmd):
+    """Guess the (ip, port) of the VTY of a program from its command line and
+    config file, None if it has no VTY."""
+    try:
+        words = shlex.split(cmd)
+    except ValueError:
+        return None
+    # skip wrappers like "VAR=val", gdb, valgrind
+    for i, word in enumerate(words):
+        prog = os.path.basename(word)
+        port = VTY_PORTS.get(prog)
+        if port is None and prog.startswith("osmo-bts-"):
+            prog, port = "osmo-bts", VTY_PORTS["osmo-bts"]
+        if port is None:
+            continue
+        cfg = prog + ".cfg"
+        rest = words[i + 1 :]
+        for opt in ("-c", "--config-file"):
+            if opt in rest[:-1]:
+                cfg = rest[rest.index(opt) + 1]
+        ip = "127.0.0.1"
+        try:
+            with open(cfg) as f:
+                m = line_vty_bind_re.search(f.read())
+            if m:
+                ip = m.group(1)
+                if m.group(2):
+                    port = int(m.group(2))
+        except OSError:
+            pass
+        return ip, port
+    return None
+
+
+def vty_ready(addr):
+    try:
+        with socket.create_connection(addr, timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+
+class RotatingLog:
+    def __init__(self, path, max_bytes, keep):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.f = open(path, "ab")  # noqa: SIM115
+
+    def write(self, data):
+        self.f.write(data)
+        self.f.flush()
+        if self.max_bytes and self.f.tell() >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.f.close()
+        for i in range(self.keep - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.keep:
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+        self.f = open(self.path, "ab")  # noqa: SIM115
+
+
+class Program:
+    def __init__(self, title, cmd, args):
+        self.title = title
+        self.cmd = cmd
+        self.args = args
+        self.proc = None
+        self.started = None
+        self.restarts = 0
+        self.failures = 0
+        self.next_start = 0
+        self.last_exit = None
+        self.vty = vty_addr(cmd)
+        self.ready = False
+        self.stopped = False
+        self.log = RotatingLog(os.path.join(args.log_dir, title + ".log"), args.log_max_size, args.log_keep)
+
+    def start(self):
+        self.log.write(f"\n=== {time.strftime('%Y-%m-%d %H:%M:%S')}: {self.cmd}\n".encode())
+        # Not "exec CMD", it fails for "VAR=val prog" commands. Signals reach
+        # the program through its process group, see stop() and kill().
+        self.proc = subprocess.Popen(
+            ["sh", "-c", self.cmd],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+        self.started = time.monotonic()
+        self.ready = False
+        threading.Thread(target=self.read_output, args=(self.proc,), daemon=True).start()
+
+    def read_output(self, proc):
+        for data in iter(lambda: proc.stdout.read1(65536), b""):
+            self.log.write(data)
+
+    def poll(self, stopping):
+        """Restart the program if it has exited, update readiness."""
+        now = time.monotonic()
+        if self.proc and self.proc.poll() is not None:
+            self.last_exit = self.proc.returncode
+            runtime = now - self.started
+            self.proc = None
+            if stopping:
+                return
+            # a program that ran for a while is restarted right away, one that
+            # keeps failing quickly gets restarted less and less often
+            self.failures = self.failures + 1 if runtime < self.args.min_uptime else 0
+            delay = min(self.args.max_backoff, 2 ** (self.failures - 1)) if self.failures else 0
+            self.next_start = now + delay
+            log(f"{self.title} exited with {self.last_exit} after {runtime:.1f}s, restarting in {delay:.0f}s")
+        if not self.proc and not stopping and now >= self.next_start:
+            if self.started is not None:
+                self.restarts += 1
+            self.start()
+        if self.proc and self.vty and not self.ready:
+            self.ready = vty_ready(self.vty)
+            if self.ready:
+                log(f"{self.title} ready after {now - self.started:.1f}s")
+
+    def stop(self):
+        self.stopped = True
+        if self.proc and self.proc.poll() is None:
+            os.killpg(self.proc.pid, signal.SIGTERM)
+
+    def kill(self):
+        if self.proc and self.proc.poll() is None:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+
+    def status(self):
+        if not self.proc:
+            state = "backoff" if self.started is not None and not self.stopped else "stopped"
+        elif self.vty is None:
+            state = "running"
+        else:
+            state = "ready" if self.ready else "starting"
+        return {
+            "title": self.title,
+            "state": state,
+            "pid": self.proc.pid if self.proc else None,
+            "uptime": int(time.monotonic() - self.started) if self.proc else None,
+            "restarts": self.restarts,
+            "last_exit": self.last_exit,
+            "vty": f"{self.vty[0]}:{self.vty[1]}" if self.vty else None,
+            "cmd": self.cmd,
+        }
+
+
+def log(msg):
+    print(f"[supervisor] {msg}", flush=True)
+
+
+def read_list(path):
+    programs = []
+    with open(path) as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            title, cmd = line.split("\t", 1)
+            programs.append((title, cmd))
+    return programs
+
+
+def write_state(path, programs):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"pid": os.getpid(), "time": time.time(), "programs": [p.status() for p in programs]}, f, indent=1)
+    os.replace(tmp, path)
+
+
+def run(args):
+    os.makedirs(args.log_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(os.path.abspath(args.state)), exist_ok=True)
+    programs = [Program(title, cmd, args) for title, cmd in read_list(args.list)]
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *a: stopping.set())
+    signal.signal(signal.SIGINT, lambda *a: stopping.set())
+
+    t_start = time.monotonic()
+    all_ready = False
+    while not stopping.is_set():
+        for p in programs:
+            p.poll(False)
+        if not all_ready and all(p.status()["state"] in ("ready", "running") for p in programs):
+            all_ready = True
+            log(f"all {len(programs)} programs up after {time.monotonic() - t_start:.1f}s")
+        write_state(args.state, programs)
+        stopping.wait(args.interval)
+
+    log("stopping")
+    for p in programs:
+        p.stop()
+    deadline = time.monotonic() + 5
+    while any(p.proc and p.proc.poll() is None for p in programs) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    for p in programs:
+        p.kill()
+        p.poll(True)
+    write_state(args.state, programs)
+
+
+def status(args):
+    try:
+        with open(args.state) as f:
+            state = json.load(f)
+    except OSError as e:
+        print(f"No supervisor state: {e}")
+        sys.exit(1)
+    try:
+        os.kill(state["pid"], 0)
+    except OSError:
+        print(f"Supervisor (pid {state['pid']}) is not running, last state:")
+    fmt = "{:<12} {:<9} {:>8} {:>9} {:>8} {:<21}"
+    print(fmt.format("TITLE", "STATE", "PID", "UPTIME", "RESTARTS", "VTY"))
+    not_ready = 0
+    for p in state["programs"]:
+        uptime = f"{p['uptime']}s" if p["uptime"] is not None else "-"
+        print(fmt.format(p["title"], p["state"], p["pid"] or "-", uptime, p["restarts"], p["vty"] or "-"))
+        if p["state"] not in ("ready", "running"):
+            not_ready += 1
+    if not_ready:
+        sys.exit(1)
+
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument(
+    "--state",
+    default="run/supervisor.json",
+    help="where the supervisor keeps the state of all programs (default: %(default)s)",
+)
+sub = parser.add_subparsers(dest="action", required=True)
+p_run = sub.add_parser("run", help="run the programs in LIST until SIGTERM/SIGINT")
+p_run.add_argument("list", metavar="LIST")
+p_run.add_argument("--log-dir", default="current_log", help="default: %(default)s")
+p_run.add_argument(
+    "--log-max-size",
+    type=int,
+    default=50 * 1024 * 1024,
+    help="rotate a program's log after this many bytes, 0 to never rotate (default: %(default)s)",
+)
+p_run.add_argument("--log-keep", type=int, default=3, help="rotated logs to keep per program (default: %(default)s)")
+p_run.add_argument(
+    "--min-uptime",
+    type=float,
+    default=30,
+    help="a program that exits earlier than this many seconds counts as failing (default: %(default)s)",
+)
+p_run.add_argument(
+    "--max-backoff",
+    type=float,
+    default=60,
+    help="wait at most this many seconds before restarting a failing program (default: %(default)s)",
+)
+p_run.add_argument("--interval", type=float, default=1, help=argparse.SUPPRESS)
+sub.add_parser("status", help="show the state of all programs, exit nonzero if not all are up")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.action == "run":
+        run(args)
+    else:
+        status(args)
@@ -1,9 +1,20 @@
 import json
 import os
 import subprocess
+import time
+
+try:
+	from . import mslookup_resolver
+except ImportError:
+	# running as script, see __main__ below
+	import mslookup_resolver
 
 script_dir = os.path.dirname(__file__)
 timeout_ms = 2000
+# which SIP endpoint of an mslookup result to try first: 'v4' or 'v6'
+prefer_ip = 'v4'
+# how often to check for the lookup result while the caller is waiting
+poll_ms = 20
 
 def query_mslookup(query_str):
 	result_line = subprocess.check_output([
@@ -12,39 +23,135 @@ def query_mslookup(query_str):
 		result_line = result_line.decode('ascii')
 	return json.loads(result_line)
 
-def query_mslookup_msisdn(msisdn):
-	return query_mslookup('sip.voice.%s.msisdn' % str(msisdn))
+def msisdn_query_str(msisdn):
+	return 'sip.voice.%s.msisdn' % str(msisdn)
+
+def lookup_msisdn(session, msisdn, use_cache=True):
+	'''Return (result, cached) for msisdn, or (None, False) if the caller hung
+	up while waiting. The lookup runs in the long-lived osmo-mslookup-client
+	shared by all calls, meanwhile the caller hears ringing. Results (also for
+	unknown numbers) are cached in mslookup_resolver.cache, which outlives
+	reloads of this module.'''
+	query_str = msisdn_query_str(msisdn)
+	cache = mslookup_resolver.cache
+	if use_cache:
+		result = cache.get(query_str)
+		if result is not None:
+			return result, True
+
+	resolver = mslookup_resolver.get_resolver(timeout_ms)
+	try:
+		req = resolver.query_async(query_str)
+	except mslookup_resolver.MslookupError as e:
+		if resolver.proc:
+			raise
+		print('[dialplan-dgsm] ' + str(e) + ', running osmo-mslookup-client for this query')
+		result = query_mslookup(query_str)
+	else:
+		result = resolver.wait(query_str, req, poll_ms / 1000)
+		if result is None:
+			session.execute('ring_ready')
+		# the client answers at its own timeout at the latest
+		deadline = time.monotonic() + timeout_ms / 1000 + 1
+		while result is None:
+			if not session.ready():
+				return None, False
+			if time.monotonic() > deadline:
+				resolver.cancel(query_str, req)
+				raise mslookup_resolver.MslookupError('no result for %r' % query_str)
+			# keeps the session's media going, unlike blocking on the result
+			session.sleep(poll_ms)
+			result = resolver.wait(query_str, req, 0)
+
+	cache.put(query_str, result)
+	return result, False
+
+def dial_str(msisdn, result):
+	'''Return the bridge dial string for the SIP endpoints in the mslookup
+	result, prefer_ip first, or None if there are none. FreeSWITCH tries the
+	next endpoint after "|" if one fails.'''
+	families = ['v4', 'v6']
+	if prefer_ip == 'v6':
+		families.reverse()
+	endpoints = []
+	for family in families:
+		if not result.get(family):
+			continue
+		sip_ip, sip_port = result[family]  # osmo-dev defaults: same as ${SIPCON_LOCAL}
+		if family == 'v6':
+			sip_ip = '[' + sip_ip + ']'
+		endpoints.append('sofia/internal/sip:{}@{}:{}'.format(msisdn, sip_ip, sip_port))
+	return '|'.join(endpoints) or None
+
+def bridge(session, dial_str):
+	'''Return False if the bridge failed.'''
+	print('[dialplan-dgsm] dial_str: ' + str(dial_str))
+	session.execute('bridge', dial_str)
+	disposition = session.getVariable('originate_disposition')
+	print('[dialplan-dgsm] bridge: ' + str(disposition))
+	return disposition in ('SUCCESS', 'ORIGINATOR_CANCEL')
 
 def handler(session, args):
 	print('[dialplan-dgsm] handler')
 	msisdn = session.getVariable('destination_number')
 	print('[dialplan-dgsm] resolving: sip.voice.' + str(msisdn) + '.msisdn')
 
-	# Run mslookup.py. In theory, we should be able to import it and call mslookup.resolve() directly, however this
-	# has lead to hard-to-debug segfaults when calling it the second time. For now, use a separate python process.
+	# Ask osmo-mslookup-client. In theory, we should be able to import mslookup.py and call mslookup.resolve()
+	# directly, however this has lead to hard-to-debug segfaults when calling it the second time. Instead, one
+	# osmo-mslookup-client process runs in the background for all calls (see mslookup_resolver.py).
 	try:
-		result = query_mslookup_msisdn(msisdn)
-
-		print('[dialplan-dgsm] result: ' + str(result))
+		started = time.monotonic()
+		result, cached = lookup_msisdn(session, msisdn)
+		latency_ms = (time.monotonic() - started) * 1000
+		mslookup_resolver.latency.add(latency_ms)
+		if result is None:
+			print('[dialplan-dgsm] caller hung up during lookup after %d ms' % latency_ms)
+			return
+		print('[dialplan-dgsm] result after %d ms%s: %s' % (latency_ms, ' (cached)' if cached else '', result))
 
-		# This example only makes use of IPv4
-		if not result['v4']:
-			print('[dialplan-dgsm] no IPv4 result from mslookup')
+		dial = dial_str(msisdn, result)
+		if not dial:
+			# the negative result stays cached, see ResultCache
+			print('[dialplan-dgsm] no SIP endpoint in mslookup result')
 			session.hangup('UNALLOCATED_NUMBER')
 			return
+		if bridge(session, dial):
+			return
 
-		sip_ip, sip_port = result['v4']  # osmo-dev defaults: same as ${SIPCON_LOCAL}
-		dial_str = 'sofia/internal/sip:{}@{}:{}'.format(msisdn, sip_ip, sip_port)
-		print('[dialplan-dgsm] dial_str: ' + str(dial_str))
+		# The subscriber may have moved since the result was cached: drop it
+		# and, if the caller is still there, try once more with a fresh lookup.
+		mslookup_resolver.cache.invalidate(msisdn_query_str(msisdn))
+		if cached and session.ready():
+			result, cached = lookup_msisdn(session, msisdn, use_cache=False)
+			print('[dialplan-dgsm] result: ' + str(result))
+			dial = result and dial_str(msisdn, result)
+			if dial and bridge(session, dial):
+				return
+			mslookup_resolver.cache.invalidate(msisdn_query_str(msisdn))
 
-		session.execute('bridge', dial_str)
+		if session.ready():
+			session.hangup('UNALLOCATED_NUMBER')
 	except:
 		print('[dialplan-dgsm]: could not resolve MSISDN {} with mslookup.py'.format(msisdn))
 		session.hangup('UNALLOCATED_NUMBER')
 
 
-# Freeswitch refuses to load the module without this
+# Freeswitch refuses to load the module without this.
+# "python dialplan-dgsm cache" shows the MSISDN cache counters, "cache flush"
+# empties it. "latency" shows the histogram of lookup latencies per call,
+# "latency clear" resets it.
 def fsapi(session, stream, env, args):
+	args = (args or '').split()
+	if args[:1] == ['cache']:
+		if args[1:] == ['flush']:
+			mslookup_resolver.cache.clear()
+		stream.write(mslookup_resolver.cache.report())
+		return
+	if args[:1] == ['latency']:
+		if args[1:] == ['clear']:
+			mslookup_resolver.latency.clear()
+		stream.write(mslookup_resolver.latency.report())
+		return
 	stream.write(env.serialize())
 
 if __name__ == '__main__':
@@ -0,0 +1,299 @@
+# Long-lived osmo-mslookup-client, shared by all calls that dialplan-dgsm
+# handles. This is a separate module, so that it survives FreeSWITCH's
+# mod_python reloading the dialplan-dgsm module for each call.
+import atexit
+import collections
+import json
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+class MslookupError(Exception):
+	pass
+
+class Request:
+	def __init__(self):
+		self.done = threading.Event()
+		self.result = None
+		self.error = None
+
+	def finish(self, result=None, error=None):
+		self.result = result
+		self.error = error
+		self.done.set()
+
+class Resolver:
+	'''Run osmo-mslookup-client in daemon mode (--socket) and send all queries
+	to it over one unix domain socket connection, instead of spawning a new
+	client process (and a new multicast socket) for each call. Calls waiting
+	for the same query share one lookup.'''
+
+	def __init__(self, timeout_ms, client='osmo-mslookup-client'):
+		self.timeout_ms = timeout_ms
+		self.client = client
+		self.sock_path = os.path.join(tempfile.gettempdir(), 'dialplan-dgsm-mslookup.%d.sock' % os.getpid())
+		self.lock = threading.Lock()
+		self.proc = None
+		self.sock = None
+		self.start_failed = None
+		# queries sent to the client and not answered yet: {query_str: Request}
+		self.pending = {}
+
+	def start(self):
+		'Start the client and connect to it, with self.lock held.'
+		# don't try to start a client that fails (e.g. too old for --socket) for each call
+		if self.start_failed and time.monotonic() - self.start_failed < 60:
+			raise MslookupError('%s failed to start recently' % self.client)
+		self.start_failed = time.monotonic()
+
+		if os.path.exists(self.sock_path):
+			os.unlink(self.sock_path)
+
+		cmd = [self.client, '--socket', self.sock_path, '--format', 'json', '--timeout', str(self.timeout_ms)]
+		print('[dialplan-dgsm] starting: ' + ' '.join(cmd))
+		try:
+			self.proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL)
+		except OSError as e:
+			raise MslookupError('cannot start %s: %s' % (self.client, e))
+
+		deadline = time.monotonic() + 2
+		while True:
+			sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+			try:
+				sock.connect(self.sock_path)
+				break
+			except OSError:
+				sock.close()
+				if self.proc.poll() is not None or time.monotonic() > deadline:
+					self.stop()
+					raise MslookupError('%s did not open %s' % (self.client, self.sock_path))
+				time.sleep(0.01)
+
+		self.sock = sock
+		self.start_failed = None
+		threading.Thread(target=self.read_results, args=(sock,), daemon=True).start()
+
+	def stop(self, error='resolver stopped'):
+		'Stop the client and fail all pending requests, with self.lock held.'
+		if self.sock:
+			self.sock.close()
+			self.sock = None
+		if self.proc:
+			if self.proc.poll() is None:
+				self.proc.terminate()
+			self.proc = None
+		if os.path.exists(self.sock_path):
+			os.unlink(self.sock_path)
+		for req in self.pending.values():
+			req.finish(error=MslookupError(error))
+		self.pending = {}
+
+	def read_results(self, sock):
+		while True:
+			try:
+				data = sock.recv(65536)
+			except OSError:
+				data = b''
+			if not data:
+				with self.lock:
+					if self.sock is sock:
+						self.stop('%s closed the connection' % self.client)
+				return
+
+			for line in data.decode('utf-8', 'replace').splitlines():
+				if not line.strip():
+					continue
+				try:
+					result = json.loads(line)
+				except ValueError:
+					print('[dialplan-dgsm] invalid result from %s: %r' % (self.client, line))
+					continue
+				with self.lock:
+					if 'query' in result:
+						query_str = result['query']
+					elif self.pending:
+						# results are expected to carry the query, otherwise
+						# assume they arrive in order
+						query_str = next(iter(self.pending))
+					else:
+						query_str = None
+					req = self.pending.pop(query_str, None)
+				if req is None:
+					# e.g. a late result of a query that was cancelled, it
+					# must not complete another caller's lookup
+					print('[dialplan-dgsm] dropping result of unknown query from %s: %r' % (self.client, line))
+					continue
+				req.finish(result=result)
+
+	def query_async(self, query_str):
+		'''Send one mslookup query without waiting for the result. Return a
+		Request, its done event gets set when the result is there.'''
+		with self.lock:
+			if not self.sock:
+				self.start()
+			req = self.pending.get(query_str)
+			if req is None:
+				req = Request()
+				self.pending[query_str] = req
+				try:
+					self.sock.send(query_str.encode())
+				except OSError as e:
+					self.stop('cannot send to %s: %s' % (self.client, e))
+			return req
+
+	def wait(self, query_str, req, timeout=None):
+		'''Wait for the result of query_async(), at most timeout seconds. Return
+		None if it is not there yet.'''
+		if not req.done.wait(timeout):
+			return None
+		if req.error:
+			raise req.error
+		return req.result
+
+	def cancel(self, query_str, req):
+		with self.lock:
+			if self.pending.get(query_str) is req:
+				del self.pending[query_str]
+
+	def query(self, query_str):
+		'''Return the JSON result of one mslookup query, like
+		osmo-mslookup-client -f json would print it.'''
+		req = self.query_async(query_str)
+		# the client answers at its own timeout at the latest
+		result = self.wait(query_str, req, self.timeout_ms / 1000 + 1)
+		if result is None:
+			self.cancel(query_str, req)
+			raise MslookupError('no result for %r' % query_str)
+		return result
+
+class ResultCache:
+	'''Bounded LRU cache of mslookup results by query. A result is kept until
+	it is ttl seconds old, counting the age that mslookup reports for it.
+	Results without an address (unknown numbers) are kept for negative_ttl.'''
+
+	def __init__(self, size=1000, ttl=60, negative_ttl=10):
+		self.size = size
+		self.ttl = ttl
+		self.negative_ttl = negative_ttl
+		self.lock = threading.Lock()
+		# {query_str: (expires, result)}, least recently used first
+		self.entries = collections.OrderedDict()
+		self.stats = collections.Counter()
+
+	def get(self, query_str):
+		with self.lock:
+			entry = self.entries.get(query_str)
+			if entry and entry[0] <= time.monotonic():
+				del self.entries[query_str]
+				self.stats['expired'] += 1
+				entry = None
+			if entry is None:
+				self.stats['misses'] += 1
+				return None
+			self.entries.move_to_end(query_str)
+			self.stats['negative_hits' if is_negative(entry[1]) else 'hits'] += 1
+			return entry[1]
+
+	def put(self, query_str, result):
+		if is_negative(result):
+			lifetime = self.negative_ttl
+		else:
+			lifetime = self.ttl - (result.get('age') or 0)
+		if lifetime <= 0:
+			return
+		with self.lock:
+			self.entries[query_str] = (time.monotonic() + lifetime, result)
+			self.entries.move_to_end(query_str)
+			while len(self.entries) > self.size:
+				self.entries.popitem(last=False)
+
+	def invalidate(self, query_str):
+		with self.lock:
+			if self.entries.pop(query_str, None):
+				self.stats['invalidated'] += 1
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+	def report(self):
+		with self.lock:
+			lines = ['entries: %d/%d' % (len(self.entries), self.size)]
+			for name in ('hits', 'negative_hits', 'misses', 'expired', 'invalidated'):
+				lines.append('%s: %d' % (name, self.stats[name]))
+			return '\n'.join(lines) + '\n'
+
+class LatencyHistogram:
+	'''Count lookup latencies of calls in buckets of milliseconds.'''
+	buckets = (1, 10, 50, 100, 250, 500, 1000, 2000, 5000)
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.counts = [0] * (len(self.buckets) + 1)
+		self.total_ms = 0
+
+	def clear(self):
+		with self.lock:
+			self.counts = [0] * (len(self.buckets) + 1)
+			self.total_ms = 0
+
+	def add(self, ms):
+		with self.lock:
+			i = 0
+			while i < len(self.buckets) and ms > self.buckets[i]:
+				i += 1
+			self.counts[i] += 1
+			self.total_ms += ms
+
+	def label(self, i):
+		if i < len(self.buckets):
+			return '<= %d ms' % self.buckets[i]
+		return '> %d ms' % self.buckets[-1]
+
+	def percentile(self, p):
+		'''Return the index of the bucket that the p-th percentile of the
+		latencies falls into, with self.lock held.'''
+		target = sum(self.counts) * p / 100
+		seen = 0
+		for i, count in enumerate(self.counts):
+			seen += count
+			if count and seen >= target:
+				return i
+		return len(self.counts) - 1
+
+	def report(self):
+		with self.lock:
+			calls = sum(self.counts)
+			lines = ['calls: %d' % calls]
+			if calls:
+				lines.append('avg: %d ms' % (self.total_ms / calls))
+				for p in (50, 90, 99):
+					lines.append('p%d: %s' % (p, self.label(self.percentile(p))))
+			for i, count in enumerate(self.counts):
+				lines.append('%s: %d' % (self.label(i), count))
+			return '\n'.join(lines) + '\n'
+
+def is_negative(result):
+	return not result.get('v4') and not result.get('v6')
+
+resolver = None
+resolver_lock = threading.Lock()
+cache = ResultCache()
+latency = LatencyHistogram()
+
+def get_resolver(timeout_ms):
+	'Return the resolver shared by all calls, create it on first use.'
+	global resolver
+	with resolver_lock:
+		if resolver is None:
+			resolver = Resolver(timeout_ms)
+			atexit.register(shutdown)
+		return resolver
+
+def shutdown():
+	if resolver:
+		with resolver.lock:
+			resolver.stop()
@@ -19,12 +19,22 @@ trap exit_confirm EXIT INT TERM 0
 
 if ! ../fill_config.py --check-stale; then
 	echo
-	echo "WARNING: STALE CONFIGS - your net configs are older than the templates they should be based on!"
+	echo "WARNING: STALE CONFIGS - your net configs are out of date with the config and templates they are based on!"
 	echo " * Hit enter to continue, and use the stale config files"
 	echo " * Hit ^C and run 'make regen' to regenerate your configs"
 	read enter_to_continue
 fi
 
+if [ "${HLR_SUBSCR_NUM}" -gt 0 ]; then
+  ../hlr_db_gen.py \
+    --count "${HLR_SUBSCR_NUM}" \
+    --id "${HLR_SUBSCR_ID}" \
+    --imsi "${HLR_SUBSCR_IMSI}" \
+    --msisdn "${HLR_SUBSCR_MSISDN}" \
+    --ki "${HLR_SUBSCR_KI}" \
+    || exit 1
+fi
+
 dev="${ETH_DEV}"
 apn="${APN_DEV}"
 
@@ -75,7 +85,7 @@ mkdir -p "$logdir" "$piddir" "$launcherdir"
 
 find_term() {
   # Find a terminal program and write to the global "terminal" variable
-  local programs="urxvt xterm tmux"
+  local programs="urxvt xterm tmux supervisor"
 
   if [ -z "${TERMINAL}" ]; then
     echo "ERROR: TERMINAL is not defined in your osmo-dev net config file. Please add it."
@@ -86,7 +96,7 @@ find_term() {
     *" ${TERMINAL} "*)
       terminal="${TERMINAL}"
 
-      if command -v "$terminal" >/dev/null; then
+      if [ "$terminal" = "supervisor" ] || command -v "$terminal" >/dev/null; then
         echo "Terminal: ${TERMINAL}"
         return
       fi
@@ -120,6 +130,12 @@ term() {
     title="$(basename $@)"
   fi
 
+  if [ "$terminal" = "supervisor" ]; then
+    # started all at once by supervisor_start
+    printf '%s\t%s\n' "$title" "$1" >> "$launcherdir/supervisor.list"
+    return
+  fi
+
   local pidfile="$piddir/$title.pid"
   local pidfile_term="$piddir/$title.term.pid"
   pidfiles_must_not_exist "$pidfile" "$pidfile_term"
@@ -181,6 +197,140 @@ kill_pids() {
   done
 }
 
+supervisor_start() {
+  local pidfile="$piddir/supervisor.pid"
+  pidfiles_must_not_exist "$pidfile"
+
+  echo "Starting all programs headless, see $logdir/supervisor.log and $logdir/<program>.log"
+  LD_LIBRARY_PATH='/usr/local/lib' ../supervisor.py run "$launcherdir/supervisor.list" \
+    --log-dir "$logdir" \
+    > "$logdir/supervisor.log" 2>&1 &
+  echo "$!" > "$pidfile"
+  echo "Show the state of all programs with: ../supervisor.py status"
+}
+
+supervisor_stop() {
+  local pidfile="$piddir/supervisor.pid"
+  if ! [ -e "$pidfile" ]; then
+    return
+  fi
+
+  # let the supervisor stop all programs, before logs get moved below
+  kill "$(cat "$pidfile")"
+  wait "$(cat "$pidfile")"
+  rm "$pidfile"
+}
+
+# RTP ports of all osmo-mgw (rtp net-range) and osmo-bts (default port-range)
+pcap_rtp="udp portrange 10004-20000 or udp portrange 40004-50000 or udp portrange 50004-60000"
+pcap_rtp="$pcap_rtp or udp portrange 16384-17407"
+${foreach(MGW4BSC)}
+pcap_rtp="$pcap_rtp or udp portrange $(echo ${MGW4BSCn_RTP_RANGE} | tr ' ' '-')"
+${foreach_end}
+
+pcap_filter() {
+  # Print the tcpdump filter for the protocols in PCAP_PROTOCOLS, for the
+  # control plane ("cp"), user plane ("up", RTP and GTP-U) or both ("all")
+  local plane="$1"
+  local filter=""
+  local proto
+  local f
+
+  for proto in ${PCAP_PROTOCOLS}; do
+    case "$plane $proto" in
+      "all all") f="not port 22" ;;
+      "cp all") f="not port 22 and not udp port 2152 and not ($pcap_rtp)" ;;
+      "up all") f="udp port 2152 or $pcap_rtp" ;;
+      *" abis") f="tcp port 3002 or tcp port 3003" ;;
+      *" a") f="sctp port 2905" ;;
+      *" iu") f="sctp port 2905 or sctp port 29169" ;;
+      *" gb") f="udp port ${SGSN_GB_PORT} or udp port ${GBPROXY_GB_PORT}" ;;
+      "cp gtp") f="udp port 2123" ;;
+      "up gtp") f="udp port 2152" ;;
+      "all gtp") f="udp port 2123 or udp port 2152" ;;
+      "up rtp"|"all rtp") f="$pcap_rtp" ;;
+      *" mgcp") f="udp port 2427 or udp port 2727" ;;
+      *" gsup") f="tcp port 4222" ;;
+      *" sip") f="port ${SIPCON_SIP_PORT} or port ${PBX_SIP_PORT}" ;;
+      *) f="" ;;
+    esac
+    # user plane packets only come from the "up" capture
+    case "$plane $proto" in
+      "up abis"|"up a"|"up iu"|"up gb"|"up mgcp"|"up gsup"|"up sip"|"cp rtp") f="" ;;
+    esac
+    if [ -n "$f" ]; then
+      filter="${filter:+$filter or }($f)"
+    fi
+  done
+  echo "$filter"
+}
+
+pcap_check_protocols() {
+  local proto
+  for proto in ${PCAP_PROTOCOLS}; do
+    case "$proto" in
+      all|abis|a|iu|gb|gtp|rtp|mgcp|gsup|sip) ;;
+      *)
+        echo "ERROR: unknown protocol '$proto' in PCAP_PROTOCOLS"
+        exit 1
+        ;;
+    esac
+  done
+}
+
+pcap_start() {
+  # Capture on interface $1 the packets of plane $2 (see pcap_filter), truncated to snaplen $3
+  local iface="$1"
+  local plane="$2"
+  local snaplen="$3"
+  local pidfile="$piddir/tcpdump.$iface.$plane.pid"
+  local filter="$(pcap_filter "$plane")"
+  local opts="-s $snaplen"
+
+  if [ -z "$filter" ]; then
+    return
+  fi
+  pidfiles_must_not_exist "$pidfile"
+
+  if [ "${PCAP_FILE_SIZE}" -gt 0 ]; then
+    # ring buffer: new file every PCAP_FILE_SIZE MB, keep PCAP_FILE_COUNT
+    opts="$opts -C ${PCAP_FILE_SIZE}"
+    if [ "${PCAP_FILE_COUNT}" -gt 0 ]; then
+      opts="$opts -W ${PCAP_FILE_COUNT}"
+    fi
+  fi
+  if [ "${PCAP_UNBUFFERED}" = 1 ]; then
+    opts="$opts -U"
+  fi
+
+  # -Z: write (and rotate) the files as the user running this script
+  sudo tcpdump -i "$iface" -n -Z "$USER" $opts -w "$pcapdir/$iface.$plane.pcap" "$filter" &
+  echo "$!" > "$pidfile"
+}
+
+statsd_start() {
+  local pidfile="$piddir/statsd.pid"
+  pidfiles_must_not_exist "$pidfile"
+
+  ../statsd.py run \
+    --listen "${STATSD_IP}:${STATSD_PORT}" \
+    --output "$logdir/statsd.jsonl" \
+    > "$logdir/statsd.log" 2>&1 &
+  echo "$!" > "$pidfile"
+}
+
+statsd_stop() {
+  local pidfile="$piddir/statsd.pid"
+  if ! [ -e "$pidfile" ]; then
+    return
+  fi
+
+  # let it write the last interval before the report gets made
+  kill "$(cat "$pidfile")"
+  wait "$(cat "$pidfile")"
+  rm "$pidfile"
+}
+
 read_log_name() {
   log_name_last="$(ls -Art "log" | tail -n1)"
   if [ -n "$log_name_last" ]; then
@@ -221,14 +371,21 @@ if [ "x${MSC_MNCC}" != "xinternal" ]; then
   esac
 fi
 
-PIDFILE_TCPDUMP_DEV="$piddir/tcpdump.$dev.pid"
-PIDFILE_TCPDUMP_LO="$piddir/tcpdump.lo.pid"
-pidfiles_must_not_exist "$PIDFILE_TCPDUMP_DEV" "$PIDFILE_TCPDUMP_LO"
+pcap_check_protocols
+pcapdir="$logdir/pcap"
+mkdir -p "$pcapdir"
+for iface in $dev lo; do
+  if [ "${PCAP_USER_PLANE_SNAPLEN}" -gt 0 ]; then
+    pcap_start "$iface" cp 0
+    pcap_start "$iface" up "${PCAP_USER_PLANE_SNAPLEN}"
+  else
+    pcap_start "$iface" all 0
+  fi
+done
 
-sudo tcpdump -i $dev -n -w current_log/$dev.single.pcap -U not port 22 &
-echo "$!" > "$PIDFILE_TCPDUMP_DEV"
-sudo tcpdump -i lo -n -w current_log/lo.single.pcap -U not port 22 &
-echo "$!" > "$PIDFILE_TCPDUMP_LO"
+if [ "${STATSD_COLLECTOR}" = 1 ]; then
+  statsd_start
+fi
 
 term "${CMD_GGSN}" GGSN
 
@@ -288,6 +445,10 @@ if [ "x${MSC_MNCC}" != "xinternal" ]; then
   esac
 fi
 
+if [ "$terminal" = "supervisor" ]; then
+  supervisor_start
+fi
+
 #ssh bts rm /tmp/bts.log /tmp/pcu.log
 #ssh bts neels/run_remote.sh &
 
@@ -297,11 +458,17 @@ echo Closing...
 
 #ssh bts neels/stop_remote.sh
 
+supervisor_stop
+statsd_stop
 kill_pids
 
 set +e
 cp *.cfg "$logdir"/
 
+if [ -e "$logdir/statsd.jsonl" ]; then
+  ../statsd.py report "$logdir/statsd.jsonl" > "$logdir/statsd-report.txt"
+fi
+
 echo
 read_log_name
 if [ -n "$log_name" ]; then
@@ -313,8 +480,13 @@ else
 fi
 mkdir -p "$(dirname "$newlogdir")"
 
-mergecap -w "$logdir/trace.pcap" "$logdir/"*.single.pcap && rm -f "$logdir/"*.single.pcap
-mv "$logdir/trace.pcap" "$logdir/trace-$log_name.pcap"
+if [ "${PCAP_FILE_SIZE}" -gt 0 ]; then
+  # may be huge, merge only the part of interest with ../pcap_slice.py
+  echo "Packet captures are in pcap/ of the log dir, see: ../pcap_slice.py -h"
+elif mergecap -w "$logdir/trace.pcap" "$logdir/pcap/"*; then
+  rm -rf "$logdir/pcap"
+  mv "$logdir/trace.pcap" "$logdir/trace-$log_name.pcap"
+fi
 
 if [ -x "$newlogdir" ]; then
   echo "already exists, move it manually: $newlogdir"
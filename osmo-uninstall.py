@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Remove the files of Osmocom projects from an install prefix, as listed in
+the manifests that the install targets of the Makefile generated by
+gen_makefile.py --install-manifest write
+(PREFIX/share/osmo-dev/manifests/PROJECT.sha256, in sha256sum format).
+
+Only files with the sha256sum from the manifest get removed. Files that were
+modified after installing or that another project installed as well are kept,
+and so are directories that are not empty afterwards.
+
+With --stale, remove the files that a previous version of the project had
+installed, but the current version does not install anymore
+(PROJECT.stale.sha256). With --check, only list installed files that are
+missing or were modified."""
+
+import argparse
+import hashlib
+import os
+import sys
+
+
+def error(msg):
+    print(f"ERROR: {msg}")
+    sys.exit(1)
+
+
+def read_manifest(path):
+    """Return {installed path: sha256} from a file written by sha256sum."""
+    ret = {}
+    with open(path) as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            # sha256sum escapes file names with backslashes or newlines
+            escaped = line.startswith("\\")
+            if escaped:
+                line = line[1:]
+            sha256, name = line[:64], line[66:]
+            if escaped:
+                name = name.replace("\\n", "\n").replace("\\\\", "\\")
+            ret[name] = sha256
+    return ret
+
+
+def file_sha256(path):
+    """Return the sha256 of the file (for symlinks: of the file they point
+    to), or None if it does not exist."""
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            while chunk := f.read(1 << 20):
+                h.update(chunk)
+    except FileNotFoundError:
+        return None
+    return h.hexdigest()
+
+
+def remove_empty_dirs(dirs, prefix):
+    """Remove dirs and their parents below prefix, if they are empty."""
+    for d in sorted(dirs, key=len, reverse=True):
+        while d.startswith(prefix + "/"):
+            try:
+                os.rmdir(d)
+            except OSError:
+                break
+            d = os.path.dirname(d)
+
+
+def uninstall(proj, manifest_path, others, args):
+    files = read_manifest(manifest_path)
+    removed = []
+    kept = []
+    missing = []
+
+    # Check all files before removing any, symlinks may point to files of the
+    # same manifest
+    to_remove = []
+    for path, sha256 in files.items():
+        if not os.path.lexists(path):
+            missing.append(path)
+        elif path in others:
+            kept.append(f"{path} (also installed by {others[path]})")
+        elif os.path.islink(path) and not os.path.exists(path):
+            # dangling symlink
+            to_remove.append(path)
+        elif file_sha256(path) != sha256 and not args.force:
+            kept.append(f"{path} (modified)")
+        else:
+            to_remove.append(path)
+
+    if args.check:
+        for line in kept:
+            if line.endswith("(modified)"):
+                print(f"{proj}: {line}")
+        for path in missing:
+            print(f"{proj}: {path} (missing)")
+        return
+
+    for path in to_remove:
+        if args.verbose or args.dry_run:
+            print(f"{proj}: removing {path}")
+        if not args.dry_run:
+            os.unlink(path)
+        removed.append(path)
+    for line in kept:
+        print(f"{proj}: keeping {line}")
+
+    if not args.dry_run:
+        os.unlink(manifest_path)
+        dirs = {os.path.dirname(path) for path in removed + [manifest_path]}
+        remove_empty_dirs(dirs, args.prefix)
+
+    stale = "stale " if args.stale else ""
+    summary = f"{proj}: removed {len(removed)} {stale}files"
+    if kept:
+        summary += f", kept {len(kept)}"
+    if missing:
+        summary += f", {len(missing)} were missing"
+    print(summary + (" (dry run)" if args.dry_run else ""))
+
+
+def main(args):
+    args.prefix = os.path.abspath(args.prefix)
+    manifests_dir = os.path.join(args.prefix, "share/osmo-dev/manifests")
+    suffix = ".stale.sha256" if args.stale else ".sha256"
+
+    installed = sorted(
+        name.removesuffix(".sha256")
+        for name in (os.listdir(manifests_dir) if os.path.isdir(manifests_dir) else [])
+        if name.endswith(".sha256") and not name.endswith(".stale.sha256")
+    )
+    if args.all:
+        if args.projects:
+            error("pass either --all or project names")
+        projects = [p for p in installed if os.path.exists(os.path.join(manifests_dir, p + suffix))]
+    elif args.projects:
+        projects = args.projects
+    else:
+        error("pass project names or --all")
+    if not projects:
+        print(f"No manifests in {manifests_dir}")
+        return
+
+    # Files that stay installed: those of all other projects (and with
+    # --stale, the current files of the project itself)
+    others = {}
+    for proj in installed:
+        if proj in projects and not args.stale:
+            continue
+        for path in read_manifest(os.path.join(manifests_dir, proj + ".sha256")):
+            others[path] = proj
+
+    for proj in projects:
+        manifest_path = os.path.join(manifests_dir, proj + suffix)
+        if not os.path.exists(manifest_path):
+            if args.stale:
+                print(f"{proj}: no stale files")
+                continue
+            error(f"{proj}: not installed with a manifest: {manifest_path} does not exist")
+        uninstall(proj, manifest_path, others, args)
+
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("projects", metavar="PROJECT", nargs="*", help="e.g. libosmocore")
+parser.add_argument("-a", "--all", action="store_true", help="all projects with a manifest in the prefix")
+parser.add_argument("-p", "--prefix", default="/usr/local", help="install prefix (default: %(default)s)")
+parser.add_argument("-s", "--stale", action="store_true", help="remove stale files instead of the installed ones")
+parser.add_argument("-c", "--check", action="store_true", help="only list missing and modified files")
+parser.add_argument("-f", "--force", action="store_true", help="also remove modified files")
+parser.add_argument("-n", "--dry-run", action="store_true", help="only show what would be removed")
+parser.add_argument("-v", "--verbose", action="store_true", help="list each removed file")
+
+if __name__ == "__main__":
+    main(parser.parse_args())
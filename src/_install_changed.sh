@@ -0,0 +1,126 @@
+#!/bin/sh -e
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Move the files from a staging dir ("make install DESTDIR=...") into place,
+# but only the ones that differ from what is installed already. Unchanged files
+# keep their mtime, so projects that include installed headers don't recompile
+# everything after each install. Used by the install targets of gen_makefile.py
+# --install-manifest.
+#
+# The stamp files $STAMP_PREFIX.install_files and $STAMP_PREFIX.install_pc get
+# touched if any installed file / any pkg-config file changed. With
+# gen_makefile.py --install-changed-only, the Makefile of dependent projects
+# uses these instead of .make.$PROJ.install.
+#
+# $MANIFEST gets the sha256sum of each installed file, for osmo-uninstall.py.
+# Files listed in the previous manifest that are not installed anymore (e.g. a
+# library with an old soname) get added to the .stale.sha256 manifest next to
+# it.
+#
+# Set SUDO=sudo to install with sudo. DEST_DIR is only set by tests.
+
+STAGE_DIR="$1"
+STAMP_PREFIX="$2"
+MANIFEST="$3"
+DEST_DIR="${4-}"
+STALE_MANIFEST="${MANIFEST%.sha256}.stale.sha256"
+
+# Replace $1 with $2 in one rename, so running programs and processes reading
+# the old file are not affected
+replace_file() {
+	local dest="$1"
+	local tmp="$(dirname "$dest")/.osmo-dev-install.$(basename "$dest")"
+
+	if [ -L "$2" ]; then
+		$SUDO ln -sfn "$(readlink "$2")" "$tmp"
+	else
+		$SUDO cp --preserve=mode,timestamps "$2" "$tmp"
+	fi
+	$SUDO mv -Tf "$tmp" "$dest"
+}
+
+install_changed() {
+	local path
+	local dest
+
+	cd "$STAGE_DIR"
+	find . -mindepth 1 | sort | while IFS= read -r path; do
+		dest="$DEST_DIR/${path#./}"
+		if [ -d "$path" ] && ! [ -L "$path" ]; then
+			[ -d "$dest" ] || $SUDO mkdir -p "$dest"
+		elif [ -L "$path" ]; then
+			if [ "$(readlink "$path")" != "$(readlink "$dest")" ]; then
+				replace_file "$dest" "$path"
+				echo "$dest"
+			fi
+		elif [ -L "$dest" ] || ! cmp -s "$path" "$dest"; then
+			replace_file "$dest" "$path"
+			echo "$dest"
+		elif [ "$(stat -c %a "$path")" != "$(stat -c %a "$dest")" ]; then
+			$SUDO chmod "$(stat -c %a "$path")" "$dest"
+		fi
+	done
+	cd - >/dev/null
+}
+
+# Write the sha256sum of each file in the staging dir (symlinks: of the file
+# they point to) to $MANIFEST, with the installed paths
+write_manifest() {
+	local manifest_new="$(mktemp --suffix=-osmo-dev-manifest)"
+	local stale="$(mktemp --suffix=-osmo-dev-manifest-stale)"
+
+	(cd "$STAGE_DIR" && find . ! -type d -print0 | sort -z | xargs -0 -r sha256sum) \
+		| sed "s|^\([0-9a-f]*  \)\./|\1$DEST_DIR/|" \
+		>"$manifest_new"
+
+	# sha256sum lines: 64 hex chars, two spaces, path
+	if [ -e "$MANIFEST" ]; then
+		awk 'FILENAME == ARGV[1] { new[substr($0, 67)]; next } !(substr($0, 67) in new)' \
+			"$manifest_new" \
+			"$MANIFEST" \
+			>"$stale"
+	fi
+	if [ -s "$stale" ]; then
+		sed "s/^.\{66\}/stale (not installed anymore): /" "$stale"
+		echo "remove stale files with: osmo-uninstall.py --stale $(basename "${MANIFEST%.sha256}")"
+	fi
+
+	# Update the stale manifest, without files that got installed again
+	if [ -s "$stale" ] || [ -e "$STALE_MANIFEST" ]; then
+		cat "$STALE_MANIFEST" "$stale" 2>/dev/null \
+			| awk 'FILENAME == ARGV[1] { new[substr($0, 67)]; next } !(substr($0, 67) in new)' "$manifest_new" - \
+			| sort -u -k 2 \
+			>"$stale.all"
+		if [ -s "$stale.all" ]; then
+			$SUDO cp "$stale.all" "$STALE_MANIFEST"
+		else
+			$SUDO rm -f "$STALE_MANIFEST"
+		fi
+		rm "$stale.all"
+	fi
+
+	$SUDO mkdir -p "$(dirname "$MANIFEST")"
+	$SUDO cp "$manifest_new" "$MANIFEST.new"
+	$SUDO chmod 644 "$MANIFEST.new"
+	$SUDO mv "$MANIFEST.new" "$MANIFEST"
+	rm "$manifest_new" "$stale"
+}
+
+CHANGED="$(mktemp --suffix=-osmo-dev-install-changed)"
+install_changed >"$CHANGED"
+
+if [ -s "$CHANGED" ]; then
+	sed "s/^/installed: /" "$CHANGED"
+	touch "$STAMP_PREFIX.install_files"
+fi
+if grep -q '\.pc$' "$CHANGED"; then
+	touch "$STAMP_PREFIX.install_pc"
+fi
+for stamp in "$STAMP_PREFIX.install_files" "$STAMP_PREFIX.install_pc"; do
+	[ -e "$stamp" ] || touch "$stamp"
+done
+
+echo "$(wc -l <"$CHANGED") of $(find "$STAGE_DIR" ! -type d | wc -l) installed files changed"
+rm "$CHANGED"
+
+write_manifest
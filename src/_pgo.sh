@@ -0,0 +1,103 @@
+#!/bin/sh -e
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Profile-guided optimization of the projects passed to gen_makefile.py --pgo.
+#
+# flags PGO_DIR PROJ SRC_PROJ
+#	Run in the build dir before configure. Print the compiler flags for the
+#	build: with a complete profile for the current git revision of the
+#	project in PGO_DIR/PROJ/REVISION, the flags for an optimized build
+#	using it. Otherwise the flags for an instrumented build writing the
+#	profile there, and mark the build dir as instrumented.
+#
+# train TRAIN_CMD PROJ=BUILD_PROJ [PROJ=BUILD_PROJ ...]
+#	Run in the make dir after installing the projects. If any of them is an
+#	instrumented build, run TRAIN_CMD (once for all projects) and mark their
+#	profiles as complete. Remove the configure markers of these projects,
+#	so the Makefile builds them again, now optimized.
+
+# PGO with link time optimization. Functions without profile data (not run
+# during training) get optimized as without PGO. Profiles of a previous
+# revision that don't match the source anymore are ignored with a warning.
+FLAGS_USE="-O2 -flto=auto -fprofile-use -fprofile-partial-training -Wno-missing-profile -Wno-error=coverage-mismatch"
+FLAGS_GENERATE="-O2 -fprofile-generate -fprofile-update=atomic"
+
+flags() {
+	local pgo_dir="$1"
+	local proj="$2"
+	local src_proj="$3"
+	local rev="$(git -C "$src_proj" rev-parse HEAD)"
+	local profile_dir="$(realpath -m "$pgo_dir/$proj/$rev")"
+
+	if [ -z "$rev" ]; then
+		echo "_pgo.sh: getting git revision failed: $src_proj" >&2
+		exit 1
+	fi
+
+	if [ -e "$profile_dir/.complete" ]; then
+		echo "PGO: $proj: optimized build with profile $profile_dir" >&2
+		rm -f .pgo_generate
+		echo "$FLAGS_USE -fprofile-dir=$profile_dir"
+	else
+		echo "PGO: $proj: instrumented build, writing profile to $profile_dir" >&2
+		mkdir -p "$profile_dir"
+		echo "$profile_dir" >.pgo_generate
+		echo "$FLAGS_GENERATE -fprofile-dir=$profile_dir"
+	fi
+}
+
+train() {
+	local train_cmd="$1"
+	local instrumented=""
+	local projects=""
+	local arg
+	local proj
+	local profile_dir
+	shift
+
+	# PROJ=BUILD_PROJ of the instrumented builds
+	for arg in "$@"; do
+		if [ -e "${arg#*=}/.pgo_generate" ]; then
+			instrumented="$instrumented $arg"
+			projects="$projects ${arg%%=*}"
+		fi
+	done
+
+	if [ -z "$instrumented" ]; then
+		echo "PGO: all profiles are up to date"
+		return
+	fi
+
+	# Remove profile data written by "make check" of the instrumented builds
+	for arg in $instrumented; do
+		find "$(cat "${arg#*=}/.pgo_generate")" -name '*.gcda' -delete
+	done
+
+	echo "PGO: running training workload for$projects: $train_cmd"
+	echo "PGO: stop the programs with SIGTERM or SIGINT, they write the profile data on exit"
+	PGO_PROJECTS="${projects# }" sh -c "$train_cmd"
+
+	for arg in $instrumented; do
+		proj="${arg%%=*}"
+		profile_dir="$(cat "${arg#*=}/.pgo_generate")"
+		if [ -z "$(find "$profile_dir" -name '*.gcda' | head -n1)" ]; then
+			echo "ERROR: PGO: no profile data written to $profile_dir"
+			echo "ERROR: PGO: did the training workload run $proj, and stop it with SIGTERM or SIGINT?"
+			exit 1
+		fi
+		touch "$profile_dir/.complete"
+		rm -f ".make.$proj.configure"
+		echo "PGO: $proj: profile complete, building again optimized"
+	done
+}
+
+ACTION="$1"
+shift
+case "$ACTION" in
+	flags) flags "$@" ;;
+	train) train "$@" ;;
+	*)
+		echo "_pgo.sh: unknown action: $ACTION" >&2
+		exit 1
+		;;
+esac
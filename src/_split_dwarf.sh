@@ -0,0 +1,71 @@
+#!/bin/sh -e
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Helpers for gen_makefile.py --split-dwarf. With -gsplit-dwarf, most of the
+# debug info stays in .dwo files next to the object files in the build dir.
+# The linker only copies small skeletons into the binaries, which makes linking
+# and installing much faster.
+#
+# ldflags
+#	Run before configure. Print the linker flags for a .gdb_index section in
+#	the binaries (gdb doesn't need to read all .dwo files on startup then).
+#	This needs lld or gold, GNU ld can't create it.
+#
+# dwp STAGE_DIR
+#	Run after "make install DESTDIR=STAGE_DIR". Write the .dwo files that
+#	each installed program and library refers to into a .dwp file next to
+#	it, so gdb finds the debug info after the build dir has been removed.
+
+ldflags() {
+	local tmp="$(mktemp -d --suffix=-osmo-dev-split-dwarf)"
+	local linker
+
+	echo "int main(void) { return 0; }" >"$tmp/test.c"
+	for linker in lld gold; do
+		if ${CC:-cc} -fuse-ld=$linker -Wl,--gdb-index -o "$tmp/test" "$tmp/test.c" 2>/dev/null; then
+			rm -rf "$tmp"
+			echo "-fuse-ld=$linker -Wl,--gdb-index"
+			return
+		fi
+	done
+	rm -rf "$tmp"
+	echo "WARNING: split DWARF: linking without .gdb_index, install lld or gold for faster gdb startup" >&2
+}
+
+install_dwp() {
+	local stage_dir="$1"
+	local dwp_tool
+	local file
+
+	# llvm-dwp supports DWARF 5 (default since GCC 11), binutils' dwp only 4
+	for dwp_tool in llvm-dwp dwp ""; do
+		if [ -n "$dwp_tool" ] && command -v "$dwp_tool" >/dev/null; then
+			break
+		fi
+	done
+	if [ -z "$dwp_tool" ]; then
+		echo "ERROR: split DWARF: llvm-dwp (or dwp from binutils) is needed to install .dwp files"
+		exit 1
+	fi
+
+	find "$stage_dir" -type f ! -name '*.dwp' | sort | while read -r file; do
+		if [ "$(head -c4 "$file" | tail -c3)" != "ELF" ]; then
+			continue
+		fi
+		if ! readelf --debug-dump=info "$file" 2>/dev/null | grep -q 'DW_AT_\(GNU_\)\?dwo_name'; then
+			continue
+		fi
+		"$dwp_tool" -e "$file" -o "$file.dwp"
+	done
+}
+
+ACTION="$1"
+shift
+case "$ACTION" in
+	ldflags) ldflags "$@" ;;
+	dwp) install_dwp "$@" ;;
+	*)
+		echo "_split_dwarf.sh: unknown action: $ACTION" >&2
+		exit 1
+		;;
+esac
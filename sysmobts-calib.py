@@ -6,81 +6,334 @@ You need is ssh root access to the BTS, and an antenna connected to the NWL.
 Remotely goes through the steps to obtain a OCXO calibration value from netlisten.
 - Obtain the current calibration value from /etc/osmocom/osmo-bts-sysmo.cfg.
 - Stop the osmo-bts-sysmo.service.
-- Do a scan to get the strongest received ARFCN.
+- Do a scan to get the strongest received ARFCN. The scan result is cached
+  and reused for the same BTS and band for --scan-max-age hours.
 - Run n passes of sysmobts-calib (default: 7) to obtain an average calibration val.
+  With --ci, stop as soon as the average is known precisely enough instead.
+  With --top-arfcns k, do this for each of the k strongest ARFCNs and average.
 - Write this calibration value back to /etc/osmocom/osmo-bts-sysmo.cfg.
 - Start osmo-bts-sysmo.service.
+All ssh commands share one connection to the BTS (ssh ControlMaster).
+
+With --fleet, this is done for all BTS listed in an inventory file, several at
+the same time, and the new values are written after one confirmation for all.
 '''
 
 import sys
+import os
 import subprocess
 import re
 import shlex
 import argparse
-
+import atexit
+import concurrent.futures
+import json
+import math
+import statistics
+import time
+import shutil
+import tempfile
+
+cfg_file = '/etc/osmocom/osmo-bts-sysmo.cfg'
 calib_val_re = re.compile(r'clock-calibration +([0-9]+)')
 result_re = re.compile('The calibration value is: ([0-9]*)')
 
-class Globals:
-    orig_calib_val = None
-    calib_val = None
-    bts = 'bts0'
-    band = '900'
-    arfcn = None
+class CalibError(Exception):
+    pass
 
 def error(*msgs):
     sys.stderr.write(''.join(str(m) for m in msgs))
     sys.stderr.write('\n')
     exit(1)
 
-def log(*msgs):
-    print(''.join(str(m) for m in msgs))
-
 def cmd_to_str(cmd):
     return ' '.join(shlex.quote(c) for c in cmd)
 
-def call_output(*cmd):
-    cmd = ('ssh', Globals.bts,) + cmd
-    log('+ %s' % cmd_to_str(cmd))
-    sys.stdout.flush()
-    sys.stderr.flush()
-    p = subprocess.Popen(cmd, stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
-    o,e = p.communicate()
-    return o.decode('utf-8')
-
-def call(*cmd):
-    o = call_output(*cmd)
-    if o:
-        log(o)
-
-def reload_dsp():
-    #call('/bin/sh', '-c', r"'cat /lib/firmware/sysmobts-v?.bit > /dev/fpgadl_par0 ; sleep 3s; cat /lib/firmware/sysmobts-v?.out > /dev/dspdl_dm644x_0; sleep 1s'")
-    # systemd service contains the DSP reload commands in the ExecStopPost.
-    # So starting and stopping the service is the easy way to reload the DSP.
-    call('systemctl', 'start', 'osmo-bts-sysmo')
-    call('systemctl', 'stop', 'osmo-bts-sysmo')
-
-def get_cfg_calib_val():
-    o = call_output('grep', 'clock-calibration', '/etc/osmocom/osmo-bts-sysmo.cfg')
-    if not o:
+class Remote:
+    '''Run commands on one BTS via ssh. All calls share one connection to the
+    BTS (ControlMaster), so only the first one pays for the SSH handshake.
+    ssh may be replaced with any command taking the same arguments, e.g. a
+    local stand-in for testing.'''
+
+    def __init__(self, host, ssh='ssh', log=print):
+        self.host = host
+        self.ssh = ssh
+        self.log = log
+        self.control_dir = None
+
+    def ssh_cmd(self, *args):
+        if self.control_dir is None:
+            self.control_dir = tempfile.mkdtemp(prefix='sysmobts-calib-')
+        control_path = os.path.join(self.control_dir, 'ssh')
+        return (self.ssh, '-o', 'ControlMaster=auto', '-o', 'ControlPath=' + control_path,
+                '-o', 'ControlPersist=yes') + args + (self.host,)
+
+    def close(self):
+        if self.control_dir is None:
+            return
+        subprocess.call(self.ssh_cmd('-O', 'exit'), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(self.control_dir, ignore_errors=True)
+        self.control_dir = None
+
+    def call_output(self, *cmd):
+        cmd = self.ssh_cmd() + cmd
+        self.log('+ %s' % cmd_to_str(cmd))
+        sys.stdout.flush()
+        sys.stderr.flush()
+        p = subprocess.Popen(cmd, stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
+        o,e = p.communicate()
+        return o.decode('utf-8')
+
+    def call_output_sh(self, *script_lines):
+        '''Run several shell commands on the BTS in one round trip.'''
+        # ssh passes the command to the remote shell as one string
+        return self.call_output('sh', '-c', shlex.quote('\n'.join(script_lines)))
+
+#reload_dsp: 'cat /lib/firmware/sysmobts-v?.bit > /dev/fpgadl_par0 ; sleep 3s; cat /lib/firmware/sysmobts-v?.out > /dev/dspdl_dm644x_0; sleep 1s'
+# systemd service contains the DSP reload commands in the ExecStopPost.
+# So starting and stopping the service is the easy way to reload the DSP.
+reload_dsp_sh = ('systemctl start osmo-bts-sysmo', 'systemctl stop osmo-bts-sysmo')
+reload_dsp_marker = '--- reload DSP'
+
+# two-sided 95% quantiles of Student's t distribution, by degrees of freedom
+t_95 = (None, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086)
+
+class CalibStats:
+    '''Calibration values collected so far. Values further than 3 (scaled)
+    median absolute deviations from the median are rejected as outliers, the
+    result is the mean of the others.'''
+
+    def __init__(self):
+        self.values = []
+        self.accepted = []
+        self.rejected = []
+
+    def add(self, value):
+        self.values.append(value)
+        median = statistics.median(self.values)
+        mad = statistics.median(abs(v - median) for v in self.values) * 1.4826
+        if len(self.values) < 3 or not mad:
+            self.accepted = list(self.values)
+            self.rejected = []
+        else:
+            self.accepted = [v for v in self.values if abs(v - median) <= 3 * mad]
+            self.rejected = [v for v in self.values if abs(v - median) > 3 * mad]
+
+    def mean(self):
+        return statistics.mean(self.accepted)
+
+    def ci(self):
+        '''Half width of the 95% confidence interval of mean(), None if there
+        are too few values to tell.'''
+        n = len(self.accepted)
+        if n < 2:
+            return None
+        t = t_95[n - 1] if n - 1 < len(t_95) else 1.96
+        return t * statistics.stdev(self.accepted) / math.sqrt(n)
+
+    def __str__(self):
+        ret = 'n=%d median=%s mean=%.1f' % (len(self.accepted), statistics.median(self.values), self.mean())
+        ci = self.ci()
+        if ci is not None:
+            ret += ' +-%.1f (95%%)' % ci
+        if self.rejected:
+            ret += ' outliers=%s' % sorted(self.rejected)
+        return ret
+
+def parse_scan(o):
+    '''Return [(arfcn, level), ...] from sysmobts-calib scan output, strongest
+    first. level is None if the output has none.'''
+    arfcns = []
+    for line in o.splitlines():
+        if ':' not in line:
+            continue
+        head, tail = line.split(':', 1)
+        words = head.split()
+        if not words or not words[-1].isdigit():
+            continue
+        m = re.search(r'-?[0-9]+(\.[0-9]+)?', tail)
+        arfcns.append((int(words[-1]), float(m.group(0)) if m else None))
+    # sysmobts-calib lists the strongest last
+    arfcns.reverse()
+    if arfcns and None not in (level for arfcn, level in arfcns):
+        arfcns.sort(key=lambda a: a[1], reverse=True)
+    return arfcns
+
+def scan_cache_path(cache_dir, host, band):
+    return os.path.join(cache_dir, '%s-%s.json' % (host, band))
+
+def load_scan(path, max_age):
+    '''Return the cached scan result if it is younger than max_age hours.'''
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
         return None
-    o = o.strip()
-    m = calib_val_re.match(o)
-    if not m:
+    age = time.time() - cached.get('time', 0)
+    if age < 0 or age > max_age * 3600:
         return None
-    return m.group(1)
+    return [tuple(a) for a in cached['arfcns']], age
 
-def set_cfg_calib_val(calib_val):
-    if get_cfg_calib_val() is None:
-        call('sed', '-i', "'s/^ instance 0$/&\\n  clock-calibration %s/'" % calib_val, '/etc/osmocom/osmo-bts-sysmo.cfg');
-    else:
-        call('sed', '-i', "'s/clock-calibration.*$/clock-calibration %s/'" % calib_val, '/etc/osmocom/osmo-bts-sysmo.cfg');
+def save_scan(path, arfcns):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'time': time.time(), 'arfcns': arfcns}, f)
+    os.replace(tmp, path)
 
-    now = get_cfg_calib_val()
-    if now != calib_val:
-        print('Failed to set calibration value, set manually in osmo-bts-sysmo.cfg')
-        print('phy 0\n instance 0\n  clock-calibration %s' % calib_val)
+def parse_cfg_calib_val(o):
+    m = calib_val_re.search(o)
+    if not m:
+        return None
+    return m.group(1)
 
+class Bts:
+    '''Calibration state of one BTS.'''
+
+    def __init__(self, host, band='900', arfcn=None, ssh='ssh', prefix=''):
+        self.host = host
+        self.band = band
+        self.arfcns = [arfcn] if arfcn else []
+        # {arfcn: CalibStats}
+        self.arfcn_stats = {}
+        self.prefix = prefix
+        self.orig_calib_val = None
+        self.calib_val = None
+        self.output = []
+        self.error = None
+        self.written = False
+        self.remote = Remote(host, ssh, self.log)
+
+    def log(self, *msgs):
+        msg = ''.join(str(m) for m in msgs)
+        self.output.append(msg)
+        if self.prefix:
+            msg = '\n'.join(self.prefix + line for line in msg.splitlines())
+        print(msg)
+
+    def call(self, *cmd):
+        o = self.remote.call_output(*cmd)
+        if o:
+            self.log(o)
+
+    def reload_dsp(self):
+        o = self.remote.call_output_sh(*reload_dsp_sh)
+        if o:
+            self.log(o)
+
+    def get_cfg_calib_val(self):
+        return parse_cfg_calib_val(self.remote.call_output('grep', 'clock-calibration', cfg_file))
+
+    def set_cfg_calib_val(self, calib_val):
+        '''Return True if the value is in the config file afterwards.'''
+        # modify and read back in one ssh round trip
+        calib_val = str(calib_val)
+        o = self.remote.call_output_sh(
+            'f=%s' % cfg_file,
+            'if grep -q clock-calibration "$f"; then',
+            '  sed -i "s/clock-calibration.*$/clock-calibration %s/" "$f"' % calib_val,
+            'else',
+            '  sed -i "s/^ instance 0$/&\\n  clock-calibration %s/" "$f"' % calib_val,
+            'fi',
+            'grep clock-calibration "$f"')
+
+        now = parse_cfg_calib_val(o)
+        if now != calib_val:
+            self.log('Failed to set calibration value, set manually in osmo-bts-sysmo.cfg')
+            self.log('phy 0\n instance 0\n  clock-calibration %s' % calib_val)
+            return False
+        return True
+
+    def call_sysmobts_calib(self, mode, *args):
+        # run the pass and reload the DSP for the next one in one ssh round trip
+        calib = cmd_to_str(('sysmobts-calib', '-c', 'ocxo', '-s', 'netlisten', '-b', self.band,
+                            '-i', self.calib_val, '-m', mode) + args)
+        o = self.remote.call_output_sh(calib, 'echo %s' % reload_dsp_marker, *reload_dsp_sh)
+        self.log(o)
+        # the caller parses the sysmobts-calib output only
+        return o.split(reload_dsp_marker)[0]
+
+    def start(self, calib_val=None):
+        self.orig_calib_val = calib_val
+        if self.orig_calib_val is None:
+            self.orig_calib_val = self.get_cfg_calib_val() or '0'
+        self.calib_val = self.orig_calib_val
+
+        self.log('Starting out with clock calibration value %s' % self.calib_val)
+
+        #call('systemctl', 'stop', 'osmo-bts-sysmo')
+        self.reload_dsp()
+
+    def scan(self, top=1, cache_dir=None, max_age=24):
+        '''Pick the top strongest ARFCNs to calibrate to, from the cached scan
+        result in cache_dir if it is younger than max_age hours.'''
+        if self.arfcns:
+            return
+        arfcns = None
+        if cache_dir:
+            path = scan_cache_path(cache_dir, self.host, self.band)
+            cached = load_scan(path, max_age)
+            if cached:
+                arfcns, age = cached
+                self.log('Using scan result from %.1f hours ago (%s)' % (age / 3600, path))
+        if not arfcns:
+            arfcns = parse_scan(self.call_sysmobts_calib('scan'))
+            if not arfcns:
+                raise CalibError('Error while scanning bands')
+            if cache_dir:
+                save_scan(path, arfcns)
+        self.arfcns = [str(arfcn) for arfcn, level in arfcns[:top]]
+
+    def calibrate_arfcn(self, arfcn, stats, passes, ci, min_passes):
+        self.log('Using ARFCN %r' % arfcn)
+
+        for i in range(passes):
+            self.log('\npass %d of %d' % (i+1, passes))
+            o = self.call_sysmobts_calib('calibrate', '-a', arfcn)
+            for m in result_re.finditer(o):
+                stats.add(int(m.group(1)))
+
+            if not stats.values:
+                continue
+
+            self.calib_val = str(int(round(stats.mean())))
+            self.log('clock-calibration: started with %s, current=%s (%s)' %
+                     (self.orig_calib_val, self.calib_val, stats))
+
+            achieved = stats.ci()
+            if ci is not None and i + 1 >= min_passes and achieved is not None and achieved <= ci:
+                self.log('confidence interval +-%.1f <= +-%s after %d passes, done' % (achieved, ci, i + 1))
+                break
+
+    def calibrate(self, passes, ci=None, min_passes=3):
+        '''Run up to passes calibration passes for each ARFCN. With ci, stop
+        after at least min_passes once the 95% confidence interval of the
+        result is at most +-ci. With several ARFCNs, the result is the average
+        of the results for each.'''
+        for arfcn in self.arfcns:
+            stats = self.arfcn_stats[arfcn] = CalibStats()
+            self.calibrate_arfcn(arfcn, stats, passes, ci, min_passes)
+
+        means = [stats.mean() for stats in self.arfcn_stats.values() if stats.values]
+        if len(means) > 1:
+            self.calib_val = str(int(round(statistics.mean(means))))
+            self.log('\ncross-check: %s, spread %d' %
+                     (', '.join('ARFCN %s: %.1f' % (arfcn, stats.mean())
+                                for arfcn, stats in self.arfcn_stats.items() if stats.values),
+                      max(means) - min(means)))
+
+        self.log('RESULT: %s  (was %s)' % (self.calib_val, self.orig_calib_val))
+
+    def ci(self):
+        '''The widest confidence interval of all ARFCNs, see CalibStats.ci().'''
+        cis = [stats.ci() for stats in self.arfcn_stats.values() if stats.values]
+        if not cis or None in cis:
+            return None
+        return max(cis)
+
+    def close(self):
+        self.remote.close()
 
 def ask(*question, valid_answers=('*',)):
     while True:
@@ -95,18 +348,105 @@ def ask(*question, valid_answers=('*',)):
             if v == '+' and len(answer):
                 return answer
 
-def call_sysmobts_calib(mode, *args):
-    o = call_output('sysmobts-calib', '-c', 'ocxo', '-s', 'netlisten', '-b', Globals.band, '-i', Globals.calib_val, '-m', mode, *args)
-    log(o)
-    reload_dsp()
-    return o
-
 def int_be_one(string):
     val = int(string)
     if val < 1:
         raise argparse.ArgumentTypeError('value must be at least 1')
     return val
 
+def read_inventory(path):
+    '''Lines of "host [band [arfcn]]", # starts a comment.'''
+    inventory = []
+    with open(path) as f:
+        for nr, line in enumerate(f, 1):
+            words = line.split('#')[0].split()
+            if not words:
+                continue
+            if len(words) > 3:
+                error('%s:%d: expected "host [band [arfcn]]"' % (path, nr))
+            inventory.append(words + [None] * (3 - len(words)))
+    if not inventory:
+        error('%s: no BTS listed' % path)
+    return inventory
+
+def calibrate_fleet_bts(bts, cmdline):
+    try:
+        bts.start(cmdline.calib_val)
+        bts.scan(cmdline.top_arfcns, cmdline.cache_dir, cmdline.scan_max_age)
+        bts.calibrate(cmdline.passes, cmdline.ci, cmdline.min_passes)
+    except CalibError as e:
+        bts.error = str(e)
+        bts.log('ERROR: %s' % e)
+    except Exception as e:
+        bts.error = repr(e)
+        bts.log('ERROR: %r' % e)
+
+def calibrate_fleet(cmdline):
+    '''Calibrate all BTS in the inventory, at most cmdline.jobs at the same
+    time. Ask once whether to write all new values to the config files.'''
+    inventory = read_inventory(cmdline.fleet)
+    report_dir = cmdline.report_dir or 'sysmobts-calib-' + time.strftime('%Y%m%d-%H%M%S')
+    os.makedirs(report_dir, exist_ok=True)
+
+    width = max(len(host) for host, band, arfcn in inventory)
+    fleet = []
+    for host, band, arfcn in inventory:
+        fleet.append(Bts(host, band or cmdline.band or '900', arfcn or cmdline.arfcn, cmdline.ssh,
+                         prefix='%-*s | ' % (width, host)))
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=cmdline.jobs) as executor:
+            for bts in fleet:
+                executor.submit(calibrate_fleet_bts, bts, cmdline)
+
+        changed = [bts for bts in fleet if not bts.error and bts.calib_val != bts.orig_calib_val]
+        if changed:
+            print('\n'.join(['', 'New clock-calibration values:']
+                            + ['  %-*s %s -> %s' % (width, bts.host, bts.orig_calib_val, bts.calib_val)
+                               for bts in changed]))
+            a = ask('modify osmo-bts-sysmo.cfg on these %d BTS? (ok, no)' % len(changed),
+                    valid_answers=('ok', 'no', ''))
+            if a == 'ok':
+                with concurrent.futures.ThreadPoolExecutor(max_workers=cmdline.jobs) as executor:
+                    results = executor.map(lambda bts: bts.set_cfg_calib_val(bts.calib_val), changed)
+                    for bts, ok in zip(changed, results):
+                        bts.written = ok
+                        if not ok:
+                            bts.error = 'failed to write osmo-bts-sysmo.cfg'
+    finally:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=cmdline.jobs) as executor:
+            for bts in fleet:
+                executor.submit(bts.call, 'systemctl', 'start', 'osmo-bts-sysmo')
+        for bts in fleet:
+            bts.close()
+
+    report = ['%-*s  %6s  %10s  %10s  %8s  %-8s  %s' % (width, 'host', 'arfcns', 'was', 'result', '+-95%', 'cfg',
+                                                       'values')]
+    for bts in fleet:
+        with open(os.path.join(report_dir, bts.host + '.log'), 'w') as f:
+            f.write('\n'.join(bts.output) + '\n')
+        if bts.error:
+            cfg = 'ERROR: ' + bts.error
+        elif bts.calib_val == bts.orig_calib_val:
+            cfg = 'unchanged'
+        elif bts.written:
+            cfg = 'written'
+        else:
+            cfg = 'not written'
+        ci = bts.ci()
+        values = ' '.join(str(v) for stats in bts.arfcn_stats.values() for v in stats.values)
+        report.append('%-*s  %6s  %10s  %10s  %8s  %-8s  %s' % (width, bts.host, ','.join(bts.arfcns) or '-',
+                                                                bts.orig_calib_val or '-', bts.calib_val or '-',
+                                                                '-' if ci is None else '%.1f' % ci, cfg, values))
+    report = '\n'.join(report) + '\n'
+    with open(os.path.join(report_dir, 'report.txt'), 'w') as f:
+        f.write(report)
+    print('\n' + report)
+    print('Logs and report in %s/' % report_dir)
+
+    if any(bts.error for bts in fleet):
+        exit(1)
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=doc)
     parser.add_argument('-b', '--band', dest='band', default=None,
@@ -116,85 +456,78 @@ if __name__ == '__main__':
     parser.add_argument('-i', '--initial-clock-correction', dest='calib_val', default=None,
                         help='Clock calibration value to start out with. If omitted, this is obtained from'
                         ' /etc/osmocom/osmo-bts-sysmo.cfg from the BTS file system.')
-    parser.add_argument('-I', '--set-clock-correction', dest='set_calib_val', default=None,
+    parser.add_argument('-I', '--set-clock-correction', dest='set_calib_val', default=None, type=int,
                         help="Don't scan or calibrate, just set the given value in the config file")
     parser.add_argument('-G', '--get-clock-correction', dest='get_calib_val', default=False, action='store_true',
                         help="Don't scan or calibrate, just read the given value in the config file")
-    parser.add_argument('-n', '--passes', dest='passes', default=7, type=int_be_one,
-                        help="How many times to run sysmobts-calib to obtain a resulting calibration value average")
-    parser.add_argument('args', nargs=1, help='Hostname (SSH) to reach the BTS at')
+    parser.add_argument('-n', '--passes', dest='passes', default=None, type=int_be_one,
+                        help="How many times to run sysmobts-calib to obtain a resulting calibration value average"
+                        " (default: 7, with --ci at most 15)")
+    parser.add_argument('--ci', dest='ci', default=None, type=float,
+                        help='Stop calibrating as soon as the 95%% confidence interval of the resulting value is'
+                        ' at most +- this much')
+    parser.add_argument('--min-passes', dest='min_passes', default=3, type=int_be_one,
+                        help='With --ci: run at least this many passes (default: %(default)s)')
+    parser.add_argument('-k', '--top-arfcns', dest='top_arfcns', default=1, type=int_be_one,
+                        help='Calibrate to each of the k strongest ARFCNs found by the scan and use the average,'
+                        ' to cross-check the result (default: %(default)s)')
+    parser.add_argument('--scan-max-age', dest='scan_max_age', default=24, type=float, metavar='HOURS',
+                        help='Reuse a cached scan result of the same BTS and band if it is at most this old,'
+                        ' 0 to always scan (default: %(default)s)')
+    parser.add_argument('--cache-dir', dest='cache_dir',
+                        default=os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+                                             'sysmobts-calib'),
+                        help='Where to cache scan results (default: %(default)s)')
+    parser.add_argument('-f', '--fleet', dest='fleet', default=None, metavar='INVENTORY',
+                        help='Calibrate all BTS listed in this file, one "host [band [arfcn]]" per line.'
+                        ' Each BTS gets scanned and calibrated, then the new values for all of them are'
+                        ' written after one confirmation.')
+    parser.add_argument('-j', '--jobs', dest='jobs', default=4, type=int_be_one,
+                        help='With --fleet: how many BTS to calibrate at the same time')
+    parser.add_argument('-o', '--report-dir', dest='report_dir', default=None,
+                        help='With --fleet: where to write a log per BTS and report.txt'
+                        ' (default: sysmobts-calib-<date>-<time>)')
+    parser.add_argument('--ssh', dest='ssh', default='ssh',
+                        help='Command to use instead of ssh')
+    parser.add_argument('args', nargs='?', help='Hostname (SSH) to reach the BTS at')
 
     cmdline = parser.parse_args()
+    if cmdline.passes is None:
+        cmdline.passes = 15 if cmdline.ci is not None else 7
 
-    Globals.bts = cmdline.args[0]
-    if cmdline.band:
-        Globals.band = cmdline.band
-
-    if cmdline.set_calib_val:
-        set_cfg_calib_val(cmdline.set_calib_val)
+    if cmdline.fleet:
+        if cmdline.args:
+            parser.error('pass either a hostname or --fleet')
+        calibrate_fleet(cmdline)
         exit(0)
 
-    if cmdline.get_calib_val:
-        print(get_cfg_calib_val())
-        exit(0)
-
-    Globals.orig_calib_val = cmdline.calib_val
-    if Globals.orig_calib_val is None:
-        Globals.orig_calib_val = get_cfg_calib_val() or '0'
-    Globals.calib_val = Globals.orig_calib_val
-
-    print('Starting out with clock calibration value %s' % Globals.calib_val)
-
-    #call('systemctl', 'stop', 'osmo-bts-sysmo')
-    reload_dsp()
-
-    if cmdline.arfcn:
-        Globals.arfcn = cmdline.arfcn
-    else:
-        arfcns = call_sysmobts_calib('scan')
-        best_arfcn_line = arfcns.splitlines()[-1]
-        Globals.arfcn = best_arfcn_line.split(':')[0].split(' ')[-1]
-        try:
-            int(Globals.arfcn)
-        except:
-            error('Error while scanning bands')
-
-    print('Using ARFCN %r' % Globals.arfcn)
-
-    collected_values = []
+    if not cmdline.args:
+        parser.error('pass the hostname of the BTS')
 
-    passes = cmdline.passes
-    if passes < 1:
-        passes = 1
+    bts = Bts(cmdline.args, cmdline.band or '900', cmdline.arfcn, cmdline.ssh)
+    atexit.register(bts.close)
 
-    for i in range(passes):
-        print('\npass %d of %d' % (i+1, passes))
-        o = call_sysmobts_calib('calibrate', '-a', Globals.arfcn)
-        for m in result_re.finditer(o):
-            collected_values.append(int(m.group(1)))
-
-        collected_values = list(sorted(collected_values))
-        print(collected_values)
-        if not collected_values:
-            continue
-
-        best_values = collected_values
-        if len(best_values) > 3:
-            best_values = best_values[1:-1]
+    if cmdline.set_calib_val is not None:
+        bts.set_cfg_calib_val(cmdline.set_calib_val)
+        exit(0)
 
-        avg = sum(best_values) / len(best_values)
-        Globals.calib_val = str(int(avg))
-        print('clock-calibration: started with %s, current=%s' %
-              (Globals.orig_calib_val, Globals.calib_val))
+    if cmdline.get_calib_val:
+        print(bts.get_cfg_calib_val())
+        exit(0)
 
-    print('RESULT:', Globals.calib_val, ' (was %s)' % Globals.orig_calib_val)
+    bts.start(cmdline.calib_val)
+    try:
+        bts.scan(cmdline.top_arfcns, cmdline.cache_dir, cmdline.scan_max_age)
+    except CalibError as e:
+        error(e)
+    bts.calibrate(cmdline.passes, cmdline.ci, cmdline.min_passes)
 
-    cfg_calib_val = get_cfg_calib_val()
-    if Globals.calib_val != cfg_calib_val:
+    cfg_calib_val = bts.get_cfg_calib_val()
+    if bts.calib_val != cfg_calib_val:
         a = ask('osmo-bts-sysmo.cfg currently has %s\nmodify osmo-bts-sysmo.cfg to clock-calibration %s? (ok, no)'
-                % (cfg_calib_val, Globals.calib_val),
+                % (cfg_calib_val, bts.calib_val),
                 valid_answers=('ok', 'no', ''))
         if a == 'ok':
-            set_cfg_calib_val(Globals.calib_val)
-    call('systemctl', 'start', 'osmo-bts-sysmo')
+            bts.set_cfg_calib_val(bts.calib_val)
+    bts.call('systemctl', 'start', 'osmo-bts-sysmo')
 # vim: shiftwidth=4 expandtab tabstop=4
@@ -0,0 +1,57 @@
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+import json
+import os
+import subprocess
+
+osmo_dev_path = os.path.realpath(os.path.join(__file__, "../../"))
+bench = os.path.join(osmo_dev_path, "bench.py")
+
+
+def install_fake_program(prefix, pps, delay):
+    """Install a program "work" in the prefix that takes delay seconds and
+    outputs metrics."""
+    os.makedirs(os.path.join(prefix, "bin"))
+    path = os.path.join(prefix, "bin/work")
+    with open(path, "w") as f:
+        f.write(f"#!/bin/sh\nsleep {delay}\necho 'bench: pps='$(({pps} + BENCH_RUN))\necho 'bench: errors=0'\n")
+    os.chmod(path, 0o755)
+
+
+def test_bench(tmp_path):
+    prefix_a = os.path.join(tmp_path, "a")
+    prefix_b = os.path.join(tmp_path, "b")
+    install_fake_program(prefix_a, 1000, 0.2)
+    install_fake_program(prefix_b, 2000, 0.01)
+
+    history = os.path.join(tmp_path, "bench-history.jsonl")
+    cmd = [bench, "-H", history, "run", "-a", prefix_a, "-b", prefix_b, "-n", "5", "-w", "0", "-l", "test", "work"]
+    out = subprocess.run(cmd, check=True, capture_output=True, encoding="UTF-8").stdout
+    print(out)
+    assert "run 5/5 a:" in out
+
+    with open(history) as f:
+        entry = json.loads(f.read())
+    metrics = entry["metrics"]
+    assert entry["label"] == "test"
+    assert metrics["pps"]["a"] == [1000, 1001, 1002, 1003, 1004]
+    assert metrics["pps"]["median_b"] == 2002
+    assert metrics["pps"]["significant"]
+    assert metrics["pps"]["ci_pct"][0] > 90
+    assert metrics["time_s"]["significant"]
+    assert metrics["time_s"]["delta_pct"] < 0
+    assert not metrics["errors"]["significant"]
+
+    out = subprocess.run([bench, "-H", history, "history"], check=True, capture_output=True, encoding="UTF-8").stdout
+    assert "test: 5 runs of work" in out
+    assert "no significant difference" in out
+
+    # Failing workload
+    cmd[-1] = "false"
+    assert subprocess.run(cmd, check=False).returncode == 1
+
+    # Workload that runs longer than --timeout
+    cmd = [bench, "-H", history, "run", "-a", prefix_a, "-b", prefix_b, "-n", "2", "-t", "0.5", "exec sleep 5"]
+    proc = subprocess.run(cmd, check=False, capture_output=True, encoding="UTF-8")
+    assert proc.returncode == 1
+    assert "ERROR: workload timed out after 0.5s (a: " in proc.stdout
@@ -0,0 +1,153 @@
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+import importlib.util
+import json
+import os
+import socket
+import sys
+
+import pytest
+
+osmo_dev_path = os.path.realpath(os.path.join(__file__, "../../"))
+dialplan_dgsm_dir = os.path.join(osmo_dev_path, "net/templates/freeswitch/python/dialplan-dgsm")
+sys.path.insert(0, dialplan_dgsm_dir)
+import mslookup_resolver
+
+RESULT = {"v4": ["10.23.42.1", 5060], "v6": None, "age": 0}
+UNKNOWN = {"v4": None, "v6": None}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake time.monotonic() of mslookup_resolver, advance with clock.t += 1."""
+
+    class Clock:
+        t = 1000.0
+
+    monkeypatch.setattr(mslookup_resolver.time, "monotonic", lambda: Clock.t)
+    return Clock
+
+
+def test_cache_ttl(clock):
+    cache = mslookup_resolver.ResultCache(ttl=60, negative_ttl=10)
+    assert cache.get("a") is None
+    cache.put("a", RESULT)
+    cache.put("unknown", UNKNOWN)
+
+    clock.t += 9
+    assert cache.get("a") == RESULT
+    assert cache.get("unknown") == UNKNOWN
+
+    # Negative results expire after 10s, positive ones after 60s
+    clock.t += 2
+    assert cache.get("a") == RESULT
+    assert cache.get("unknown") is None
+    clock.t += 49
+    assert cache.get("a") is None
+
+    # The age reported by mslookup counts towards the TTL
+    cache.put("old", dict(RESULT, age=50))
+    clock.t += 9
+    assert cache.get("old") is not None
+    clock.t += 1
+    assert cache.get("old") is None
+    cache.put("too-old", dict(RESULT, age=60))
+    assert cache.get("too-old") is None
+
+    report = "entries: 0/1000\nhits: 3\nnegative_hits: 1\nmisses: 5\nexpired: 3\ninvalidated: 0\n"
+    assert cache.report() == report
+
+
+def test_cache_lru(clock):
+    cache = mslookup_resolver.ResultCache(size=2)
+    cache.put("a", RESULT)
+    cache.put("b", RESULT)
+    # "a" is used more recently than "b" now, "b" gets evicted
+    assert cache.get("a") is not None
+    cache.put("c", RESULT)
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.get("b") is None
+
+    cache.invalidate("a")
+    cache.invalidate("a")
+    assert list(cache.entries) == ["c"]
+    assert cache.stats["invalidated"] == 1
+    cache.clear()
+    assert cache.get("c") is None
+
+
+def test_latency_histogram():
+    latency = mslookup_resolver.LatencyHistogram()
+    assert latency.report().startswith("calls: 0\n<= 1 ms: 0\n")
+
+    # 90 calls <= 10 ms, 9 calls <= 250 ms, 1 call > 5000 ms
+    for ms in [0.5] * 40 + [10] * 50 + [101] * 9 + [6000]:
+        latency.add(ms)
+    lines = latency.report().splitlines()
+    assert lines[:5] == ["calls: 100", "avg: 74 ms", "p50: <= 10 ms", "p90: <= 10 ms", "p99: <= 250 ms"]
+    assert lines[5:] == [
+        "<= 1 ms: 40",
+        "<= 10 ms: 50",
+        "<= 50 ms: 0",
+        "<= 100 ms: 0",
+        "<= 250 ms: 9",
+        "<= 500 ms: 0",
+        "<= 1000 ms: 0",
+        "<= 2000 ms: 0",
+        "<= 5000 ms: 0",
+        "> 5000 ms: 1",
+    ]
+
+    latency.add(7000)
+    assert "p99: > 5000 ms" in latency.report()
+    latency.clear()
+    assert latency.report().startswith("calls: 0\n")
+
+
+def test_late_result_of_cancelled_query():
+    resolver = mslookup_resolver.Resolver(timeout_ms=1000)
+    late = resolver.pending["sip.voice.1.msisdn"] = mslookup_resolver.Request()
+    resolver.cancel("sip.voice.1.msisdn", late)
+    pending = resolver.pending["sip.voice.2.msisdn"] = mslookup_resolver.Request()
+
+    sock, client_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    client_sock.send(json.dumps(dict(RESULT, query="sip.voice.1.msisdn")).encode())
+    client_sock.close()
+    resolver.read_results(sock)
+    sock.close()
+
+    assert not late.done.is_set()
+    assert not pending.done.is_set()
+    assert list(resolver.pending) == ["sip.voice.2.msisdn"]
+
+    # Results without the query still complete the oldest pending one
+    sock, client_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    client_sock.send(json.dumps(RESULT).encode())
+    client_sock.close()
+    resolver.read_results(sock)
+    sock.close()
+
+    assert pending.result == RESULT
+    assert resolver.pending == {}
+
+
+def test_dial_str(monkeypatch):
+    # The package dir name isn't a valid module name, load __init__.py directly
+    spec = importlib.util.spec_from_file_location("dialplan_dgsm", os.path.join(dialplan_dgsm_dir, "__init__.py"))
+    dialplan_dgsm = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(dialplan_dgsm)
+
+    v4 = {"v4": ["10.23.42.1", 5060], "v6": None}
+    v6 = {"v4": None, "v6": ["fd02:db8::1", 5070]}
+    both = {"v4": ["10.23.42.1", 5060], "v6": ["fd02:db8::1", 5070]}
+    sip_v4 = "sofia/internal/sip:1234@10.23.42.1:5060"
+    sip_v6 = "sofia/internal/sip:1234@[fd02:db8::1]:5070"
+
+    assert dialplan_dgsm.dial_str("1234", v4) == sip_v4
+    assert dialplan_dgsm.dial_str("1234", v6) == sip_v6
+    assert dialplan_dgsm.dial_str("1234", both) == f"{sip_v4}|{sip_v6}"
+    assert dialplan_dgsm.dial_str("1234", UNKNOWN) is None
+
+    monkeypatch.setattr(dialplan_dgsm, "prefer_ip", "v6")
+    assert dialplan_dgsm.dial_str("1234", both) == f"{sip_v6}|{sip_v4}"
+    assert dialplan_dgsm.dial_str("1234", v4) == sip_v4
@@ -0,0 +1,158 @@
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+import os
+import subprocess
+
+osmo_dev_path = os.path.realpath(os.path.join(__file__, "../../"))
+fill_config = os.path.join(osmo_dev_path, "net/fill_config.py")
+
+
+def run_fill_config(net_dir, *args, check=True):
+    cmd = [fill_config, *args]
+    print(f"+ {cmd}")
+    return subprocess.run(cmd, cwd=net_dir, check=check, capture_output=True, encoding="UTF-8")
+
+
+def write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def rendered(result):
+    return sorted(line.split("'")[1] for line in result.stdout.splitlines() if line.startswith("rendering "))
+
+
+def setup_net(tmp_path):
+    tmpl_dir = os.path.join(tmp_path, "templates")
+    net_dir = os.path.join(tmp_path, "net")
+    os.mkdir(tmpl_dir)
+    os.mkdir(net_dir)
+
+    write(os.path.join(tmpl_dir, "common_log"), "log ${LOG_LEVEL}\n")
+    write(os.path.join(tmpl_dir, "a.cfg"), "a ${A}\n${include(common_log)}")
+    write(os.path.join(tmpl_dir, "b.cfg"), "${foreach(BTS)}\nbts ${BTSn} ${BTSn_ARFCN}\n${foreach_end}\n")
+
+    orig_config = os.path.join(tmp_path, "config_orig")
+    write(orig_config, "A=1\nLOG_LEVEL=debug\nBTS0_ARFCN=123\nBTS1_ARFCN=${BTSn}00\n")
+    config = os.path.join(tmp_path, "config")
+    write(config, "A=2\n")
+
+    run_fill_config(net_dir, "-o", orig_config, config, tmpl_dir)
+    return net_dir, tmpl_dir, config
+
+
+def test_render(tmp_path):
+    net_dir, tmpl_dir, _ = setup_net(tmp_path)
+    assert read(os.path.join(net_dir, "a.cfg")) == "a 2\nlog debug\n"
+    assert read(os.path.join(net_dir, "b.cfg")) == "bts 0 123\nbts 1 100\n"
+
+    # ${BTSn} in the value of BTS1_ARFCN outside of ${foreach(BTS)}
+    write(os.path.join(tmpl_dir, "c.cfg"), "${BTS1_ARFCN}\n")
+    run_fill_config(net_dir)
+    assert read(os.path.join(net_dir, "c.cfg")) == "100\n"
+
+
+def test_render_only_changed(tmp_path):
+    net_dir, tmpl_dir, config = setup_net(tmp_path)
+
+    # nothing changed
+    assert rendered(run_fill_config(net_dir)) == []
+    run_fill_config(net_dir, "--check-stale")
+
+    # variable used by a.cfg only
+    write(config, "A=3\n")
+    assert run_fill_config(net_dir, "--check-stale", check=False).returncode != 0
+    assert rendered(run_fill_config(net_dir)) == ["a.cfg"]
+    run_fill_config(net_dir, "--check-stale")
+
+    # included file
+    write(os.path.join(tmpl_dir, "common_log"), "log ${LOG_LEVEL} # changed\n")
+    assert rendered(run_fill_config(net_dir)) == ["a.cfg"]
+
+    # new item for ${foreach(BTS)}
+    write(config, "A=3\nBTS2_ARFCN=512\n")
+    assert rendered(run_fill_config(net_dir)) == ["b.cfg"]
+    assert read(os.path.join(net_dir, "b.cfg")) == "bts 0 123\nbts 1 100\nbts 2 512\n"
+
+    # manually modified output
+    write(os.path.join(net_dir, "a.cfg"), "modified\n")
+    assert rendered(run_fill_config(net_dir)) == ["a.cfg"]
+
+    assert rendered(run_fill_config(net_dir, "--force")) == ["a.cfg", "b.cfg"]
+
+
+def test_nested_foreach_and_recursion(tmp_path):
+    net_dir, tmpl_dir, config = setup_net(tmp_path)
+
+    write(
+        os.path.join(tmpl_dir, "c.cfg"),
+        "${foreach(BTS)}\n${foreach(TRX)}\n${BTSn}.${TRXn} ${TRXn_X}\n${foreach_end}\n${foreach_end}\n",
+    )
+    write(config, "TRX0_X=${A}\nTRX1_X=${BTSn_ARFCN}\n")
+    run_fill_config(net_dir)
+    assert read(os.path.join(net_dir, "c.cfg")) == "0.0 1\n0.1 123\n1.0 1\n1.1 100\n"
+
+    write(config, "A=${B}\nB=${A}\n")
+    result = run_fill_config(net_dir, check=False)
+    assert result.returncode != 0
+    assert "recursive variable 'A'" in result.stdout
+
+
+def test_subdir_sync(tmp_path):
+    net_dir, tmpl_dir, _ = setup_net(tmp_path)
+    os.makedirs(os.path.join(tmpl_dir, "sub/conf"))
+    write(os.path.join(tmpl_dir, "sub/conf/x.xml"), "x")
+    write(os.path.join(tmpl_dir, "sub/y.sh"), "y")
+    os.symlink("conf", os.path.join(tmpl_dir, "sub/link"))
+    run_fill_config(net_dir)
+    assert read(os.path.join(net_dir, "sub/link/x.xml")) == "x"
+
+    # files created at runtime are kept, files removed from the template dir are removed
+    write(os.path.join(net_dir, "sub/runtime.db"), "db")
+    os.remove(os.path.join(tmpl_dir, "sub/y.sh"))
+    write(os.path.join(tmpl_dir, "sub/conf/x.xml"), "x2")
+    run_fill_config(net_dir)
+    assert sorted(os.listdir(os.path.join(net_dir, "sub"))) == ["conf", "link", "runtime.db"]
+    assert read(os.path.join(net_dir, "sub/conf/x.xml")) == "x2"
+
+
+def test_template_per_item(tmp_path):
+    net_dir, tmpl_dir, config = setup_net(tmp_path)
+    write(os.path.join(tmpl_dir, "bts-${BTSn}.cfg"), "${_name} ${BTSn} ${BTSn_ARFCN} ${BTSn_IP}\n")
+    write(
+        config,
+        "BTS_COUNT=4\nBTS_IP_BASE=10.0.0.0\nBTSn_ARFCN=${add(BTSn, 600)}\nBTSn_IP=${ip_add(BTS_IP_BASE, BTSn)}\n",
+    )
+    run_fill_config(net_dir)
+    assert read(os.path.join(net_dir, "bts-0.cfg")) == "bts-0 0 123 10.0.0.0\n"
+    assert read(os.path.join(net_dir, "bts-3.cfg")) == "bts-3 3 603 10.0.0.3\n"
+    assert read(os.path.join(net_dir, "b.cfg")) == "bts 0 123\nbts 1 100\nbts 2 602\nbts 3 603\n"
+
+    # files for items that are gone get removed
+    write(config, "BTS_COUNT=2\nBTS_IP_BASE=10.0.0.0\nBTSn_IP=${ip_add(BTS_IP_BASE, BTSn)}\n")
+    assert run_fill_config(net_dir, "--check-stale", check=False).returncode != 0
+    assert rendered(run_fill_config(net_dir)) == ["b.cfg"]
+    assert sorted(f for f in os.listdir(net_dir) if f.startswith("bts-")) == ["bts-0.cfg", "bts-1.cfg"]
+    run_fill_config(net_dir, "--check-stale")
+
+
+def test_count_without_defaults(tmp_path):
+    net_dir, tmpl_dir, config = setup_net(tmp_path)
+    write(os.path.join(tmpl_dir, "subscr.cfg"), "${foreach(SUBSCR)}\n${SUBSCRn}\n${foreach_end}\nnum ${SUBSCR_COUNT}\n")
+
+    # not a family without SUBSCRn_* defaults: no million items to index
+    write(os.path.join(tmpl_dir, "subscr-${SUBSCRn}.cfg"), "${SUBSCRn}\n")
+    write(config, "SUBSCR_COUNT=1000000\n")
+    run_fill_config(net_dir)
+    assert read(os.path.join(net_dir, "subscr.cfg")) == "num 1000000\n"
+    assert not [f for f in os.listdir(net_dir) if f.startswith("subscr-")]
+
+    write(config, "SUBSCR_COUNT=2\nSUBSCRn_X=x\n")
+    run_fill_config(net_dir)
+    assert read(os.path.join(net_dir, "subscr.cfg")) == "0\n1\nnum 2\n"
+    assert sorted(f for f in os.listdir(net_dir) if f.startswith("subscr-")) == ["subscr-0.cfg", "subscr-1.cfg"]
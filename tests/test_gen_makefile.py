@@ -76,3 +76,113 @@ def test_gen_makefile_with_targets_arg(tmp_path):
     run_cmd("! grep -q '^osmo-s1gw_files :=' Makefile", cwd=tmp_path, shell=True)
     run_cmd("! grep -q '^open5gs_files :=' Makefile", cwd=tmp_path, shell=True)
     run_make_regen_2x(tmp_path)
+
+
+def test_gen_makefile_install_manifest(tmp_path):
+    # Default: plain "make install", no staging dir and manifests
+    run_cmd(["./gen_makefile.py", "-m", tmp_path, "--targets", "libosmo-netif"], cwd=osmo_dev_path)
+    run_cmd("grep -q '^\t$(MAKE) -C libosmocore install$' Makefile", cwd=tmp_path, shell=True)
+    run_cmd("! grep -q 'DESTDIR=\\|manifests/\\|^uninstall:' Makefile", cwd=tmp_path, shell=True)
+
+    run_cmd(
+        ["./gen_makefile.py", "-m", tmp_path, "--install-manifest", "--targets", "libosmo-netif"], cwd=osmo_dev_path
+    )
+    run_cmd("grep -q 'DESTDIR=.* -C libosmocore install$' Makefile", cwd=tmp_path, shell=True)
+    run_cmd("grep -q 'manifests/libosmocore.sha256$' Makefile", cwd=tmp_path, shell=True)
+    run_cmd("grep -q '^uninstall:' Makefile", cwd=tmp_path, shell=True)
+    # Dependent projects still get built from scratch after each install
+    run_cmd(
+        "grep -q '^.make.libosmo-netif.configure: .* .make.libosmocore.install ' Makefile", cwd=tmp_path, shell=True
+    )
+    run_make_regen_2x(tmp_path)
+    run_cmd("grep -q -- '--install-manifest' Makefile", cwd=tmp_path, shell=True)
+
+
+def test_gen_makefile_install_changed_only(tmp_path):
+    run_cmd(
+        ["./gen_makefile.py", "-m", tmp_path, "--install-changed-only", "--targets", "libosmo-netif"], cwd=osmo_dev_path
+    )
+    run_cmd(
+        "grep -q '^.make.libosmo-netif.configure: .* .make.libosmocore.install_pc ' Makefile", cwd=tmp_path, shell=True
+    )
+    run_cmd(
+        "grep -q '^.make.libosmo-netif.build: .* .make.libosmocore.install_files ' Makefile", cwd=tmp_path, shell=True
+    )
+    run_cmd("grep -q 'DESTDIR=.* -C libosmocore install$' Makefile", cwd=tmp_path, shell=True)
+    run_cmd("grep -q '^bench:$' Makefile", cwd=tmp_path, shell=True)
+    run_cmd("grep -q 'manifests/libosmocore.sha256$' Makefile", cwd=tmp_path, shell=True)
+    run_cmd("grep -q 'osmo-uninstall.py --prefix /usr/local libosmo-netif$' Makefile", cwd=tmp_path, shell=True)
+    run_make_regen_2x(tmp_path)
+    run_cmd(
+        "grep -q '^.make.libosmocore.install_files .make.libosmocore.install_pc:' Makefile", cwd=tmp_path, shell=True
+    )
+
+
+def test_gen_makefile_pgo(tmp_path):
+    run_cmd(["./gen_makefile.py", "-m", tmp_path, "--pgo", "osmo-mgw", "--targets", "osmo-bsc"], cwd=osmo_dev_path)
+    run_cmd("grep -q '^.make.pgo_train: .make.osmo-mgw.install$' Makefile", cwd=tmp_path, shell=True)
+    run_cmd("grep -q '^.make.osmo-bsc.configure: | .make.pgo_train$' Makefile", cwd=tmp_path, shell=True)
+    run_cmd("! grep -q '^.make.libosmocore.configure: | .make.pgo_train$' Makefile", cwd=tmp_path, shell=True)
+    run_cmd("grep -q 'cd osmo-mgw; pgo_flags=.*_pgo.sh flags ' Makefile", cwd=tmp_path, shell=True)
+    run_make_regen_2x(tmp_path)
+    run_cmd("grep -q '^osmo-mgw: .make.osmo-mgw.install .make.pgo_train$' Makefile", cwd=tmp_path, shell=True)
+
+    # Only autotools projects are supported
+    cmd = ["./gen_makefile.py", "-m", tmp_path, "--pgo", "open5gs"]
+    assert subprocess.run(cmd, cwd=osmo_dev_path, check=False).returncode != 0
+
+
+def test_gen_makefile_branch(tmp_path):
+    src_dir = os.path.join(tmp_path, "src")
+    base_dir = os.path.join(tmp_path, "base")
+    make_dir = os.path.join(tmp_path, "sigtran-x")
+    clone = os.path.join(src_dir, "libosmo-sigtran")
+    os.makedirs(clone)
+    os.makedirs(base_dir)
+    git = ["git", "-c", "user.name=t", "-c", "user.email=t@t"]
+    run_cmd(["git", "init", "-q", "-b", "master", "."], cwd=clone)
+    run_cmd([*git, "commit", "-q", "--allow-empty", "-m", "x"], cwd=clone)
+    run_cmd(["git", "branch", "feature"], cwd=clone)
+    with open(os.path.join(base_dir, "Makefile"), "w") as f:
+        f.write(".make.%.install:\n\ttouch $@\n")
+
+    gen = ["./gen_makefile.py", "-m", make_dir, "-s", src_dir, "-i", os.path.join(tmp_path, "prefix")]
+    gen += ["--targets", "osmo-msc", "--branch", "libosmo-sigtran=feature", "--base-make-dir", base_dir]
+    run_cmd(gen, cwd=osmo_dev_path)
+    run_cmd("grep -q '^### osmo-msc ###$' Makefile", cwd=make_dir, shell=True)
+    run_cmd("grep -q '^### libosmocore (from the base make dir) ###$' Makefile", cwd=make_dir, shell=True)
+    run_cmd(
+        "grep -q 'PKG_CONFIG_PATH=.*/prefix/lib/pkgconfig:/usr/local/lib/pkgconfig .*/worktrees/' Makefile",
+        cwd=make_dir,
+        shell=True,
+    )
+    run_make_regen_2x(make_dir)
+
+    # The branch is checked out in a worktree of the existing clone
+    run_cmd(["make", ".make.libosmo-sigtran.clone"], cwd=make_dir)
+    worktree = os.path.join(src_dir, "worktrees/sigtran-x/libosmo-sigtran")
+    assert run_cmd(["git", "branch", "--show-current"], cwd=worktree, capture_output=True).stdout == b"feature\n"
+    out = run_cmd([os.path.join(osmo_dev_path, "src/gits"), "wt"], cwd=src_dir, capture_output=True).stdout
+    assert out == b"libosmo-sigtran: worktrees/sigtran-x/libosmo-sigtran [feature]\n"
+
+    # Other projects are installed by the base make dir, only updated there if the base build changed
+    run_cmd(["make", ".make.libosmocore.install"], cwd=make_dir)
+    assert os.path.exists(os.path.join(base_dir, ".make.libosmocore.install"))
+    mtime = os.path.getmtime(os.path.join(make_dir, ".make.libosmocore.install"))
+    run_cmd(["make", ".make.libosmocore.install"], cwd=make_dir)
+    assert os.path.getmtime(os.path.join(make_dir, ".make.libosmocore.install")) == mtime
+
+    run_cmd(["make", "worktrees-remove"], cwd=make_dir)
+    assert not os.path.exists(worktree)
+
+    # The overlay must not install into the prefix of the base build
+    cmd = [*gen[:5], "--branch", "libosmo-sigtran=feature", "--base-make-dir", base_dir]
+    assert subprocess.run(cmd, cwd=osmo_dev_path, check=False).returncode != 0
+
+
+def test_gen_makefile_split_dwarf(tmp_path):
+    run_cmd(["./gen_makefile.py", "-m", tmp_path, "--install-dwp", "--targets", "osmo-mgw"], cwd=osmo_dev_path)
+    run_cmd("grep -q 'cd osmo-mgw; debug_ldflags=.*CFLAGS=\"-g -gsplit-dwarf\" ' Makefile", cwd=tmp_path, shell=True)
+    run_cmd("grep -q '_split_dwarf.sh dwp osmo-mgw/.install_stage$' Makefile", cwd=tmp_path, shell=True)
+    run_make_regen_2x(tmp_path)
+    run_cmd("grep -q -- '--install-dwp' Makefile", cwd=tmp_path, shell=True)
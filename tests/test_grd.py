@@ -0,0 +1,211 @@
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+import functools
+import http.server
+import json
+import os
+import subprocess
+import threading
+import urllib.parse
+
+import pytest
+
+osmo_dev_path = os.path.realpath(os.path.join(__file__, "../../"))
+grd = os.path.join(osmo_dev_path, "src/grd")
+
+
+def run_cmd(cmd, **kwargs):
+    print(f"+ {cmd}")
+    return subprocess.run(cmd, check=True, capture_output=True, encoding="UTF-8", **kwargs)
+
+
+def git_commit(path, msg, parent=None):
+    """Create a commit with an empty tree in the bare repository."""
+    tree = run_cmd(["git", "-C", path, "hash-object", "-w", "-t", "tree", "/dev/null"]).stdout.strip()
+    cmd = ["git", "-C", path, "commit-tree", tree, "-m", msg]
+    if parent:
+        cmd += ["-p", parent]
+    env = dict(os.environ, GIT_AUTHOR_NAME="osmo-dev-test", GIT_AUTHOR_EMAIL="osmo-dev@test")
+    env.update(GIT_COMMITTER_NAME="osmo-dev-test", GIT_COMMITTER_EMAIL="osmo-dev@test")
+    return run_cmd(cmd, env=env).stdout.strip()
+
+
+class GerritStandIn(http.server.SimpleHTTPRequestHandler):
+    """Answer /changes/ like gerrit, serve everything else (the git repos, via
+    git's dumb http protocol) from the directory."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if not self.path.startswith("/changes/"):
+            return super().do_GET()
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.path.startswith("/changes/?"):
+            return self.query_changes()
+        change = self.server.changes[self.path.split("?")[0].split("~")[1]]
+        etag = f'"{change["current_revision"]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = (")]}'\n" + json.dumps(change)).encode()
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def query_changes(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)["q"][0]
+        ret = []
+        for term in query.split(" OR "):
+            # "(topic:foo status:open)": all of the operators must match
+            operators = dict(op.split(":") for op in term.strip("()").split())
+            for patch_id, change in self.server.changes.items():
+                if "change" in operators and operators["change"] != patch_id:
+                    continue
+                if "topic" in operators and operators["topic"] != change.get("topic"):
+                    continue
+                if operators.get("status") == "open" and change["status"] != "NEW":
+                    continue
+                ret.append(change)
+        body = (")]}'\n" + json.dumps(ret)).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def gerrit(tmp_path):
+    serve_dir = os.path.join(tmp_path, "serve")
+    os.mkdir(serve_dir)
+    handler = functools.partial(GerritStandIn, directory=serve_dir)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.serve_dir = serve_dir
+    server.changes = {}
+    server.requests = []
+    yield server, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def add_change(server, project, patch_id, revisions, topic=None, parent="master", status="NEW"):
+    """Create the project with one commit per patch set of the change."""
+    path = os.path.join(server.serve_dir, project)
+    if not os.path.exists(path):
+        run_cmd(["git", "init", "-q", "--bare", "-b", "master", path])
+        run_cmd(["git", "-C", path, "update-ref", "refs/heads/master", git_commit(path, "initial")])
+    change = {"_number": patch_id, "project": project, "revisions": {}, "status": status}
+    if topic:
+        change["topic"] = topic
+    for rev in range(1, revisions + 1):
+        sha = git_commit(path, f"change {patch_id} patch set {rev}", parent)
+        ref = f"refs/changes/{str(patch_id)[-2:]}/{patch_id}/{rev}"
+        run_cmd(["git", "-C", path, "update-ref", ref, sha])
+        change["revisions"][sha] = {"_number": rev, "ref": ref}
+        change["current_revision"] = sha
+    run_cmd(["git", "-C", path, "update-server-info"])
+    server.changes[str(patch_id)] = change
+    return change
+
+
+def clone(tmp_path, base_url, project):
+    path = os.path.join(tmp_path, "src", project)
+    run_cmd(["git", "clone", "-q", f"{base_url}/{project}", path])
+    run_cmd(["git", "-C", path, "config", "user.email", "osmo-dev@test"])
+    run_cmd(["git", "-C", path, "config", "user.name", "osmo-dev-test"])
+    with open(os.path.join(path, ".git/info/exclude"), "a") as f:
+        f.write(".gitreview\n")
+    with open(os.path.join(path, ".gitreview"), "w") as f:
+        f.write(f"[gerrit]\nhost=gerrit.example.org\nproject={project}\n")
+    return path
+
+
+def test_current_revision_and_cache(tmp_path, gerrit):
+    server, base_url = gerrit
+    change = add_change(server, "osmo-foo", 1234, 3)
+    repo = clone(tmp_path, base_url, "osmo-foo")
+
+    run_cmd([grd, "-u", base_url, "1234"], cwd=repo)
+    assert run_cmd(["git", "rev-parse", "HEAD"], cwd=repo).stdout.strip() == change["current_revision"]
+    assert run_cmd(["git", "branch", "--show-current"], cwd=repo).stdout.strip() == "gerrit/1234_3"
+    assert server.requests[-1] == ("/changes/osmo-foo~1234?o=CURRENT_REVISION", None)
+
+    # unchanged: revalidated with the cached ETag
+    run_cmd([grd, "-u", base_url, "1234"], cwd=repo)
+    assert server.requests[-1][1] == f'"{change["current_revision"]}"'
+
+    # new patch set
+    run_cmd(["git", "checkout", "-q", "master"], cwd=repo)
+    change = add_change(server, "osmo-foo", 1234, 4)
+    run_cmd([grd, "-u", base_url, "1234"], cwd=repo)
+    assert run_cmd(["git", "branch", "--show-current"], cwd=repo).stdout.strip() == "gerrit/1234_4"
+
+    # explicit revision, no REST request
+    requests = len(server.requests)
+    run_cmd([grd, "-u", base_url, "1234", "-r", "2"], cwd=repo)
+    assert run_cmd(["git", "branch", "--show-current"], cwd=repo).stdout.strip() == "gerrit/1234_2"
+    assert len(server.requests) == requests
+
+
+def branch(repo):
+    return run_cmd(["git", "branch", "--show-current"], cwd=repo).stdout.strip()
+
+
+def test_batch(tmp_path, gerrit):
+    server, base_url = gerrit
+    a1 = add_change(server, "libosmo-a", 11, 2, topic="foo")
+    a2 = add_change(server, "libosmo-a", 12, 1, topic="foo", parent=a1["current_revision"])
+    b = add_change(server, "osmo-b", 21, 1, topic="foo")
+    c = add_change(server, "osmo-c", 31, 1)
+    add_change(server, "osmo-d", 41, 1, topic="bar")
+    repo_a = clone(tmp_path, base_url, "libosmo-a")
+    repo_b = clone(tmp_path, base_url, "osmo-b")
+    repo_c = clone(tmp_path, base_url, "osmo-c")
+
+    # one query for the topic and the extra change, then one fetch per repository
+    out = run_cmd([grd, "-u", base_url, "-t", "foo", "31"], cwd=repo_a).stdout
+    assert [path for path, _ in server.requests] == [
+        "/changes/?q=change:31+OR+%28topic:foo+status:open%29&o=CURRENT_REVISION"
+    ]
+    assert out.count("+ git fetch") == 3
+    assert branch(repo_a) == "gerrit/12_1"
+    assert run_cmd(["git", "rev-parse", "HEAD", "gerrit/11_2"], cwd=repo_a).stdout.split() == [
+        a2["current_revision"],
+        a1["current_revision"],
+    ]
+    assert run_cmd(["git", "rev-parse", "HEAD"], cwd=repo_b).stdout.strip() == b["current_revision"]
+    assert branch(repo_c) == "gerrit/31_1"
+    assert run_cmd(["git", "rev-parse", "HEAD"], cwd=repo_c).stdout.strip() == c["current_revision"]
+
+    # no clone of osmo-d
+    result = subprocess.run(
+        [grd, "-u", base_url, "-t", "bar"], check=False, cwd=repo_a, capture_output=True, encoding="UTF-8"
+    )
+    assert result.returncode != 0
+    assert "osmo-d: no git clone" in result.stdout
+
+
+def test_batch_topic_status(tmp_path, gerrit):
+    server, base_url = gerrit
+    add_change(server, "libosmo-a", 11, 1, topic="foo")
+    add_change(server, "libosmo-a", 12, 1, topic="foo", status="MERGED")
+    add_change(server, "libosmo-a", 13, 1, topic="foo", status="ABANDONED")
+    repo_a = clone(tmp_path, base_url, "libosmo-a")
+
+    # only open changes of the topic by default
+    out = run_cmd([grd, "-u", base_url, "-t", "foo"], cwd=repo_a).stdout
+    assert out.count("+ git fetch") == 1
+    assert run_cmd(["git", "branch", "--list", "gerrit/*"], cwd=repo_a).stdout.split() == ["*", "gerrit/11_1"]
+
+    run_cmd(["git", "checkout", "-q", "master"], cwd=repo_a)
+    run_cmd([grd, "-u", base_url, "-t", "foo", "--include-closed"], cwd=repo_a)
+    assert server.requests[-1][0] == "/changes/?q=topic:foo&o=CURRENT_REVISION"
+    branches = run_cmd(["git", "branch", "--list", "--format=%(refname:short)", "gerrit/*"], cwd=repo_a).stdout
+    assert branches.split() == ["gerrit/11_1", "gerrit/12_1", "gerrit/13_1"]
@@ -0,0 +1,88 @@
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+import os
+import sqlite3
+import subprocess
+import sys
+
+osmo_dev_path = os.path.realpath(os.path.join(__file__, "../../"))
+hlr_db_gen = os.path.join(osmo_dev_path, "net/hlr_db_gen.py")
+
+# the parts of osmo-hlr's sql/hlr.sql that hlr_db_gen.py touches
+SCHEMA = """
+CREATE TABLE subscriber (
+	id		INTEGER PRIMARY KEY,
+	imsi		VARCHAR(15) UNIQUE NOT NULL,
+	msisdn		VARCHAR(15) UNIQUE,
+	nam_cs		BOOLEAN NOT NULL DEFAULT 1,
+	nam_ps		BOOLEAN NOT NULL DEFAULT 1
+);
+CREATE TABLE auc_2g (
+	subscriber_id	INTEGER PRIMARY KEY,
+	algo_id_2g	INTEGER NOT NULL,
+	ki		VARCHAR(32) NOT NULL
+);
+CREATE TABLE auc_3g (
+	subscriber_id	INTEGER PRIMARY KEY,
+	algo_id_3g	INTEGER NOT NULL,
+	k		VARCHAR(32) NOT NULL,
+	op		VARCHAR(32),
+	opc		VARCHAR(32),
+	sqn		INTEGER NOT NULL DEFAULT 0,
+	ind_bitlen	INTEGER NOT NULL DEFAULT 5
+);
+CREATE UNIQUE INDEX idx_subscr_imsi ON subscriber (imsi);
+"""
+
+
+def fake_db_tool(tmp_path):
+    """osmo-hlr-db-tool that only knows 'create'."""
+    path = os.path.join(tmp_path, "osmo-hlr-db-tool")
+    with open(path, "w") as f:
+        f.write(f"#!{sys.executable}\nimport sqlite3, sys\nsqlite3.connect(sys.argv[2]).executescript({SCHEMA!r})\n")
+    os.chmod(path, 0o755)
+    return path
+
+
+def run_gen(tmp_path, *args, check=True):
+    cmd = [hlr_db_gen, "--db-tool", fake_db_tool(tmp_path), *args]
+    print(f"+ {cmd}")
+    return subprocess.run(cmd, cwd=tmp_path, check=check, capture_output=True, encoding="UTF-8")
+
+
+def query(tmp_path, sql):
+    with sqlite3.connect(os.path.join(tmp_path, "hlr.db")) as db:
+        return db.execute(sql).fetchall()
+
+
+def test_gen(tmp_path):
+    args = ["-n", "100000", "--imsi", "001010000100000", "--msisdn", "900000", "--ki", "ff".zfill(32)]
+    out = run_gen(tmp_path, *args).stdout
+    assert "added 100000 subscribers, IMSI 001010000100000..001010000199999" in out
+    rows = query(tmp_path, "SELECT id, imsi, msisdn, algo_id_2g, ki FROM subscriber JOIN auc_2g ON subscriber_id = id")
+    assert len(rows) == 100000
+    assert rows[-1] == (199999, "001010000199999", "999999", 1, "1879e".zfill(32))
+    assert query(tmp_path, "SELECT name FROM sqlite_master WHERE name = 'idx_subscr_imsi'") == [("idx_subscr_imsi",)]
+
+    # nothing to do, runtime state is kept
+    query(tmp_path, "UPDATE subscriber SET nam_cs = 0 WHERE id = 100000")
+    assert "provisioned already" in run_gen(tmp_path, *args).stdout
+    assert query(tmp_path, "SELECT nam_cs FROM subscriber WHERE id = 100000") == [(0,)]
+
+    # different range with the same ids: replaced
+    out = run_gen(tmp_path, "-n", "10", "--imsi", "001010000200000", "--k", "01" * 16, "--opc", "02" * 16).stdout
+    assert "Replacing 10 subscribers" in out
+    assert query(tmp_path, "SELECT count(*) FROM subscriber") == [(100000,)]
+    assert query(tmp_path, "SELECT imsi, msisdn, k, opc FROM subscriber JOIN auc_3g ON subscriber_id = id")[0] == (
+        "001010000200000",
+        None,
+        "01" * 16,
+        "02" * 16,
+    )
+
+    # IMSIs used by other ids: nothing changes
+    result = run_gen(tmp_path, "-n", "10", "--id", "1", "--imsi", "001010000100020", check=False)
+    assert result.returncode != 0
+    assert "UNIQUE constraint failed" in result.stdout
+    assert query(tmp_path, "SELECT count(*) FROM subscriber") == [(100000,)]
+    assert query(tmp_path, "SELECT name FROM sqlite_master WHERE name = 'idx_subscr_imsi'") == [("idx_subscr_imsi",)]
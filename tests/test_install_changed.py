@@ -0,0 +1,76 @@
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+import os
+
+from test_gen_makefile import run_cmd
+
+osmo_dev_path = os.path.realpath(os.path.join(__file__, "../../"))
+script = os.path.join(osmo_dev_path, "src/_install_changed.sh")
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_install_changed(tmp_path):
+    stage = os.path.join(tmp_path, "stage")
+    dest = os.path.join(tmp_path, "dest")
+    stamp = os.path.join(tmp_path, ".make.testproj")
+    manifest = os.path.join(dest, "usr/local/share/osmo-dev/manifests/testproj.sha256")
+    files = {
+        "usr/local/include/osmocom/core/a.h": "a",
+        "usr/local/include/osmocom/core/b.h": "b",
+        "usr/local/lib/pkgconfig/libtest.pc": "Version: 1.0",
+        "usr/local/lib/libtest.so.1.0.0": "lib v1",
+    }
+    for path, content in files.items():
+        write(os.path.join(stage, path), content)
+    os.symlink("libtest.so.1.0.0", os.path.join(stage, "usr/local/lib/libtest.so.1"))
+
+    # Install everything
+    run_cmd(["sh", "-ex", script, stage, stamp, manifest, dest])
+    assert os.readlink(os.path.join(dest, "usr/local/lib/libtest.so.1")) == "libtest.so.1.0.0"
+    for path, content in files.items():
+        with open(os.path.join(dest, path)) as f:
+            assert f.read() == content
+    for suffix in ("install_files", "install_pc"):
+        os.utime(f"{stamp}.{suffix}", (1, 1))
+    a_h = os.path.join(dest, "usr/local/include/osmocom/core/a.h")
+    os.utime(a_h, (1, 1))
+
+    # Install again with only the library changed: header and stamp for the
+    # pkg-config file keep their mtimes
+    write(os.path.join(stage, "usr/local/lib/libtest.so.1.0.0"), "lib v2")
+    out = run_cmd(["sh", "-e", script, stage, stamp, manifest, dest], capture_output=True, encoding="UTF-8").stdout
+    assert "1 of 5 installed files changed" in out
+    with open(os.path.join(dest, "usr/local/lib/libtest.so.1.0.0")) as f:
+        assert f.read() == "lib v2"
+    assert os.stat(a_h).st_mtime == 1
+    assert os.stat(f"{stamp}.install_files").st_mtime > 1
+    assert os.stat(f"{stamp}.install_pc").st_mtime == 1
+
+    # Install again with the pkg-config file changed
+    write(os.path.join(stage, "usr/local/lib/pkgconfig/libtest.pc"), "Version: 1.1")
+    run_cmd(["sh", "-ex", script, stage, stamp, manifest, dest])
+    assert os.stat(f"{stamp}.install_pc").st_mtime > 1
+    assert os.stat(a_h).st_mtime == 1
+    assert not [name for name in os.listdir(os.path.join(dest, "usr/local/lib")) if name.startswith(".osmo-dev")]
+
+    # Manifest
+    with open(manifest) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 5
+    assert lines[0].endswith(f"  {a_h}")
+    assert lines[0].startswith("ca978112ca1bbdcafac231b39a23dc4da786eff8147c4e72b9807785afee48bb")
+
+    # Install a new version that doesn't install b.h anymore: it gets listed
+    # as stale, but stays installed
+    os.unlink(os.path.join(stage, "usr/local/include/osmocom/core/b.h"))
+    out = run_cmd(["sh", "-e", script, stage, stamp, manifest, dest], capture_output=True, encoding="UTF-8").stdout
+    b_h = os.path.join(dest, "usr/local/include/osmocom/core/b.h")
+    assert f"stale (not installed anymore): {b_h}" in out
+    assert os.path.exists(b_h)
+    with open(manifest.replace(".sha256", ".stale.sha256")) as f:
+        assert f.read().splitlines()[0].endswith(f"  {b_h}")
@@ -0,0 +1,93 @@
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+
+from test_hlr_db_gen import SCHEMA
+
+osmo_dev_path = os.path.realpath(os.path.join(__file__, "../../"))
+loadgen = os.path.join(osmo_dev_path, "virt-nitb/loadgen.py")
+
+# mobile with all MS in one network that works instantly, except for MS 3
+# whose location update gets rejected
+FAKE_MOBILE = r"""
+import re, signal, socket, sys
+cfg = open(sys.argv[sys.argv.index("-c") + 1]).read()
+ip, port = re.search(r"bind (\S+) (\d+)", cfg).groups()
+imsis = re.findall(r"imsi (\d+)", cfg)
+srv = socket.create_server((ip, int(port)))
+signal.signal(signal.SIGINT, lambda *a: sys.exit(0))
+conn, _ = srv.accept()
+f = conn.makefile("rw")
+ms = None
+peer = {}
+
+def notify(name, event):
+    f.write(f"% (MS {name})\n% {event}\n")
+    f.flush()
+
+def lu(name):
+    notify(name, "Location updating rejected" if name == "3" else "Location updating accepted")
+
+for line in f:
+    cmd = line.split()
+    if cmd[:1] == ["ms"]:
+        ms = cmd[1]
+    elif cmd == ["no", "shutdown"] or cmd[:2] == ["sim", "test"]:
+        lu(ms if cmd[0] == "no" else cmd[2])
+    elif cmd[:1] == ["call"] and cmd[2] == "answer":
+        notify(peer[cmd[1]], "Call is answered")
+    elif cmd[:1] == ["call"] and cmd[2] == "hangup":
+        for name in (cmd[1], peer.pop(cmd[1], None)):
+            if name:
+                notify(name, "Call has been released")
+    elif cmd[:1] == ["call"]:
+        b = str(int(cmd[2]) - 100000 + 1)
+        peer[cmd[1]], peer[b] = b, cmd[1]
+        notify(b, f"Incoming call (from {cmd[1]})")
+    elif cmd[:1] == ["sms"]:
+        notify(cmd[1], f"SMS to {cmd[2]} successfull")
+        notify(str(int(cmd[2]) - 100000 + 1), "SMS from 1: 'loadgen'")
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_setup_and_run(tmp_path):
+    sqlite3.connect(os.path.join(tmp_path, "hlr.db")).executescript(SCHEMA)
+    vty = ["--vty-ip", "127.0.0.1", "--vty-port", str(free_port())]
+    subprocess.run([loadgen, *vty, "setup", "-n", "6"], cwd=tmp_path, check=True)
+    with sqlite3.connect(os.path.join(tmp_path, "hlr.db")) as db:
+        assert db.execute("SELECT imsi, msisdn FROM subscriber").fetchall()[-1] == ("901700000100005", "100005")
+    with open(os.path.join(tmp_path, "loadgen/mobile.cfg")) as f:
+        assert f.read().count("\nms ") == 6
+
+    fake_mobile = os.path.join(tmp_path, "fake_mobile.py")
+    with open(fake_mobile, "w") as f:
+        f.write(FAKE_MOBILE)
+    cmd = [
+        loadgen,
+        *vty,
+        "run",
+        *("--mobile", f"{sys.executable} {fake_mobile}", "--virtphy", "sh -c 'exec sleep 60' virtphy"),
+        *("-r", "call=2", "-r", "sms=2", "-d", "2", "--call-hold", "0.1", "--attach-rate", "20", "-o", "results.json"),
+    ]
+    out = subprocess.run(cmd, cwd=tmp_path, check=True, capture_output=True, encoding="UTF-8", timeout=30).stdout
+    assert "5 of 6 MS attached" in out
+
+    with open(os.path.join(tmp_path, "results.json")) as f:
+        results = json.load(f)
+    assert results["attach"]["ok"] == 5
+    assert results["attach"]["failed"] == {"attach: lu_reject": 1}
+    for proc, steps in (("call", ["setup", "answer", "release", "release_mt"]), ("sms", ["submit", "deliver"])):
+        assert results[proc]["ok"] >= 1
+        assert results[proc]["ok"] == results[proc]["attempted"]
+        assert list(results[proc]["steps"]) == steps
@@ -0,0 +1,70 @@
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+import os
+import shutil
+import subprocess
+
+osmo_dev_path = os.path.realpath(os.path.join(__file__, "../../"))
+install_changed = os.path.join(osmo_dev_path, "src/_install_changed.sh")
+osmo_uninstall = os.path.join(osmo_dev_path, "osmo-uninstall.py")
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def install(tmp_path, proj, files):
+    """Install files {path below the prefix: content} like the install target
+    of the generated Makefile."""
+    stage = os.path.join(tmp_path, "stage", proj)
+    dest = os.path.join(tmp_path, "dest")
+    shutil.rmtree(stage, ignore_errors=True)
+    for path, content in files.items():
+        write(os.path.join(stage, "usr/local", path), content)
+    manifest = os.path.join(dest, f"usr/local/share/osmo-dev/manifests/{proj}.sha256")
+    subprocess.run(
+        ["sh", "-e", install_changed, stage, os.path.join(tmp_path, f".make.{proj}"), manifest, dest],
+        check=True,
+    )
+
+
+def uninstall(prefix, *args):
+    return subprocess.run(
+        [osmo_uninstall, "--prefix", prefix, *args], check=True, capture_output=True, encoding="UTF-8"
+    ).stdout
+
+
+def test_uninstall(tmp_path):
+    prefix = os.path.join(tmp_path, "dest/usr/local")
+    install(tmp_path, "libosmocore", {"lib/libosmocore.so.21": "v1", "include/osmocom/core/utils.h": "utils"})
+    install(tmp_path, "osmo-msc", {"bin/osmo-msc": "msc", "share/doc/osmo-msc/msc.cfg": "cfg", "include/x.h": "x"})
+    install(tmp_path, "osmo-hlr", {"bin/osmo-hlr": "hlr", "include/x.h": "x"})
+
+    # New libosmocore soname, the old library is stale
+    install(tmp_path, "libosmocore", {"lib/libosmocore.so.22": "v2", "include/osmocom/core/utils.h": "utils"})
+    assert os.path.exists(os.path.join(prefix, "lib/libosmocore.so.21"))
+    out = uninstall(prefix, "--stale", "--all")
+    assert "libosmocore: removed 1 stale files" in out
+    assert not os.path.exists(os.path.join(prefix, "lib/libosmocore.so.21"))
+    assert os.path.exists(os.path.join(prefix, "lib/libosmocore.so.22"))
+
+    # Modified and missing files
+    write(os.path.join(prefix, "share/doc/osmo-msc/msc.cfg"), "modified")
+    os.unlink(os.path.join(prefix, "bin/osmo-hlr"))
+    out = uninstall(prefix, "--check", "--all")
+    assert "osmo-msc: " + os.path.join(prefix, "share/doc/osmo-msc/msc.cfg (modified)") in out
+    assert "osmo-hlr: " + os.path.join(prefix, "bin/osmo-hlr (missing)") in out
+
+    # Files of other projects and modified files are kept
+    out = uninstall(prefix, "osmo-msc")
+    assert "osmo-msc: removed 1 files, kept 2" in out
+    assert "(also installed by osmo-hlr)" in out
+    assert not os.path.exists(os.path.join(prefix, "bin/osmo-msc"))
+    assert os.path.exists(os.path.join(prefix, "include/x.h"))
+    assert os.path.exists(os.path.join(prefix, "share/doc/osmo-msc/msc.cfg"))
+
+    uninstall(prefix, "--all")
+    assert sorted(os.listdir(prefix)) == ["share"]
+    assert os.listdir(os.path.join(prefix, "share")) == ["doc"]
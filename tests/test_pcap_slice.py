@@ -0,0 +1,83 @@
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+import datetime
+import os
+import struct
+import subprocess
+
+osmo_dev_path = os.path.realpath(os.path.join(__file__, "../../"))
+pcap_slice = os.path.join(osmo_dev_path, "net/pcap_slice.py")
+
+# 2025-01-31 12:00:00 local time
+T0 = int(datetime.datetime(2025, 1, 31, 12, 0, 0).timestamp())
+
+
+def write_pcap(path, times, nsec=False, endian="<"):
+    """Write a pcap file with one packet per time (seconds after T0), the
+    packet data is the time as text. Like tcpdump, leave the mtime at the last
+    packet."""
+    with open(path, "wb") as f:
+        f.write(struct.pack(endian + "IHHiIII", 0xA1B23C4D if nsec else 0xA1B2C3D4, 2, 4, 0, 0, 262144, 1))
+        for t in times:
+            data = str(float(t)).encode()
+            sec, frac = divmod(round(t * (1_000_000_000 if nsec else 1_000_000)), 1_000_000_000 if nsec else 1_000_000)
+            f.write(struct.pack(endian + "IIII", T0 + sec, frac, len(data), len(data) + 100))
+            f.write(data)
+    os.utime(path, (T0 + times[-1], T0 + times[-1]))
+
+
+def read_pcap(path):
+    ret = []
+    with open(path, "rb") as f:
+        f.read(24)
+        while header := f.read(16):
+            sec, usec, incl_len, _ = struct.unpack("<IIII", header)
+            assert f.read(incl_len).decode() == str(round(sec - T0 + usec / 1_000_000, 1))
+            ret.append(round(sec - T0 + usec / 1_000_000, 1))
+    return ret
+
+
+def run_slice(*args):
+    cmd = [pcap_slice, *args]
+    print(f"+ {cmd}")
+    return subprocess.run(cmd, check=True, capture_output=True, encoding="UTF-8")
+
+
+def test_slice(tmp_path):
+    # ring buffer of two captures, 10 minutes each
+    pcap = os.path.join(tmp_path, "pcap")
+    os.mkdir(pcap)
+    write_pcap(os.path.join(pcap, "lo.cp.pcap0"), [0, 300.5, 600])
+    write_pcap(os.path.join(pcap, "lo.cp.pcap1"), [900, 1200])
+    write_pcap(os.path.join(pcap, "lo.up.pcap0"), [0.2, 300.2, 599.9], nsec=True)
+    write_pcap(os.path.join(pcap, "lo.up.pcap1"), [900.1, 1199.9], endian=">")
+    out = os.path.join(tmp_path, "out.pcap")
+
+    run_slice("-o", out, pcap)
+    assert read_pcap(out) == [0, 0.2, 300.2, 300.5, 599.9, 600, 900, 900.1, 1199.9, 1200]
+
+    result = run_slice("-v", "-o", out, "--from", "12:05", "--to", "2025-01-31 12:10", pcap)
+    assert read_pcap(out) == [300.2, 300.5, 599.9]
+    assert "skipping" in result.stdout and "lo.cp.pcap1" in result.stdout
+
+    run_slice("-o", out, "-f", "+15m", pcap)
+    assert read_pcap(out) == [900, 900.1, 1199.9, 1200]
+
+    result = run_slice("-v", "-o", out, "--from=-4m59s", pcap)
+    assert read_pcap(out) == [1199.9, 1200]
+    assert "skipping" in result.stdout and "lo.up.pcap0" in result.stdout
+
+
+def test_slice_many_files(tmp_path):
+    # more ring buffer files than the process may open at once
+    pcap = os.path.join(tmp_path, "pcap")
+    os.mkdir(pcap)
+    for i in range(100):
+        write_pcap(os.path.join(pcap, f"lo.cp.pcap{i:03}"), [i * 10, i * 10 + 5])
+        write_pcap(os.path.join(pcap, f"lo.up.pcap{i:03}"), [i * 10 + 2.5])
+    out = os.path.join(tmp_path, "out.pcap")
+
+    cmd = f"ulimit -n 32 && {pcap_slice} -o {out} -f +200 -t +800 {pcap}"
+    print(f"+ {cmd}")
+    subprocess.run(cmd, shell=True, check=True)
+    assert read_pcap(out) == [t + i * 10 for i in range(20, 80) for t in (0, 2.5, 5)]
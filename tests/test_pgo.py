@@ -0,0 +1,75 @@
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+import os
+import shlex
+import subprocess
+
+from test_gen_makefile import run_cmd
+
+osmo_dev_path = os.path.realpath(os.path.join(__file__, "../../"))
+script = os.path.join(osmo_dev_path, "src/_pgo.sh")
+
+MAIN_C = """
+#include <stdio.h>
+#include <stdlib.h>
+int main(int argc, char **argv)
+{
+	unsigned int sum = 0;
+	for (int i = 0; i < atoi(argv[1]); i++)
+		sum += i % 7 ? i : 1;
+	printf("%u\\n", sum);
+	return 0;
+}
+"""
+
+
+def build(src_proj, build_proj, pgo_dir):
+    """Build like configure + make of the generated Makefile with --pgo."""
+    os.makedirs(build_proj, exist_ok=True)
+    flags = run_cmd(
+        ["sh", "-e", script, "flags", pgo_dir, "testproj", src_proj],
+        cwd=build_proj,
+        capture_output=True,
+        encoding="UTF-8",
+    ).stdout.strip()
+    run_cmd(["gcc", *shlex.split(flags), "-o", "testproj", os.path.join(src_proj, "main.c")], cwd=build_proj)
+    return flags
+
+
+def test_pgo(tmp_path):
+    src_proj = os.path.join(tmp_path, "src/testproj")
+    build_proj = os.path.join(tmp_path, "make/testproj")
+    make_dir = os.path.join(tmp_path, "make")
+    pgo_dir = os.path.join(make_dir, "pgo")
+    os.makedirs(src_proj)
+    with open(os.path.join(src_proj, "main.c"), "w") as f:
+        f.write(MAIN_C)
+    run_cmd(["git", "init", "-q", "."], cwd=src_proj)
+    run_cmd(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "--allow-empty", "-m", "x"], cwd=src_proj
+    )
+    rev = run_cmd(["git", "rev-parse", "HEAD"], cwd=src_proj, capture_output=True, encoding="UTF-8").stdout.strip()
+    profile_dir = os.path.join(pgo_dir, "testproj", rev)
+
+    # No profile yet: instrumented build
+    assert "-fprofile-generate" in build(src_proj, build_proj, pgo_dir)
+    with open(os.path.join(make_dir, ".make.testproj.configure"), "w"):
+        pass
+
+    # Training: fails if the workload doesn't run the program
+    train = ["sh", "-e", script, "train", "true", "testproj=testproj"]
+    assert subprocess.run(train, cwd=make_dir, check=False).returncode != 0
+    train[4] = "echo $PGO_PROJECTS >projects; testproj/testproj 100000"
+    out = run_cmd(train, cwd=make_dir, capture_output=True, encoding="UTF-8").stdout
+    assert "testproj: profile complete" in out
+    assert os.path.exists(os.path.join(profile_dir, ".complete"))
+    assert not os.path.exists(os.path.join(make_dir, ".make.testproj.configure"))
+    with open(os.path.join(make_dir, "projects")) as f:
+        assert f.read() == "testproj\n"
+
+    # Optimized build with the profile, nothing to train afterwards
+    flags = build(src_proj, build_proj, pgo_dir)
+    assert "-fprofile-use -fprofile-partial-training" in flags
+    assert f"-fprofile-dir={profile_dir}" in flags
+    out = run_cmd(train, cwd=make_dir, capture_output=True, encoding="UTF-8").stdout
+    assert "all profiles are up to date" in out
@@ -0,0 +1,31 @@
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+import os
+import shlex
+
+from test_gen_makefile import run_cmd
+
+osmo_dev_path = os.path.realpath(os.path.join(__file__, "../../"))
+script = os.path.join(osmo_dev_path, "src/_split_dwarf.sh")
+
+
+def test_split_dwarf(tmp_path):
+    with open(os.path.join(tmp_path, "main.c"), "w") as f:
+        f.write("int main(void) { return 0; }\n")
+
+    # Build like configure + make of the generated Makefile with --split-dwarf
+    ldflags = run_cmd(["sh", "-e", script, "ldflags"], capture_output=True, encoding="UTF-8").stdout.strip()
+    run_cmd(["gcc", "-g", "-gsplit-dwarf", "-c", "main.c"], cwd=tmp_path)
+    assert os.path.exists(os.path.join(tmp_path, "main.dwo"))
+    run_cmd(["gcc", *shlex.split(ldflags), "-o", "prog", "main.o"], cwd=tmp_path)
+    if ldflags:
+        sections = run_cmd(["readelf", "-S", "prog"], cwd=tmp_path, capture_output=True, encoding="UTF-8").stdout
+        assert ".gdb_index" in sections
+
+    # --install-dwp: only ELF files with split debug info get a .dwp file
+    stage_bin = os.path.join(tmp_path, "stage/usr/local/bin")
+    os.makedirs(stage_bin)
+    run_cmd(["cp", "prog", "main.c", stage_bin], cwd=tmp_path)
+    run_cmd(["gcc", "-g", "-o", os.path.join(stage_bin, "prog-nosplit"), "main.c"], cwd=tmp_path)
+    run_cmd(["sh", "-e", script, "dwp", "stage"], cwd=tmp_path)
+    assert sorted(os.listdir(stage_bin)) == ["main.c", "prog", "prog-nosplit", "prog.dwp"]
@@ -0,0 +1,59 @@
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+import json
+import os
+import socket
+import subprocess
+import time
+
+osmo_dev_path = os.path.realpath(os.path.join(__file__, "../../"))
+statsd = os.path.join(osmo_dev_path, "net/statsd.py")
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_collect_and_report(tmp_path):
+    port = free_port()
+    output = os.path.join(tmp_path, "statsd.jsonl")
+    proc = subprocess.Popen(
+        [statsd, "run", "-l", f"127.0.0.1:{port}", "-o", output, "-i", "0.5"],
+        stdout=subprocess.PIPE,
+        encoding="UTF-8",
+    )
+    assert "listening" in proc.stdout.readline()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(*lines):
+        sock.sendto("\n".join(lines).encode(), ("127.0.0.1", port))
+
+    send("osmo-bsc-0.bsc.0.paging.attempted:10|c", "osmo-bsc-0.bsc.0.paging.expired:2|c")
+    send("osmo-msc.msc.0.active_calls:3|g", "osmo-mgw-for-msc.mgw.0.crcx.success:5|c|@0.5", "garbage")
+    time.sleep(0.7)
+    send("osmo-bsc-0.bsc.0.paging.attempted:20|c", "osmo-msc.msc.0.active_calls:-1|g")
+    time.sleep(0.2)
+    proc.terminate()
+    assert "received 3 packets (1 invalid lines)" in proc.communicate()[0]
+
+    with open(output) as f:
+        intervals = [json.loads(line) for line in f]
+    assert sum(i.get("c", {}).get("osmo-bsc-0.bsc.0.paging.attempted", 0) for i in intervals) == 30
+    assert [i["g"]["osmo-msc.msc.0.active_calls"] for i in intervals if "g" in i] == [3, 2]
+
+    summary = json.loads(subprocess.check_output([statsd, "report", "--json", output]))
+    attempted = summary["osmo-bsc-0"]["counters"]["bsc.0.paging.attempted"]
+    assert attempted["total"] == 30
+    assert attempted["max"] > attempted["rate"] > 0
+    assert summary["osmo-mgw-for-msc"]["counters"]["mgw.0.crcx.success"]["total"] == 10
+    gauge = summary["osmo-msc"]["gauges"]["msc.0.active_calls"]
+    assert (gauge["last"], gauge["min"], gauge["max"]) == (2, 2, 3)
+
+    out = subprocess.check_output([statsd, "report", output], encoding="UTF-8")
+    assert "== osmo-bsc-0" in out
+    failures = out.split("== failures")[1]
+    assert "osmo-bsc-0.bsc.0.paging.expired" in failures
+    assert "attempted" not in failures
@@ -0,0 +1,93 @@
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+import json
+import os
+import signal
+import socket
+import subprocess
+import time
+
+osmo_dev_path = os.path.realpath(os.path.join(__file__, "../../"))
+supervisor = os.path.join(osmo_dev_path, "net/supervisor.py")
+
+# Stand-in for an Osmocom program: listen on the VTY port from its config
+fake_hlr = """#!/usr/bin/env python3
+import os, socket, time
+s = socket.socket()
+s.bind(("127.0.0.1", int(open("osmo-hlr.cfg").read().split()[-1])))
+s.listen()
+print("listening", os.environ.get("FAKE_HLR_VAR"), flush=True)
+while True:
+    time.sleep(1)
+"""
+
+
+def write(path, content, mode=0o644):
+    with open(path, "w") as f:
+        f.write(content)
+    os.chmod(path, mode)
+
+
+def read_state(net_dir):
+    with open(os.path.join(net_dir, "run/supervisor.json")) as f:
+        return {p["title"]: p for p in json.load(f)["programs"]}
+
+
+def wait_for(cond, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if cond():
+                return
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.1)
+    raise AssertionError("timeout")
+
+
+def test_supervisor(tmp_path):
+    net_dir = str(tmp_path)
+    bin_dir = os.path.join(net_dir, "bin")
+    os.mkdir(bin_dir)
+    write(os.path.join(bin_dir, "osmo-hlr"), fake_hlr, 0o755)
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    write(os.path.join(net_dir, "osmo-hlr.cfg"), f"line vty\n bind 127.0.0.1 {port}\n")
+    write(
+        os.path.join(net_dir, "list"),
+        "HLR\tFAKE_HLR_VAR=1 osmo-hlr --db-upgrade\nCRASH\tsh -c 'echo crashing; exit 3'\n",
+    )
+
+    env = dict(os.environ, PATH=f"{bin_dir}:{os.environ['PATH']}")
+    cmd = [supervisor, "run", "list", "--log-max-size", "100", "--log-keep", "1", "--interval", "0.1"]
+    proc = subprocess.Popen(cmd, cwd=net_dir, env=env)
+    try:
+        wait_for(lambda: read_state(net_dir)["HLR"]["state"] == "ready")
+        assert read_state(net_dir)["HLR"]["vty"] == f"127.0.0.1:{port}"
+        assert read_state(net_dir)["HLR"]["restarts"] == 0
+
+        # restarted after 1, then 2 seconds
+        wait_for(lambda: read_state(net_dir)["CRASH"]["restarts"] >= 2)
+        assert read_state(net_dir)["CRASH"]["last_exit"] == 3
+        result = subprocess.run([supervisor, "status"], check=False, cwd=net_dir, capture_output=True, encoding="UTF-8")
+        assert result.returncode in (0, 1)
+        assert "HLR          ready" in result.stdout
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(10)
+
+    state = read_state(net_dir)
+    assert state["HLR"]["state"] == "stopped"
+    assert state["CRASH"]["state"] == "stopped"
+
+    # rotated at 100 bytes, one old log kept
+    logs = sorted(f for f in os.listdir(os.path.join(net_dir, "current_log")) if f.startswith("CRASH"))
+    assert logs == ["CRASH.log", "CRASH.log.1"]
+    with open(os.path.join(net_dir, "current_log/HLR.log")) as f:
+        assert "listening 1" in f.read()
+
+    result = subprocess.run([supervisor, "status"], check=False, cwd=net_dir, capture_output=True, encoding="UTF-8")
+    assert result.returncode == 1
+    assert "is not running" in result.stdout
@@ -0,0 +1,181 @@
+# Copyright 2025 sysmocom - s.f.m.c. GmbH
+# SPDX-License-Identifier: GPL-3.0-or-later
+import os
+import subprocess
+
+osmo_dev_path = os.path.realpath(os.path.join(__file__, "../../"))
+script = os.path.join(osmo_dev_path, "sysmobts-calib.py")
+
+# Stand-in for ssh: run the command locally, with /etc/osmocom of each "BTS"
+# in $FAKE_ROOT/<host>/etc/osmocom.
+fake_ssh = """#!/bin/sh
+while [ $# -gt 0 ]; do
+    case "$1" in
+    -o) shift 2 ;;
+    -O) exit 0 ;;
+    *) break ;;
+    esac
+done
+export FAKE_HOST="$1"
+shift
+cmd="$(printf "%s" "$*" | sed "s|/etc/osmocom|$FAKE_ROOT/$FAKE_HOST/etc/osmocom|g")"
+exec sh -c "$cmd"
+"""
+
+# Stand-in for sysmobts-calib on the BTS: bts-bad finds no ARFCN. The others
+# measure the values listed in $FAKE_ROOT/<host>/values one after another, or
+# 1000 + 10 * the number in their hostname.
+fake_calib = """#!/bin/sh
+nr="${FAKE_HOST#bts-}"
+values="$FAKE_ROOT/$FAKE_HOST/values"
+case "$*" in
+*"-m scan"*)
+    [ "$FAKE_HOST" = bts-bad ] && exit 1
+    echo "$FAKE_HOST" >> "$FAKE_ROOT/scan.log"
+    echo "ARFCN 12: -70 dBm"
+    echo "ARFCN 34: -50 dBm"
+    ;;
+*)
+    if [ -s "$values" ]; then
+        echo "The calibration value is: $(head -n1 "$values")"
+        sed -i 1d "$values"
+    else
+        echo "The calibration value is: $((1000 + 10 * nr))"
+    fi
+    ;;
+esac
+"""
+
+
+def write(path, content, mode=0o644):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    os.chmod(path, mode)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def setup_fake_bts(tmp_path):
+    bin_dir = os.path.join(tmp_path, "bin")
+    fake_root = os.path.join(tmp_path, "root")
+    write(os.path.join(bin_dir, "ssh"), fake_ssh, 0o755)
+    write(os.path.join(bin_dir, "sysmobts-calib"), fake_calib, 0o755)
+    write(os.path.join(bin_dir, "systemctl"), '#!/bin/sh\necho "$FAKE_HOST $*" >> $FAKE_ROOT/systemctl.log\n', 0o755)
+    env = dict(os.environ, PATH=f"{bin_dir}:{os.environ['PATH']}", FAKE_ROOT=fake_root)
+    env["XDG_CACHE_HOME"] = os.path.join(tmp_path, "cache")
+    return fake_root, env
+
+
+def test_fleet(tmp_path):
+    fake_root, env = setup_fake_bts(tmp_path)
+
+    hosts = ["bts-1", "bts-2", "bts-3", "bts-bad"]
+    for host in hosts:
+        write(os.path.join(fake_root, host, "etc/osmocom/osmo-bts-sysmo.cfg"), "phy 0\n instance 0\n")
+    write(
+        os.path.join(fake_root, "bts-2/etc/osmocom/osmo-bts-sysmo.cfg"),
+        "phy 0\n instance 0\n  clock-calibration 1020\n",
+    )
+    write(os.path.join(tmp_path, "inventory"), "# host band arfcn\nbts-1\nbts-2 1800\nbts-3 900 56\nbts-bad\n")
+
+    report_dir = os.path.join(tmp_path, "report")
+    cmd = [script, "--fleet", "inventory", "-n", "2", "-j", "2", "-o", report_dir]
+    result = subprocess.run(
+        cmd, check=False, cwd=tmp_path, env=env, input="ok\n", capture_output=True, encoding="UTF-8"
+    )
+    print(result.stdout)
+    assert result.returncode == 1
+    assert result.stdout.count("? (ok, no)") == 1
+
+    def cfg(host):
+        return read(os.path.join(fake_root, host, "etc/osmocom/osmo-bts-sysmo.cfg"))
+
+    assert cfg("bts-1") == "phy 0\n instance 0\n  clock-calibration 1010\n"
+    assert cfg("bts-2") == "phy 0\n instance 0\n  clock-calibration 1020\n"
+    assert cfg("bts-3") == "phy 0\n instance 0\n  clock-calibration 1030\n"
+    assert cfg("bts-bad") == "phy 0\n instance 0\n"
+
+    report = read(os.path.join(report_dir, "report.txt")).splitlines()
+    assert report[1].split() == ["bts-1", "34", "0", "1010", "0.0", "written", "1010", "1010"]
+    assert report[2].split() == ["bts-2", "34", "1020", "1020", "0.0", "unchanged", "1020", "1020"]
+    assert report[3].split() == ["bts-3", "56", "0", "1030", "0.0", "written", "1030", "1030"]
+    assert report[4].split()[:5] == ["bts-bad", "-", "0", "0", "-"]
+    assert "Error while scanning bands" in report[4]
+    assert sorted(os.listdir(report_dir)) == ["bts-1.log", "bts-2.log", "bts-3.log", "bts-bad.log", "report.txt"]
+    assert "-b 1800" in read(os.path.join(report_dir, "bts-2.log"))
+
+    # the service is started again on all of them, also the one that failed
+    started = read(os.path.join(fake_root, "systemctl.log")).splitlines()
+    assert sorted(started[-4:]) == [f"{host} start osmo-bts-sysmo" for host in hosts]
+
+
+def test_early_stop(tmp_path):
+    fake_root, env = setup_fake_bts(tmp_path)
+    write(os.path.join(fake_root, "bts-1/etc/osmocom/osmo-bts-sysmo.cfg"), "phy 0\n instance 0\n")
+
+    def calibrate(values, *args):
+        write(os.path.join(fake_root, "bts-1/values"), "".join(f"{v}\n" for v in values))
+        cmd = [script, "-a", "34", *args, "bts-1"]
+        result = subprocess.run(cmd, check=True, env=env, input="no\n", capture_output=True, encoding="UTF-8")
+        print(result.stdout)
+        lines = result.stdout.splitlines()
+        passes = [line for line in lines if line.startswith("pass ")]
+        results = [line for line in lines if line.startswith("RESULT: ")]
+        return passes[-1], results[-1]
+
+    # stable values: stop after --min-passes, the outlier does not count
+    assert calibrate([1000, 1002, 1001, 1001], "--ci", "5") == ("pass 3 of 15", "RESULT: 1001  (was 0)")
+    assert calibrate([1000, 1002, 5000, 1001, 999], "--ci", "5") == ("pass 4 of 15", "RESULT: 1001  (was 0)")
+
+    # noisy values: continue up to --passes
+    assert calibrate([900, 1100] * 5, "--ci", "5", "-n", "10")[0] == "pass 10 of 10"
+
+    # without --ci, always run all passes
+    assert calibrate([1000] * 7)[0] == "pass 7 of 7"
+
+
+def test_scan_cache(tmp_path):
+    fake_root, env = setup_fake_bts(tmp_path)
+    write(os.path.join(fake_root, "bts-1/etc/osmocom/osmo-bts-sysmo.cfg"), "phy 0\n instance 0\n")
+
+    def calibrate(*args):
+        cmd = [script, "-n", "1", *args, "bts-1"]
+        result = subprocess.run(cmd, check=True, env=env, input="no\n", capture_output=True, encoding="UTF-8")
+        print(result.stdout)
+        return [line for line in result.stdout.splitlines() if line.startswith("Using ARFCN")]
+
+    def scans():
+        return len(read(os.path.join(fake_root, "scan.log")).splitlines())
+
+    assert calibrate() == ["Using ARFCN '34'"]
+    assert scans() == 1
+    assert os.path.exists(os.path.join(tmp_path, "cache/sysmobts-calib/bts-1-900.json"))
+
+    # cached scan result, also with the next strongest ARFCN
+    assert calibrate("-k", "2") == ["Using ARFCN '34'", "Using ARFCN '12'"]
+    assert scans() == 1
+
+    # other band, or cache too old
+    calibrate("-b", "1800")
+    assert scans() == 2
+    calibrate("--scan-max-age", "0")
+    assert scans() == 3
+
+
+def test_set_calib_val(tmp_path):
+    fake_root, env = setup_fake_bts(tmp_path)
+    cfg = os.path.join(fake_root, "bts-1/etc/osmocom/osmo-bts-sysmo.cfg")
+    write(cfg, "phy 0\n instance 0\n  clock-calibration 1010\n")
+
+    subprocess.run([script, "-I", "0", "bts-1"], check=True, env=env)
+    assert read(cfg) == "phy 0\n instance 0\n  clock-calibration 0\n"
+
+    # rejected by argparse, before connecting to the BTS
+    result = subprocess.run([script, "-I", "abc", "bts-1"], check=False, env=env, capture_output=True, encoding="UTF-8")
+    assert result.returncode == 2
+    assert "invalid int value: 'abc'" in result.stderr
+    assert read(cfg) == "phy 0\n instance 0\n  clock-calibration 0\n"
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""Load generator for the virt-nitb network: many virtual phones making calls,
+sending SMS and doing location updates at a given rate, measuring how long
+each step takes and how often it fails.
+
+"loadgen.py setup -n N" writes loadgen/mobile.cfg with N MS and adds their
+subscribers to hlr.db (with ../net/hlr_db_gen.py; run it while osmo-hlr is
+not running, like create_hlr_subscribers.sh).
+
+"loadgen.py run --rate call=0.5 --rate sms=2 -d 300", with the network of
+run.sh up, starts one virtphy per MS and one mobile for all of them, switches
+the MS on one by one (each does a location update), and then starts the
+procedures at the given rates per second for the duration, each between MS
+that are idle. mobile is driven through its VTY, which also tells about
+incoming calls, answered calls, sent SMS and location updates. At the end, it
+prints the success rate and the latency of each step of each procedure, and
+writes the same as JSON (-o).
+
+Procedures and the steps that are measured:
+  attach: attach (location update after switching the MS on, once per MS)
+  call: setup (until the called MS rings), answer (until the caller sees the
+        call answered), release and release_mt (after --call-hold seconds,
+        until the calling and the called MS have released the call)
+  sms:  submit (until the sending MS has sent the SMS), deliver (until the
+        receiving MS got it)
+  lu:   lu (location update after removing and inserting the SIM)"""
+
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import random
+import re
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+# What mobile notifies on its VTY (vty_notify()): a "% (MS <name>)" line,
+# followed by "% <event>" lines
+ms_line_re = re.compile(r"^% \(MS (\S+)\)")
+EVENTS = (
+    ("lu", re.compile(r"location updat\w* accept", re.IGNORECASE)),
+    ("lu_reject", re.compile(r"location updat\w* reject", re.IGNORECASE)),
+    ("incoming", re.compile(r"incoming call", re.IGNORECASE)),
+    ("answered", re.compile(r"call (is|has been) answered", re.IGNORECASE)),
+    ("released", re.compile(r"call (has been )?released|call disconnected", re.IGNORECASE)),
+    ("sms_sent", re.compile(r"sms to .* success", re.IGNORECASE)),
+    ("sms_failed", re.compile(r"sms to .* fail", re.IGNORECASE)),
+    ("sms_received", re.compile(r"sms from", re.IGNORECASE)),
+)
+
+PROCEDURES = ("call", "sms", "lu")
+
+
+def error(msg):
+    print(f"ERROR: {msg}")
+    sys.exit(1)
+
+
+def ms_name(n):
+    return str(n + 1)
+
+
+def ms_number(args, n, which):
+    return f"{int(args.first[which]) + n:0{len(args.first[which])}d}"
+
+
+def ms_ki(args, n):
+    return f"{int(args.ki, 16) + n:032x}"
+
+
+def setup(args):
+    """Write the mobile config for all MS and add their subscribers to the HLR."""
+    args.first = {"imsi": args.imsi, "msisdn": args.msisdn}
+    os.makedirs(args.dir, exist_ok=True)
+    with open(os.path.join(args.dir, "mobile.cfg"), "w") as f:
+        f.write(f"line vty\n bind {args.vty_ip} {args.vty_port}\n\n")
+        for n in range(args.count):
+            ki = " ".join(ms_ki(args, n)[i : i + 2] for i in range(0, 32, 2))
+            f.write(
+                f"ms {ms_name(n)}\n"
+                f" layer2-socket /tmp/osmocom_l2_loadgen_{n}\n"
+                f" sap-socket /tmp/osmocom_sap_loadgen_{n}\n"
+                f" imei {35000000000000 + n:014d}0\n"
+                " sim test\n"
+                " test-sim\n"
+                f"  imsi {ms_number(args, n, 'imsi')}\n"
+                f"  ki comp128 {ki}\n"
+                "  no barred-access\n"
+                f"  rplmn {args.imsi[:3]} {args.imsi[3:5]}\n"
+                # switched on by "run", for measuring the attach of each MS
+                " shutdown\n\n"
+            )
+        f.write(f"log file {args.dir}/mobile.log\n logging filter all 1\n logging level set-all notice\n")
+    print(f"Wrote {args.dir}/mobile.cfg with {args.count} MS")
+
+    cmd = [
+        os.path.join(os.path.dirname(os.path.realpath(__file__)), "../net/hlr_db_gen.py"),
+        *("--db", args.db, "--count", str(args.count), "--id", str(args.subscr_id)),
+        *("--imsi", args.imsi, "--msisdn", args.msisdn, "--ki", args.ki),
+    ]
+    if subprocess.run(cmd, check=False).returncode:
+        error("adding the subscribers to the HLR failed")
+
+
+class Vty:
+    """Connection to the VTY of mobile, collects the events it notifies about."""
+
+    def __init__(self, addr, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.sock = socket.create_connection(addr, timeout=1)
+                break
+            except OSError as e:
+                if time.monotonic() > deadline:
+                    error(f"cannot connect to the VTY of mobile at {addr[0]}:{addr[1]}: {e}")
+                time.sleep(0.1)
+        self.sock.settimeout(None)
+        self.lock = threading.Lock()
+        self.cond = threading.Condition()
+        # {ms_name: [(time, event)]}
+        self.events = {}
+        self.closed = False
+        threading.Thread(target=self.read, daemon=True).start()
+        self.send("enable")
+
+    def send(self, *lines):
+        with self.lock:
+            self.sock.sendall("".join(line + "\n" for line in lines).encode())
+
+    def read(self):
+        buf = b""
+        ms = None
+        while True:
+            data = self.sock.recv(65536)
+            if not data:
+                with self.cond:
+                    self.closed = True
+                    self.cond.notify_all()
+                return
+            buf += data
+            *lines, buf = buf.split(b"\n")
+            for line in lines:
+                line = line.decode("utf-8", "replace").strip()
+                m = ms_line_re.match(line)
+                if m:
+                    ms = m.group(1)
+                    continue
+                if ms is None or not line.startswith("% "):
+                    continue
+                for event, event_re in EVENTS:
+                    if event_re.search(line):
+                        with self.cond:
+                            self.events.setdefault(ms, []).append((time.monotonic(), event))
+                            self.cond.notify_all()
+                        break
+
+    def wait(self, ms, events, since, timeout):
+        """Wait for one of events of MS ms, that happened after since. Return
+        (event, time), or None on timeout."""
+        deadline = since + timeout
+        with self.cond:
+            while True:
+                for t, event in self.events.get(ms, []):
+                    if t >= since and event in events:
+                        return event, t
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self.closed:
+                    return None
+                self.cond.wait(remaining)
+
+    def forget(self, ms, before):
+        with self.cond:
+            self.events[ms] = [e for e in self.events.get(ms, []) if e[0] >= before]
+
+
+class Failed(Exception):
+    pass
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # {procedure: {"attempted": n, "ok": n, "skipped": n, "failed": {reason: n}, "steps": {step: [s]}}}
+        self.procs = {}
+
+    def proc(self, name):
+        return self.procs.setdefault(name, {"attempted": 0, "ok": 0, "skipped": 0, "failed": {}, "steps": {}})
+
+    def skipped(self, name):
+        with self.lock:
+            self.proc(name)["skipped"] += 1
+
+    def add(self, name, steps, reason=None):
+        with self.lock:
+            p = self.proc(name)
+            p["attempted"] += 1
+            for step, latency in steps.items():
+                p["steps"].setdefault(step, []).append(latency)
+            if reason:
+                p["failed"][reason] = p["failed"].get(reason, 0) + 1
+            else:
+                p["ok"] += 1
+
+    def summary(self):
+        ret = {}
+        for name, p in sorted(self.procs.items()):
+            s = {k: p[k] for k in ("attempted", "ok", "skipped", "failed")}
+            s["success_rate"] = p["ok"] / p["attempted"] if p["attempted"] else None
+            s["steps"] = {}
+            for step, values in p["steps"].items():
+                values = sorted(values)
+                s["steps"][step] = {
+                    "count": len(values),
+                    **{f"p{q}": values[max(0, math.ceil(q / 100 * len(values)) - 1)] for q in (50, 95, 99)},
+                    "max": values[-1],
+                }
+            ret[name] = s
+        return ret
+
+
+class LoadGen:
+    def __init__(self, args, vty, stats):
+        self.args = args
+        self.vty = vty
+        self.stats = stats
+        self.lock = threading.Lock()
+        self.idle = set()
+
+    def take(self, count):
+        with self.lock:
+            if len(self.idle) < count:
+                return None
+            ms = random.sample(sorted(self.idle), count)
+            self.idle -= set(ms)
+            return ms
+
+    def give_back(self, ms):
+        with self.lock:
+            self.idle |= set(ms)
+
+    def step(self, steps, name, ms, events, since, timeout=None):
+        result = self.vty.wait(ms, events, since, timeout or self.args.timeout)
+        if result is None:
+            raise Failed(f"{name}: timeout")
+        event, t = result
+        if event != events[0]:
+            raise Failed(f"{name}: {event}")
+        steps[name] = t - since
+        return t
+
+    def attach(self, n):
+        ms = ms_name(n)
+        steps = {}
+        try:
+            t = time.monotonic()
+            self.vty.send("configure terminal", f"ms {ms}", "no shutdown", "end")
+            self.step(steps, "attach", ms, ("lu", "lu_reject"), t, self.args.attach_timeout)
+            self.give_back([ms])
+            self.stats.add("attach", steps)
+        except Failed as e:
+            self.stats.add("attach", steps, str(e))
+
+    def call(self, steps, a, b):
+        t = time.monotonic()
+        self.vty.send(f"call {a} {self.number(b)}")
+        try:
+            t = self.step(steps, "setup", b, ("incoming",), t)
+            self.vty.send(f"call {b} answer")
+            self.step(steps, "answer", a, ("answered", "released"), t)
+        except Failed:
+            # hang up what is left of the call, so that both MS are idle again
+            self.vty.send(f"call {a} hangup", f"call {b} hangup")
+            raise
+        time.sleep(self.args.call_hold)
+        t = time.monotonic()
+        self.vty.send(f"call {a} hangup")
+        self.step(steps, "release", a, ("released",), t)
+        self.step(steps, "release_mt", b, ("released",), t)
+
+    def sms(self, steps, a, b):
+        t = time.monotonic()
+        self.vty.send(f"sms {a} {self.number(b)} loadgen")
+        self.step(steps, "submit", a, ("sms_sent", "sms_failed"), t)
+        self.step(steps, "deliver", b, ("sms_received",), t)
+
+    def lu(self, steps, a):
+        self.vty.send(f"sim remove {a}")
+        time.sleep(0.5)
+        t = time.monotonic()
+        self.vty.send(f"sim test {a}")
+        self.step(steps, "lu", a, ("lu", "lu_reject"), t)
+
+    def number(self, ms):
+        return ms_number(self.args, int(ms) - 1, "msisdn")
+
+    def start(self, proc):
+        ms = self.take(1 if proc == "lu" else 2)
+        if ms is None:
+            self.stats.skipped(proc)
+            return
+        steps = {}
+        try:
+            getattr(self, proc)(steps, *ms)
+            self.stats.add(proc, steps)
+        except Failed as e:
+            self.stats.add(proc, steps, str(e))
+        # leave the MS alone until late notifications of this procedure are
+        # through, so they don't count for the next one
+        time.sleep(1)
+        for m in ms:
+            self.vty.forget(m, time.monotonic())
+        self.give_back(ms)
+
+
+def parse_rates(rates):
+    ret = {}
+    for rate in rates:
+        proc, _, value = rate.partition("=")
+        if proc not in PROCEDURES:
+            error(f"unknown procedure {proc!r} in --rate, must be one of {', '.join(PROCEDURES)}")
+        try:
+            ret[proc] = float(value)
+        except ValueError:
+            error(f"invalid --rate {rate!r}, expected e.g. call=0.5")
+    return ret
+
+
+def run(args):
+    args.first = {"imsi": args.imsi, "msisdn": args.msisdn}
+    rates = parse_rates(args.rate)
+    cfg = os.path.join(args.dir, "mobile.cfg")
+    with open(cfg) as f:
+        count = f.read().count("\nms ")
+    if not count:
+        error(f"no MS in {cfg}, run 'loadgen.py setup' first")
+
+    procs = []
+    for n in range(count):
+        cmd = shlex.split(args.virtphy) + ["-s", f"/tmp/osmocom_l2_loadgen_{n}"]
+        procs.append(subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    mobile = subprocess.Popen(
+        shlex.split(args.mobile) + ["-c", cfg], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    stats = Stats()
+    try:
+        vty = Vty((args.vty_ip, args.vty_port), 10)
+        lg = LoadGen(args, vty, stats)
+
+        print(f"Switching on {count} MS, {args.attach_rate} per second")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=count) as pool:
+            for n in range(count):
+                pool.submit(lg.attach, n)
+                time.sleep(1 / args.attach_rate)
+        attached = len(lg.idle)
+        print(f"{attached} of {count} MS attached")
+        if not attached:
+            error("no MS attached to the network")
+
+        print(f"Running {', '.join(f'{p} {r}/s' for p, r in rates.items())} for {args.duration}s")
+        t_start = time.monotonic()
+        next_start = {proc: t_start for proc in rates if rates[proc] > 0}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=count) as pool:
+            while next_start:
+                proc, t = min(next_start.items(), key=lambda i: i[1])
+                if t - t_start >= args.duration:
+                    break
+                time.sleep(max(0, t - time.monotonic()))
+                pool.submit(lg.start, proc)
+                next_start[proc] = t + 1 / rates[proc]
+    finally:
+        # SIGINT: mobile detaches all MS from the network before exiting
+        mobile.send_signal(signal.SIGINT)
+        try:
+            mobile.wait(5)
+        except subprocess.TimeoutExpired:
+            mobile.kill()
+        for p in procs:
+            p.terminate()
+            p.wait()
+
+    summary = stats.summary()
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=1)
+
+
+def print_summary(summary):
+    for proc, s in summary.items():
+        rate = f"{s['success_rate'] * 100:.1f}%" if s["success_rate"] is not None else "-"
+        print(f"\n{proc}: {s['ok']}/{s['attempted']} ok ({rate}), {s['skipped']} skipped (no idle MS)")
+        for reason, n in sorted(s["failed"].items()):
+            print(f"  failed: {reason}: {n}")
+        for step, st in s["steps"].items():
+            ms = " ".join(f"{k} {st[k] * 1000:.0f}ms" for k in ("p50", "p95", "p99", "max"))
+            print(f"  {step:<10} {st['count']:>6}x  {ms}")
+
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--dir", default="loadgen", help="for mobile.cfg and its log (default: %(default)s)")
+parser.add_argument("--vty-ip", default="127.0.0.20", help="VTY of the loadgen mobile (default: %(default)s)")
+parser.add_argument("--vty-port", type=int, default=4247, help="default: %(default)s")
+parser.add_argument("--imsi", default="901700000100000", help="IMSI of the first MS (default: %(default)s)")
+parser.add_argument("--msisdn", default="100000", help="MSISDN of the first MS (default: %(default)s)")
+parser.add_argument(
+    "--ki", default="00000000000000000000000000100000", help="Ki of the first MS (default: %(default)s)"
+)
+sub = parser.add_subparsers(dest="action", required=True)
+
+p_setup = sub.add_parser("setup", help="write the mobile config and add the subscribers to the HLR")
+p_setup.add_argument("-n", "--count", type=int, default=10, help="number of MS (default: %(default)s)")
+p_setup.add_argument("--db", default="hlr.db", help="default: %(default)s")
+p_setup.add_argument("--subscr-id", type=int, default=100000, help="HLR id of the first MS (default: %(default)s)")
+
+p_run = sub.add_parser("run", help="run the load test")
+p_run.add_argument(
+    "-r",
+    "--rate",
+    action="append",
+    default=[],
+    metavar="PROC=RATE",
+    help="start PROC (call, sms, lu) RATE times per second",
+)
+p_run.add_argument("-d", "--duration", type=float, default=60, help="seconds (default: %(default)s)")
+p_run.add_argument("--call-hold", type=float, default=5, help="seconds a call lasts (default: %(default)s)")
+p_run.add_argument("--timeout", type=float, default=10, help="seconds per step (default: %(default)s)")
+p_run.add_argument("--attach-rate", type=float, default=5, help="MS switched on per second (default: %(default)s)")
+p_run.add_argument("--attach-timeout", type=float, default=30, help="default: %(default)s")
+p_run.add_argument("-o", "--output", help="write the results as JSON")
+p_run.add_argument("--mobile", default="mobile", help="default: %(default)s")
+p_run.add_argument("--virtphy", default="virtphy", help="default: %(default)s")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.action == "setup":
+        setup(args)
+    else:
+        run(args)
@@ -8,10 +8,20 @@ SIPCON_SERVER="kamailio"
 logdir="current_log"
 mkdir -p "$logdir"
 
+# With TERMINAL=supervisor, start all programs headless with
+# ../net/supervisor.py instead of one terminal window each
+supervisor_list="run/supervisor.list"
+
 find_term() {
   # Find a terminal program and write to the global "terminal" variable
   local programs="urxvt xterm"
   local program
+  if [ "x$TERMINAL" = "xsupervisor" ]; then
+    terminal="supervisor"
+    mkdir -p run
+    rm -f "$supervisor_list"
+    return
+  fi
   for program in $programs; do
     terminal="$(which $program)"
     [ -n "$terminal" ] && return
@@ -27,6 +37,10 @@ term() {
   if [ -z "$title" ]; then
     title="$(basename $@)"
   fi
+  if [ "$terminal" = "supervisor" ]; then
+    printf '%s\t%s\n' "$title" "$1" >> "$supervisor_list"
+    return
+  fi
   exec $terminal -title "CN:$title" -e sh -c "$1; echo; while sleep 1; do echo 'q Enter to close'; read q_to_close; if [ \"x\$q_to_close\" = xq ]; then break; fi; done"
 }
 
@@ -119,6 +133,15 @@ if [ "x$SIPCON_SERVER" != "xinternal" ]; then
   esac
 fi
 
+if [ "$terminal" = "supervisor" ]; then
+  # all term calls above are done writing the list
+  wait
+  echo "Starting all programs headless, see $logdir/supervisor.log and $logdir/<program>.log"
+  ../net/supervisor.py run "$supervisor_list" --log-dir "$logdir" > "$logdir/supervisor.log" 2>&1 &
+  supervisor_pid="$!"
+  echo "Show the state of all programs with: ../net/supervisor.py status"
+fi
+
 case "x_$arg" in
   "x_call")
     set -x
@@ -148,26 +171,32 @@ read enter_to_close
 echo Closing...
 #set -x
 
-killall -2 mobile
-sleep 3
+if [ "$terminal" = "supervisor" ]; then
+  # stops all programs before the logs get moved below
+  kill "$supervisor_pid"
+  wait "$supervisor_pid"
+else
+  killall -2 mobile
+  sleep 3
+
+  if [ "x$SIPCON_SERVER" != "xinternal" ]; then
+    kill %11 %12
+    # 'killall' seems to work only with the shortened name
+    killall osmo-sip-connector
+    killall "$SIPCON_SERVER"
+  fi
 
-if [ "x$SIPCON_SERVER" != "xinternal" ]; then
-  kill %11 %12
-  # 'killall' seems to work only with the shortened name
-  killall osmo-sip-connector
-  killall "$SIPCON_SERVER"
+  kill %1 %2 %3 %4 %5 %6 %7 %8 %9 %10
+  killall osmo-msc
+  killall osmo-bsc
+  killall osmo-mgw
+  killall osmo-hlr
+  killall -9 osmo-stp
+  killall virtphy
+  killall osmo-bts-virtual
+  killall mobile
 fi
 
-kill %1 %2 %3 %4 %5 %6 %7 %8 %9 %10
-killall osmo-msc
-killall osmo-bsc
-killall osmo-mgw
-killall osmo-hlr
-killall -9 osmo-stp
-killall virtphy
-killall osmo-bts-virtual
-killall mobile
-
 set +e
 cp *.cfg "$logdir"/
 